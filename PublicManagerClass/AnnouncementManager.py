@@ -3,6 +3,8 @@ from datetime import datetime , timedelta
 import threading
 import time
 
+from PublicManagerClass.TableExporter import TableExporter
+
 
 class AnnouncementManager:
     def __init__(self, db_path='announcements.db'):
@@ -142,6 +144,33 @@ class AnnouncementManager:
         finally:
             conn.close()
 
+    def export_announcements(self, target, fmt="csv", include_deleted=True, batch_size=TableExporter.BATCH_SIZE):
+        """
+        把公告流式导出为文件，按批读取，内存占用与公告数量无关。
+
+        Args:
+            target: 文件路径，或 io.BytesIO 等二进制文件对象
+            fmt (str): 导出格式，csv / parquet / xlsx
+            include_deleted (bool): 是否包含已软删除的公告
+            batch_size (int): 每批读取的行数
+
+        Returns:
+            int: 导出的公告数量
+        """
+        exporter = TableExporter(fmt, batch_size)
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            if include_deleted:
+                cursor.execute("SELECT * FROM announcements ORDER BY created_at DESC")
+            else:
+                cursor.execute(
+                    "SELECT * FROM announcements WHERE deleted_at IS NULL ORDER BY created_at DESC"
+                )
+            return exporter.export(cursor, target, exporter.column_types(conn, "announcements"))
+        finally:
+            conn.close()
+
     def get_announcement_by_id(self, announcement_id):
         """
         根据ID获取公告[2](@ref)。
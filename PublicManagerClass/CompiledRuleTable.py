@@ -0,0 +1,337 @@
+import array
+import bisect
+import mmap
+import os
+import struct
+import sys
+
+from PublicManagerClass.WarehouseRuleManager import (LocationRule, RuleRecord, WarehouseRuleManager,
+                                                     compile_time_rule, compile_weekly_schedule, minute_of_week)
+
+# 文件格式：固定头部之后按固定顺序排列各个数组，每个数组按 8 字节对齐。
+# 数组的位置只由头部中的计数决定，读取时直接在缓冲区上建立 memoryview，不做任何解析。
+MAGIC = b"SFRULES\0"
+FORMAT_VERSION = 1
+# 魔数、格式版本、数据键（5 个 int64）、规则版本、代码数、字符串数、字符串字节数、位置规则数、时段表数、时段数
+HEADER = struct.Struct("<8sI5qQIIQIII")
+NONE_ID = 0xFFFFFFFF  # 字符串或代码序号为空
+
+# (数组名, 元素格式, 元素个数对应的计数名, 额外元素个数)
+_SECTIONS = (
+    ("string_offsets", "Q", "strings", 1),
+    ("code_str", "I", "codes", 0),
+    ("mapping_str", "I", "codes", 0),
+    ("name_str", "I", "codes", 0),
+    ("attached_str", "I", "codes", 0),
+    ("final_code", "I", "codes", 0),
+    ("schedule_id", "i", "codes", 0),
+    ("sorted_codes", "I", "codes", 0),
+    ("location_start", "I", "codes", 1),
+    ("location_str", "I", "locations", 0),
+    ("rule_str", "I", "locations", 0),
+    ("schedule_start", "I", "schedules", 1),
+    ("segment_minute", "H", "segments", 0),
+    ("segment_active", "B", "segments", 0),
+    ("string_blob", "B", "string_bytes", 0),
+)
+
+
+def _layout(counts):
+    """
+    计算各数组在缓冲区中的位置
+    :param counts: 计数名 -> 个数
+    :return: (数组名 -> (起始偏移, 字节数, 元素格式), 总字节数)
+    """
+    sections = {}
+    offset = HEADER.size
+    for name, item_format, count_name, extra in _SECTIONS:
+        offset = (offset + 7) & ~7
+        size = (counts[count_name] + extra) * struct.calcsize(item_format)
+        sections[name] = (offset, size, item_format)
+        offset += size
+    return sections, offset
+
+
+def database_fingerprint(db_path):
+    """
+    读取数据库的持久数据键：文件头中的修改计数器、文件大小和修改时间，以及 WAL 文件的大小和修改时间。
+    与 PRAGMA data_version 不同，该键在不同进程、不同连接之间可以比较。
+    :param db_path: SQLite数据库文件路径
+    :return: 5 个整数组成的元组，文件不存在时返回None
+    """
+    try:
+        stat = os.stat(db_path)
+        with open(db_path, "rb") as db_file:
+            db_file.seek(24)
+            change_counter = int.from_bytes(db_file.read(4), "big")
+    except OSError:
+        return None
+    try:
+        wal_stat = os.stat(db_path + "-wal")
+        wal_size, wal_mtime = wal_stat.st_size, wal_stat.st_mtime_ns
+    except OSError:
+        wal_size = wal_mtime = 0
+    return change_counter, stat.st_size, stat.st_mtime_ns, wal_size, wal_mtime
+
+
+def compile_rule_table(snapshot, data_key):
+    """
+    将规则快照编译为紧凑的二进制规则表
+    :param snapshot: RuleSnapshot
+    :param data_key: 5 个整数组成的数据键
+    :return: bytearray
+    """
+    strings = {}  # 字符串 -> 序号
+    string_list = []
+
+    def string_id(text):
+        if text is None:
+            return NONE_ID
+        if text not in strings:
+            strings[text] = len(string_list)
+            string_list.append(text)
+        return strings[text]
+
+    warehouse_rules = snapshot.warehouse_rules
+    codes = list(warehouse_rules)
+    code_ids = {code: index for index, code in enumerate(codes)}
+
+    arrays = {name: array.array(item_format) for name, item_format, _, _ in _SECTIONS}
+    schedule_ids = {}  # 时段表 -> 序号
+    arrays["location_start"].append(0)
+    arrays["schedule_start"].append(0)
+
+    for code, rule_info in warehouse_rules.items():
+        arrays["code_str"].append(string_id(code))
+        arrays["mapping_str"].append(string_id(rule_info.mapping))
+        arrays["name_str"].append(string_id(rule_info.name))
+        arrays["attached_str"].append(string_id(rule_info.挂靠流向))
+        arrays["final_code"].append(code_ids[snapshot.attachment_closure.get(code, code)])
+
+        location_rules = rule_info.location_rules
+        for loc_rule in location_rules:
+            arrays["location_str"].append(string_id(loc_rule.location))
+            arrays["rule_str"].append(string_id(loc_rule.rule))
+        arrays["location_start"].append(len(arrays["location_str"]))
+
+        # 周时段表：时段起始分钟加生效位置规则的位集合；含无法编译规则的代码查询时回退到字符串解析
+        masks = tuple(loc_rule.mask for loc_rule in location_rules)
+        if None in masks or len(masks) > 8:
+            arrays["schedule_id"].append(-1)
+            continue
+        schedule = compile_weekly_schedule(masks)
+        if schedule not in schedule_ids:
+            schedule_ids[schedule] = len(schedule_ids)
+            boundaries, active = schedule
+            arrays["segment_minute"].extend(boundaries)
+            arrays["segment_active"].extend(sum(1 << index for index in indexes) for indexes in active)
+            arrays["schedule_start"].append(len(arrays["segment_minute"]))
+        arrays["schedule_id"].append(schedule_ids[schedule])
+
+    # 按代码的 UTF-8 字节序排序，查询时二分查找
+    encoded = [string.encode("utf-8") for string in string_list]
+    arrays["sorted_codes"].extend(sorted(
+        (index for index, code in enumerate(codes) if code is not None),
+        key=lambda index: encoded[arrays["code_str"][index]]))
+
+    offset = 0
+    arrays["string_offsets"].append(0)
+    for data in encoded:
+        offset += len(data)
+        arrays["string_offsets"].append(offset)
+    arrays["string_blob"] = array.array("B", b"".join(encoded))
+
+    counts = {
+        "codes": len(codes),
+        "strings": len(string_list),
+        "string_bytes": offset,
+        "locations": len(arrays["location_str"]),
+        "schedules": len(schedule_ids),
+        "segments": len(arrays["segment_minute"])
+    }
+    sections, total_size = _layout(counts)
+    buffer = bytearray(total_size)
+    HEADER.pack_into(buffer, 0, MAGIC, FORMAT_VERSION, *data_key, snapshot.version, counts["codes"],
+                     counts["strings"], counts["string_bytes"], counts["locations"], counts["schedules"],
+                     counts["segments"])
+    for name, (start, size, _) in sections.items():
+        buffer[start:start + size] = arrays[name].tobytes()
+    return buffer
+
+
+class CompiledRuleTable:
+    """
+    只读的二进制规则表：直接在 mmap 或共享内存缓冲区上建立 memoryview，打开时不解析、不复制。
+    查询时按需解码用到的字符串，结果与 WarehouseRuleManager.find_current_locations 相同。
+    """
+
+    def __init__(self, buffer):
+        """
+        :param buffer: 支持缓冲区协议的对象（bytes、mmap、SharedMemory.buf 等）
+        :raises ValueError: 缓冲区不是有效的规则表时
+        """
+        if sys.byteorder != "little":
+            raise ValueError("规则表使用小端字节序，当前平台不支持")
+        self._view = memoryview(buffer)
+        if len(self._view) < HEADER.size:
+            raise ValueError("规则表文件不完整")
+        (magic, format_version, *header) = HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError("不是受支持的规则表格式")
+        self.data_key = tuple(header[:5])
+        self.rule_version = header[5]
+        counts = dict(zip(("codes", "strings", "string_bytes", "locations", "schedules", "segments"), header[6:]))
+        sections, total_size = _layout(counts)
+        if len(self._view) < total_size:
+            raise ValueError("规则表文件不完整")
+
+        self._arrays = {name: self._view[start:start + size].cast(item_format)
+                        for name, (start, size, item_format) in sections.items()}
+        for name, values in self._arrays.items():
+            setattr(self, f"_{name}", values)
+        self._owner = None  # 随规则表一起关闭的缓冲区来源（mmap 或共享内存）
+
+    @classmethod
+    def open_file(cls, path, expected_key=None):
+        """
+        以只读方式内存映射规则表文件
+        :param path: 文件路径
+        :param expected_key: 期望的数据键，不一致（文件已过期）时返回None
+        :return: CompiledRuleTable，文件不存在、已过期或格式无效时返回None
+        """
+        try:
+            with open(path, "rb") as table_file:
+                mapped = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            table = cls(mapped)
+        except ValueError:
+            mapped.close()
+            return None
+        table._owner = mapped
+        if expected_key is not None and table.data_key != tuple(expected_key):
+            table.close()
+            return None
+        return table
+
+    @staticmethod
+    def write_file(path, snapshot, data_key):
+        """
+        编译规则快照并原子地写入文件（先写临时文件再替换，正在映射旧文件的进程不受影响）
+        :param path: 文件路径
+        :param snapshot: RuleSnapshot
+        :param data_key: 数据键
+        :return: 写入的字节数
+        """
+        buffer = compile_rule_table(snapshot, data_key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as table_file:
+            table_file.write(buffer)
+        os.replace(temp_path, path)
+        return len(buffer)
+
+    def close(self):
+        """释放缓冲区上的视图，并关闭规则表持有的缓冲区来源"""
+        for values in self._arrays.values():
+            values.release()
+        self._arrays = {}
+        self._view.release()
+        if self._owner is not None:
+            self._owner.close()
+            self._owner = None
+
+    def __len__(self):
+        return len(self._code_str)
+
+    def string(self, string_id):
+        """
+        按序号解码字符串
+        :param string_id: 字符串序号
+        :return: 字符串，序号为空时返回None
+        """
+        if string_id == NONE_ID:
+            return None
+        return str(self._string_blob[self._string_offsets[string_id]:self._string_offsets[string_id + 1]],
+                   "utf-8")
+
+    def _string_bytes(self, string_id):
+        return self._string_blob[self._string_offsets[string_id]:self._string_offsets[string_id + 1]]
+
+    def find(self, code):
+        """
+        二分查找代码
+        :param code: 流向代码
+        :return: 代码序号，未找到时返回 -1
+        """
+        if not isinstance(code, str):
+            return -1
+        target = code.encode("utf-8")
+        sorted_codes = self._sorted_codes
+        low, high = 0, len(sorted_codes)
+        while low < high:
+            middle = (low + high) // 2
+            if self._string_bytes(self._code_str[sorted_codes[middle]]).tobytes() < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(sorted_codes) and self._string_bytes(self._code_str[sorted_codes[low]]) == target:
+            return sorted_codes[low]
+        return -1
+
+    def code(self, index):
+        """按序号取代码"""
+        return self.string(self._code_str[index])
+
+    def rule(self, index):
+        """
+        按序号还原规则记录
+        :param index: 代码序号
+        :return: RuleRecord
+        """
+        location_rules = []
+        for location_index in range(self._location_start[index], self._location_start[index + 1]):
+            rule_str = self.string(self._rule_str[location_index])
+            try:
+                mask = compile_time_rule(rule_str)
+            except ValueError:
+                mask = None
+            location_rules.append(LocationRule(self.string(self._location_str[location_index]), rule_str, mask))
+        return RuleRecord(self.string(self._mapping_str[index]), self.string(self._name_str[index]),
+                          tuple(location_rules), self.string(self._attached_str[index]))
+
+    def _active_location_rules(self, index, rule_info, current_time):
+        """
+        找出当前时间生效的位置规则：有时段表时二分查找，否则逐条解析规则文本
+        :param index: 最终代码序号
+        :param rule_info: 最终代码的规则记录
+        :param current_time: 当前时间
+        :return: 生效的位置规则列表
+        """
+        schedule_id = self._schedule_id[index]
+        if schedule_id < 0:
+            return [loc_rule for loc_rule in rule_info.location_rules
+                    if WarehouseRuleManager.parse_time_rule(loc_rule.rule, current_time)]
+
+        start, end = self._schedule_start[schedule_id], self._schedule_start[schedule_id + 1]
+        segment = bisect.bisect_right(self._segment_minute, minute_of_week(current_time), start, end) - 1
+        active = self._segment_active[segment]
+        return [loc_rule for slot, loc_rule in enumerate(rule_info.location_rules) if (active >> slot) & 1]
+
+    def find_current_locations(self, code, current_time):
+        """
+        根据流向代码和当前时间查找当前应使用的物理位置（结果与 WarehouseRuleManager.find_current_locations 相同）
+        :param code: 流向代码
+        :param current_time: 当前时间
+        :return: 结果字典列表，未找到代码时返回None
+        """
+        index = self.find(code)
+        if index < 0:
+            return None
+
+        rule_info = self.rule(index)
+        final_index = self._final_code[index]
+        final_rule = rule_info if final_index == index else self.rule(final_index)
+        active_rules = self._active_location_rules(final_index, final_rule, current_time)
+        return WarehouseRuleManager._build_location_results(code, self.code(final_index), final_rule,
+                                                            rule_info.name, active_rules)
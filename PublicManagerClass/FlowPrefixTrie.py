@@ -0,0 +1,127 @@
+import bisect
+import heapq
+
+
+class FlowPrefixTrie:
+    """
+    流向前缀补全索引：把 代码、流向、映射 以及流向名称的全拼和首字母作为补全键，
+    按字典序排成一个扁平的前缀树（有序数组中每个前缀对应一段连续区间）。
+    命中条目较多的前缀节点预先保存排名最高的若干条，其余前缀的区间很短，查询时直接在区间内排序，
+    因此任意前缀的补全只需一次二分查找。
+    """
+
+    # 补全类型按优先级排列，与 FlowSearchIndex 的匹配类型一致
+    FIELDS = ("代码", "流向", "映射")
+    PINYIN_TYPE = "拼音"
+
+    # 每个前缀预先保存的补全条数
+    TOP_K = 10
+    # 区间超过该长度的前缀预先计算补全结果
+    SCAN_LIMIT = 64
+
+    def __init__(self, search_index, top_k=TOP_K):
+        """
+        根据搜索索引中的条目构建补全索引（复用其中已经计算好的拼音）
+        :param search_index: FlowSearchIndex 实例
+        :param top_k: 每个前缀预先保存的补全条数，也是单次补全的最大条数
+        """
+        self.version = search_index.version
+        self.top_k = top_k
+        self.entries = []  # (代码, 流向, 映射)
+
+        keys = []
+        for order, entry in enumerate(search_index.entries):
+            if entry is None:
+                continue
+            code, name, mapping, lowered = entry
+            entry_id = len(self.entries)
+            self.entries.append((code, name, mapping))
+            texts = [(priority, text) for priority, text in enumerate(lowered)]
+            if search_index.pinyin_enabled:
+                full, initials, _ = search_index.pinyin_entries[order]
+                texts += [(len(self.FIELDS), full), (len(self.FIELDS), initials)]
+            for priority, text in texts:
+                if text:
+                    # 排名：先按字段优先级，再按补全键长度（越接近输入越靠前），最后按表中顺序
+                    keys.append((text, (priority, len(text), entry_id)))
+        keys.sort()
+
+        self._keys = [text for text, _ in keys]
+        self._ranks = [rank for _, rank in keys]
+        self._top = {}  # 前缀 -> 预先计算的排名元组
+        self._build(0, len(keys), 0)
+
+    def _build(self, lo, hi, depth):
+        """
+        递归遍历前缀树：区间 [lo, hi) 内的键共用长度为 depth 的前缀，区间较长时预先计算补全结果
+        :param lo: 区间起点
+        :param hi: 区间终点
+        :param depth: 当前前缀长度
+        """
+        if hi - lo <= self.SCAN_LIMIT:
+            return
+        if depth:
+            self._top[self._keys[lo][:depth]] = self._best(lo, hi)
+
+        # 长度等于 depth 的键排在区间最前面，其余按第 depth 个字符分组
+        start = lo
+        while start < hi and len(self._keys[start]) == depth:
+            start += 1
+        while start < hi:
+            char = self._keys[start][depth]
+            end = start
+            while end < hi and self._keys[end][depth] == char:
+                end += 1
+            self._build(start, end, depth + 1)
+            start = end
+
+    def _best(self, lo, hi):
+        """
+        求区间内排名最高的 top_k 个不同条目
+        :param lo: 区间起点
+        :param hi: 区间终点
+        :return: 排名元组 (字段优先级, 键长度, 条目序号) 组成的元组
+        """
+        # 同一条目可能有多个键落在区间内（如全拼和首字母），取足不同条目为止
+        count = self.top_k * 2
+        while True:
+            best = []
+            seen = set()
+            for rank in heapq.nsmallest(count, self._ranks[lo:hi]):
+                if rank[2] not in seen:
+                    seen.add(rank[2])
+                    best.append(rank)
+                    if len(best) == self.top_k:
+                        return tuple(best)
+            if count >= hi - lo:
+                return tuple(best)
+            count *= 2
+
+    def complete(self, prefix, limit=None):
+        """
+        前缀补全
+        :param prefix: 输入的前缀（不区分大小写，忽略首尾空格）
+        :param limit: 返回的最大条数，默认且最多为 top_k
+        :return: 补全列表（按排名），每项包含补全类型 type 以及 code、name、mapping
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        limit = self.top_k if limit is None else min(limit, self.top_k)
+
+        best = self._top.get(prefix)
+        if best is None:
+            lo = bisect.bisect_left(self._keys, prefix)
+            hi = bisect.bisect_right(self._keys, prefix + "\U0010ffff", lo)
+            best = self._best(lo, hi) if hi > lo else ()
+
+        completions = []
+        for priority, _, entry_id in best[:limit]:
+            code, name, mapping = self.entries[entry_id]
+            completions.append({
+                "type": self.FIELDS[priority] if priority < len(self.FIELDS) else self.PINYIN_TYPE,
+                "code": code,
+                "name": name,
+                "mapping": mapping,
+            })
+        return completions
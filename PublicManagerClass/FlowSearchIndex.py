@@ -0,0 +1,442 @@
+import bisect
+import copy
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时不提供拼音搜索
+    lazy_pinyin = None
+
+
+class FlowSearchIndex:
+    """
+    流向搜索索引：在 代码、流向、映射 三个字段上建立 n-gram 倒排索引，
+    支持与逐条扫描相同的不区分大小写子串搜索；
+    开启拼音搜索且安装了 pypinyin 时，另外为流向名称建立全拼与首字母索引（匹配类型为"拼音"）。
+    """
+
+    # 匹配类型按优先级排列：同一流向只按第一个命中的字段归类
+    FIELDS = (("代码", "code"), ("流向", "name"), ("映射", "mapping"))
+
+    # 单次搜索默认最多返回的条数，宽泛的查询（如单个数字）不为成千上万条结果计算高亮区间
+    SEARCH_LIMIT = 200
+
+    PINYIN_TYPE = "拼音"
+    PINYIN_AVAILABLE = lazy_pinyin is not None
+    # 单个字母命中的拼音过多，至少两个字母才按拼音匹配
+    PINYIN_MIN_QUERY_LENGTH = 2
+
+    # 近似匹配（"您是不是要找"）：对代码和映射建立对称删除索引，
+    # 每个键及其删去任意一个字符后的形式都指向该条目，查询串同样删去一个字符后查表，
+    # 能找到一次替换、插入、删除或相邻交换以内的键，再按编辑距离核对
+    SIMILAR_TYPE = "近似"
+    SIMILAR_MIN_LENGTH = 3  # 短于该长度的键和查询不做近似匹配
+    SIMILAR_MAX_DISTANCE = 1  # 与对称删除索引只删一个字符对应
+    SIMILAR_MAX_CANDIDATES = 64  # 单次查询最多核对的候选条目数，保证查询耗时有上限
+
+    def __init__(self, warehouse_rules, gram_size=2, version=None, pinyin=False):
+        """
+        根据规则字典构建索引
+        :param warehouse_rules: 代码 -> 规则 的字典
+        :param gram_size: n-gram 长度，短于该长度的查询使用单字符索引
+        :param version: 构建索引时的规则版本号
+        :param pinyin: 是否建立拼音索引（计算拼音约占构建时间的一半以上，需要时才开启；未安装 pypinyin 时忽略）
+        """
+        self.gram_size = gram_size
+        self.version = version
+        self.entries = []  # 按表中顺序保存 (代码, 流向, 映射, 三个字段的小写形式)
+        self.postings = {}  # gram -> 包含该 gram 的条目序号集合
+        self.pinyin_enabled = pinyin and self.PINYIN_AVAILABLE
+        self.pinyin_entries = []  # 与 entries 对齐的 (全拼, 首字母, 每个字的全拼起始位置)
+        self.pinyin_postings = {}  # 拼音 gram -> 条目序号集合
+        self.entry_ids = {}  # 代码 -> 条目序号
+        self.delete_postings = {}  # 删除变体 -> 条目序号（多个条目时为元组），值不可变，复制索引时无需复制
+        self._owned_postings = None  # 写时复制：副本已复制过的倒排集合 id，为None时全部可以直接修改
+
+        # 构建时先把删除变体的条目收集到列表中，最后一次性转为元组，避免逐个拼接元组
+        delete_lists = {}
+        for code, rule_info in warehouse_rules.items():
+            entry_id = self._index_entry(code, rule_info)
+            for key in self._delete_keys(entry_id):
+                delete_lists.setdefault(key, []).append(entry_id)
+        self.delete_postings = {key: ids[0] if len(ids) == 1 else tuple(ids) for key, ids in delete_lists.items()}
+
+    def _entry_grams(self, entry_id):
+        """
+        计算条目在字段倒排表和拼音倒排表中的全部 gram
+        :param entry_id: 条目序号
+        :return: (字段 gram 集合, 拼音 gram 集合)
+        """
+        _, _, _, lowered = self.entries[entry_id]
+        grams = set()
+        for text in lowered:
+            grams.update(text)
+            grams.update(self._grams(text, self.gram_size))
+
+        pinyin_grams = set()
+        if self.pinyin_enabled:
+            full, initials, _ = self.pinyin_entries[entry_id]
+            pinyin_grams.update(full, initials, self._grams(full, self.gram_size),
+                                self._grams(initials, self.gram_size))
+        return grams, pinyin_grams
+
+    def upsert(self, code, rule_info):
+        """
+        新增或更新一个流向的索引条目（已存在的流向保持原有顺序，新流向排在最后）
+        :param code: 流向代码
+        :param rule_info: 规则字典
+        """
+        entry_id = self._index_entry(code, rule_info)
+        for key in self._delete_keys(entry_id):
+            existing = self.delete_postings.get(key)
+            if existing is None:
+                self.delete_postings[key] = entry_id
+            elif isinstance(existing, int):
+                self.delete_postings[key] = (existing, entry_id)
+            else:
+                self.delete_postings[key] = existing + (entry_id,)
+
+    def _index_entry(self, code, rule_info):
+        """
+        写入条目并更新字段和拼音倒排表（对称删除索引由调用方维护）
+        :param code: 流向代码
+        :param rule_info: 规则字典
+        :return: 条目序号
+        """
+        entry_id = self.entry_ids.get(code)
+        if entry_id is None:
+            entry_id = len(self.entries)
+            self.entries.append(None)
+            self.pinyin_entries.append(None)
+            self.entry_ids[code] = entry_id
+        else:
+            self._discard_postings(entry_id)
+
+        name = rule_info['name'] or ""
+        mapping = rule_info['mapping'] or ""
+        self.entries[entry_id] = (code, name, mapping, (code.lower(), name.lower(), mapping.lower()))
+        if self.pinyin_enabled:
+            self.pinyin_entries[entry_id] = self._pinyin_forms(name)
+
+        grams, pinyin_grams = self._entry_grams(entry_id)
+        for gram in grams:
+            self._writable_posting(self.postings, gram).add(entry_id)
+        for gram in pinyin_grams:
+            self._writable_posting(self.pinyin_postings, gram).add(entry_id)
+        return entry_id
+
+    def remove(self, code):
+        """
+        删除一个流向的索引条目
+        :param code: 流向代码
+        """
+        entry_id = self.entry_ids.pop(code, None)
+        if entry_id is None:
+            return
+        self._discard_postings(entry_id)
+        self.entries[entry_id] = None
+        self.pinyin_entries[entry_id] = None
+
+    def _discard_postings(self, entry_id):
+        """
+        从倒排表中移除条目
+        :param entry_id: 条目序号
+        """
+        grams, pinyin_grams = self._entry_grams(entry_id)
+        for postings, entry_grams in ((self.postings, grams), (self.pinyin_postings, pinyin_grams)):
+            for gram in entry_grams:
+                if gram in postings:
+                    posting = self._writable_posting(postings, gram)
+                    posting.discard(entry_id)
+                    if not posting:
+                        del postings[gram]
+        for key in self._delete_keys(entry_id):
+            existing = self.delete_postings.get(key)
+            if existing == entry_id:
+                del self.delete_postings[key]
+            elif isinstance(existing, tuple):
+                remaining = tuple(other for other in existing if other != entry_id)
+                self.delete_postings[key] = remaining[0] if len(remaining) == 1 else remaining
+
+    def _writable_posting(self, postings, gram):
+        """
+        取出可以修改的倒排集合（不存在时新建）；副本首次修改某个集合时先复制，避免影响原索引
+        :param postings: 倒排表
+        :param gram: gram
+        :return: 倒排集合
+        """
+        posting = postings.get(gram)
+        if posting is None:
+            posting = postings[gram] = set()
+        elif self._owned_postings is not None and id(posting) not in self._owned_postings:
+            posting = postings[gram] = set(posting)
+        else:
+            return posting
+        if self._owned_postings is not None:
+            self._owned_postings.add(id(posting))
+        return posting
+
+    def copy(self):
+        """
+        复制索引用于增量修改：只复制条目列表和倒排表的字典，倒排集合在首次修改时才复制，原索引保持不变
+        :return: 新的 FlowSearchIndex
+        """
+        clone = copy.copy(self)
+        clone.entries = list(self.entries)
+        clone.pinyin_entries = list(self.pinyin_entries)
+        clone.entry_ids = dict(self.entry_ids)
+        clone.postings = dict(self.postings)
+        clone.pinyin_postings = dict(self.pinyin_postings)
+        clone.delete_postings = dict(self.delete_postings)
+        clone._owned_postings = set()
+        return clone
+
+    def _delete_keys(self, entry_id):
+        """
+        计算条目的代码和映射在对称删除索引中的键：原文以及删去任意一个字符后的形式
+        :param entry_id: 条目序号
+        :return: 键集合
+        """
+        _, _, _, (code_lower, _, mapping_lower) = self.entries[entry_id]
+        keys = set()
+        for text in (code_lower, mapping_lower):
+            if len(text) >= self.SIMILAR_MIN_LENGTH:
+                keys.add(text)
+                keys.update(self._deletes(text))
+        return keys
+
+    @staticmethod
+    def _deletes(text):
+        """
+        删去任意一个字符后的全部形式
+        :param text: 文本
+        :return: 字符串生成器
+        """
+        return (text[:i] + text[i + 1:] for i in range(len(text)))
+
+    @staticmethod
+    def edit_distance(a, b, max_distance):
+        """
+        计算两个字符串的编辑距离（替换、插入、删除和相邻交换各算一次），超过上限时提前结束
+        :param a: 字符串
+        :param b: 字符串
+        :param max_distance: 距离上限
+        :return: 编辑距离，超过上限时返回 max_distance + 1
+        """
+        if abs(len(a) - len(b)) > max_distance:
+            return max_distance + 1
+        previous2 = None
+        previous = list(range(len(b) + 1))
+        for i in range(1, len(a) + 1):
+            current = [i] + [0] * len(b)
+            for j in range(1, len(b) + 1):
+                cost = a[i - 1] != b[j - 1]
+                current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+                if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                    current[j] = min(current[j], previous2[j - 2] + 1)
+            if min(current) > max_distance:
+                return max_distance + 1
+            previous2, previous = previous, current
+        return min(previous[-1], max_distance + 1)
+
+    @staticmethod
+    def _pinyin_forms(name):
+        """
+        计算流向名称的无声调全拼与首字母（均为紧凑小写形式）
+        :param name: 流向名称，如 "余姚"
+        :return: (全拼, 首字母, 每个字在全拼中的起始位置)，如 ("yuyao", "yy", [0, 2])
+        """
+        # 非汉字逐字保留，保证每个字对应一个音节
+        syllables = [syllable.lower() for syllable in lazy_pinyin(name, errors=lambda chars: list(chars))]
+        offsets = []
+        position = 0
+        for syllable in syllables:
+            offsets.append(position)
+            position += len(syllable)
+        return "".join(syllables), "".join(syllable[:1] for syllable in syllables), offsets
+
+    @staticmethod
+    def _grams(text, size):
+        """
+        切分出文本中所有长度为 size 的子串
+        :param text: 文本
+        :param size: 子串长度
+        :return: 子串生成器
+        """
+        return (text[i:i + size] for i in range(len(text) - size + 1))
+
+    def _candidates(self, query_lower, postings=None):
+        """
+        通过倒排索引求出可能包含查询串的条目
+        :param query_lower: 小写查询串
+        :param postings: 使用的倒排表，默认为字段倒排表
+        :return: 条目序号集合
+        """
+        if postings is None:
+            postings = self.postings
+
+        if len(query_lower) < self.gram_size:
+            grams = set(query_lower)
+        else:
+            grams = set(self._grams(query_lower, self.gram_size))
+
+        # 从最短的倒排表开始求交集
+        posting_lists = sorted((postings.get(gram, ()) for gram in grams), key=len)
+        if not posting_lists or not posting_lists[0]:
+            return set()
+
+        candidates = set(posting_lists[0])
+        for posting in posting_lists[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return candidates
+
+    @staticmethod
+    def match_spans(text_lower, query_lower):
+        """
+        计算查询串在文本中所有不重叠出现位置
+        :param text_lower: 小写文本
+        :param query_lower: 小写查询串
+        :return: [(起始, 结束), ...]
+        """
+        spans = []
+        start = text_lower.find(query_lower)
+        while start != -1:
+            end = start + len(query_lower)
+            spans.append((start, end))
+            start = text_lower.find(query_lower, end)
+        return spans
+
+    def search(self, query, limit=None):
+        """
+        搜索流向
+        :param query: 查询字符串
+        :param limit: 最多返回的条数，None 表示不限；达到上限后不再核对其余候选
+        :return: 匹配的流向列表（按表中顺序），每项附带三个字段的高亮区间
+        """
+        results = []
+
+        # 如果查询为空，返回空结果
+        if not query:
+            return results
+
+        query_lower = query.lower()
+        candidates = self._candidates(query_lower)
+
+        # 纯字母查询（可含空格）同时按拼音匹配流向名称
+        pinyin_query = "".join(query_lower.split())
+        if not (self.pinyin_enabled and len(pinyin_query) >= self.PINYIN_MIN_QUERY_LENGTH
+                and pinyin_query.isascii() and pinyin_query.isalpha()):
+            pinyin_query = None
+        if pinyin_query:
+            candidates |= self._candidates(pinyin_query, self.pinyin_postings)
+
+        for entry_id in sorted(candidates):
+            if limit is not None and len(results) >= limit:
+                break
+            code, name, mapping, lowered = self.entries[entry_id]
+
+            match_type = None
+            for (field_type, _), text_lower in zip(self.FIELDS, lowered):
+                if query_lower in text_lower:
+                    match_type = field_type
+                    break
+
+            name_spans = None
+            if match_type is None and pinyin_query:
+                name_spans = self._pinyin_name_spans(entry_id, pinyin_query)
+                if name_spans:
+                    match_type = self.PINYIN_TYPE
+
+            if match_type is None:
+                continue
+
+            # 只为返回的结果计算高亮区间
+            highlights = {
+                key: self.match_spans(text_lower, query_lower)
+                for (_, key), text_lower in zip(self.FIELDS, lowered)
+            }
+            if name_spans:
+                highlights["name"] = name_spans
+            results.append({
+                "type": match_type,
+                "code": code,
+                "name": name,
+                "mapping": mapping,
+                "highlights": highlights
+            })
+
+        return results
+
+    def _pinyin_name_spans(self, entry_id, pinyin_query):
+        """
+        按首字母或全拼匹配流向名称，并换算为名称中的汉字区间
+        :param entry_id: 条目序号
+        :param pinyin_query: 去掉空格的小写字母查询串
+        :return: 名称中的高亮区间列表，未匹配时为空列表
+        """
+        full, initials, offsets = self.pinyin_entries[entry_id]
+
+        # 首字母与汉字一一对应
+        spans = self.match_spans(initials, pinyin_query)
+        if spans:
+            return spans
+
+        # 全拼区间覆盖到的所有汉字
+        spans = []
+        for start, end in self.match_spans(full, pinyin_query):
+            first_char = bisect.bisect_right(offsets, start) - 1
+            last_char = bisect.bisect_left(offsets, end)
+            spans.append((first_char, last_char))
+        return spans
+
+    def similar(self, query, limit=5):
+        """
+        近似匹配代码和映射，用于精确和子串搜索都没有结果时提示"您是不是要找"。
+        只查对称删除索引，不遍历条目，核对的候选数不超过 SIMILAR_MAX_CANDIDATES
+        :param query: 查询字符串
+        :param limit: 最多返回的条数
+        :return: 匹配列表（按编辑距离、代码优先于映射、表中顺序排列），每项的 distance 为编辑距离
+        """
+        query_lower = query.strip().lower()
+        if len(query_lower) < self.SIMILAR_MIN_LENGTH:
+            return []
+
+        candidates = []
+        seen = set()
+        for key in (query_lower, *self._deletes(query_lower)):
+            posting = self.delete_postings.get(key)
+            if posting is None:
+                continue
+            for entry_id in ((posting,) if isinstance(posting, int) else posting):
+                if entry_id not in seen:
+                    seen.add(entry_id)
+                    candidates.append(entry_id)
+            if len(candidates) >= self.SIMILAR_MAX_CANDIDATES:
+                candidates = candidates[:self.SIMILAR_MAX_CANDIDATES]
+                break
+
+        matches = []
+        for entry_id in candidates:
+            code, name, mapping, (code_lower, _, mapping_lower) = self.entries[entry_id]
+            for priority, (field_type, text_lower) in enumerate((("代码", code_lower), ("映射", mapping_lower))):
+                if len(text_lower) < self.SIMILAR_MIN_LENGTH:
+                    continue
+                distance = self.edit_distance(query_lower, text_lower, self.SIMILAR_MAX_DISTANCE)
+                if distance <= self.SIMILAR_MAX_DISTANCE:
+                    matches.append((distance, priority, entry_id, field_type))
+                    break
+
+        results = []
+        for distance, _, entry_id, field_type in sorted(matches)[:limit]:
+            code, name, mapping, _ = self.entries[entry_id]
+            results.append({
+                "type": self.SIMILAR_TYPE,
+                "field": field_type,
+                "code": code,
+                "name": name,
+                "mapping": mapping,
+                "distance": distance,
+                "highlights": {"code": [], "name": [], "mapping": []}
+            })
+        return results
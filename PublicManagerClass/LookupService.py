@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+from urllib.parse import parse_qs, urlsplit
+
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager, local_time
+
+
+class LookupService:
+    # 单个请求头部和请求体的大小上限
+    MAX_HEADER_BYTES = 16 * 1024
+    MAX_BODY_BYTES = 4 * 1024 * 1024
+
+    STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                   413: "Payload Too Large", 500: "Internal Server Error"}
+
+    def __init__(self, rule_manager, host="0.0.0.0", port=8600):
+        """
+        初始化流向查询服务：基于 asyncio 的轻量 HTTP/JSON 服务，供 PDA 等客户端查询。
+        所有请求共用同一个规则管理器的内存缓存，请求处理过程中不访问数据库。
+        :param rule_manager: WarehouseRuleManager 实例
+        :param host: 监听地址
+        :param port: 监听端口
+        """
+        self.rule_manager = rule_manager
+        self.host = host
+        self.port = port
+        self.server = None
+
+    # —————— 接口处理 ——————
+
+    @staticmethod
+    def _parse_time(value):
+        """
+        解析查询时间参数，缺省为当前系统时间
+        :param value: ISO 格式时间字符串或None
+        :return: datetime.datetime 对象（带时区的时间转换为本地时间）
+        """
+        if not value:
+            return datetime.datetime.now()
+        return local_time(datetime.datetime.fromisoformat(value))
+
+    def handle_lookup(self, params, body):
+        """
+        GET /lookup?code=574W[&time=2024-01-01T06:00] 查询单个流向代码的当前物理位置。
+        响应中的 valid_until 为结果下一次变化的时间；查询当前时间时同时返回 Cache-Control，
+        客户端可以缓存到该时间（规则被修改时以 rule_version 变化为准）
+        """
+        code = params.get("code")
+        if not code:
+            return 400, {"error": "缺少参数 code"}
+        current_time = self._parse_time(params.get("time"))
+        results = self.rule_manager.find_current_locations(code, current_time)
+        if not results:
+            return 404, {"error": f"未找到流向代码 '{code}' 的配置信息",
+                         "did_you_mean": [match["code"] for match in self.rule_manager.did_you_mean(code)]}
+        valid_until = self.rule_manager.next_location_change(code, current_time)
+        payload = {"code": code, "time": current_time.isoformat(timespec="seconds"), "results": [dict(result) for result in results],
+                   "rule_version": self.rule_manager.rule_version,
+                   "valid_until": valid_until.isoformat(timespec="seconds") if valid_until else None}
+        headers = {}
+        if valid_until is not None and not params.get("time"):
+            max_age = max(0, int((valid_until - current_time).total_seconds()))
+            headers["Cache-Control"] = f"max-age={max_age}"
+        return 200, payload, headers
+
+    def handle_search(self, params, body):
+        """GET /search?q=余姚 搜索流向代码、名称、映射码或拼音，没有结果时在 did_you_mean 中返回近似匹配"""
+        query = params.get("q", "")
+        results = self.rule_manager.search_flows(query)
+        payload = {"query": query, "results": results}
+        if not results:
+            payload["did_you_mean"] = self.rule_manager.did_you_mean(query)
+        return 200, payload
+
+    def handle_batch(self, params, body):
+        """POST /batch {"codes": [...], "time": "..."} 在同一时间点批量查询"""
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            return 400, {"error": f"请求体不是有效的JSON: {e}"}
+        if not isinstance(payload, dict):
+            return 400, {"error": "请求体必须是JSON对象，如 {\"codes\": [\"574W\"]}"}
+        codes = payload.get("codes")
+        if not isinstance(codes, list):
+            return 400, {"error": "codes 必须是流向代码列表"}
+        invalid = [index for index, code in enumerate(codes) if not isinstance(code, str)]
+        if invalid:
+            return 400, {"error": f"codes 中的流向代码必须是字符串（下标 {', '.join(map(str, invalid[:10]))} 处不是）"}
+        time_value = payload.get("time")
+        if time_value is not None and not isinstance(time_value, str):
+            return 400, {"error": "time 必须是 ISO 格式的时间字符串"}
+        current_time = self._parse_time(time_value)
+        results = self.rule_manager.find_current_locations_batch(codes, current_time)
+        return 200, {"time": current_time.isoformat(timespec="seconds"),
+                     "results": dict(zip(map(str, codes), results))}
+
+    def handle_health(self, params, body):
+        """GET /health 返回规则缓存状态"""
+        manager = self.rule_manager
+        snapshot = manager.snapshot
+        return 200, {
+            "rule_version": snapshot.version if snapshot else 0,
+            "rule_count": len(snapshot.warehouse_rules) if snapshot else 0,
+            "last_load_time": snapshot.load_time.isoformat(timespec="seconds") if snapshot else None,
+            "snapshot_age": round(snapshot.age, 3) if snapshot else None,
+            "last_refresh_error": manager.last_refresh_error
+        }
+
+    ROUTES = {
+        ("GET", "/lookup"): handle_lookup,
+        ("GET", "/search"): handle_search,
+        ("POST", "/batch"): handle_batch,
+        ("GET", "/health"): handle_health,
+    }
+
+    def dispatch(self, method, target, body):
+        """
+        根据请求方法和路径分发到对应接口
+        :return: (状态码, 响应对象)，或带额外响应头的 (状态码, 响应对象, 响应头字典)
+        """
+        url = urlsplit(target)
+        handler = self.ROUTES.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.ROUTES):
+                return 405, {"error": f"{url.path} 不支持 {method} 方法"}
+            return 404, {"error": f"未知接口: {url.path}"}
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            return handler(self, params, body)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": f"服务器内部错误: {e}"}
+
+    # —————— HTTP 协议处理 ——————
+
+    async def handle_connection(self, reader, writer):
+        """处理一个客户端连接，支持 HTTP/1.1 长连接"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._write_response(writer, 413, {"error": "请求头过大"}, keep_alive=False)
+                    break
+
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                except ValueError:
+                    await self._write_response(writer, 400, {"error": "无效的请求行"}, keep_alive=False)
+                    break
+
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                body = b""
+                try:
+                    content_length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self._write_response(writer, 400, {"error": "无效的 Content-Length"}, keep_alive=False)
+                    break
+                if content_length > self.MAX_BODY_BYTES:
+                    await self._write_response(writer, 413, {"error": "请求体过大"}, keep_alive=False)
+                    break
+                if content_length:
+                    body = await reader.readexactly(content_length)
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" and (version == "HTTP/1.1" or connection == "keep-alive")
+
+                status, payload, *extra = self.dispatch(method.upper(), target, body)
+                await self._write_response(writer, status, payload, keep_alive, *extra)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _write_response(self, writer, status, payload, keep_alive, headers=None):
+        """写出 JSON 响应"""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        extra_headers = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        head = (f"HTTP/1.1 {status} {self.STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"{extra_headers}"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    # —————— 启动与停止 ——————
+
+    async def start(self):
+        """加载规则并开始监听"""
+        # 启动时一次性加载规则，之后所有请求只读内存缓存
+        self.rule_manager.load_rules_from_database()
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                 limit=self.MAX_HEADER_BYTES, backlog=4096)
+        return self.server
+
+    async def serve_forever(self):
+        """启动服务并持续运行"""
+        await self.start()
+        addresses = ", ".join(str(sock.getsockname()) for sock in self.server.sockets)
+        print(f"流向查询服务已启动: {addresses}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        """停止服务"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+# —————— 以下是命令行入口 ——————
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="流向查询 HTTP 服务")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=8600, help="监听端口")
+    parser.add_argument("--db", default="announcements.db", help="SQLite数据库文件路径")
+    args = parser.parse_args()
+
+    # /search 支持拼音，搜索索引在首次搜索时构建
+    service = LookupService(WarehouseRuleManager(args.db, pinyin_search=True), host=args.host, port=args.port)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        print("流向查询服务已停止")
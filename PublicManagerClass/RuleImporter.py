@@ -0,0 +1,358 @@
+import contextlib
+import csv
+import io
+import os
+import tempfile
+
+from PublicManagerClass.WarehouseRuleManager import check_time_rule
+
+try:
+    import openpyxl
+except ImportError:  # 未安装 openpyxl 时只支持 CSV
+    openpyxl = None
+
+
+class RuleImporter:
+    """
+    从 CSV / XLSX 文件流式导入流向规则（如 代码映射关系表.csv）。
+    分两遍读取文件：第一遍逐行检查并收集挂靠引用，第二遍按块与当前表比较并批量写入，
+    任何时候只在内存中保留一块行数据，导入数万行时内存占用保持不变。
+    XLSX 解析较慢，第一遍把读出的行写入临时 CSV 文件，第二遍改读该文件，工作簿只解析一次。
+    """
+
+    # 每块读取和写入的行数
+    CHUNK_SIZE = 1000
+    # 试运行差异中最多保留的明细条数（计数不受限制）
+    MAX_CHANGE_DETAILS = 1000
+
+    TIME_RULE_COLUMNS = {"物理位置1": "位置1适用时间", "物理位置2": "位置2适用时间"}
+    MAPPING_COLUMN = "映射"
+    ATTACHED_COLUMN = "挂靠流向"
+
+    def __init__(self, data_manager, chunk_size=CHUNK_SIZE):
+        """
+        初始化导入器
+        :param data_manager: 目标表的 GenericDataManager
+        :param chunk_size: 每块的行数
+        """
+        self.data_manager = data_manager
+        self.chunk_size = chunk_size
+
+    # —————— 读取 ——————
+
+    @staticmethod
+    def _normalize(value):
+        """
+        统一单元格的值：空单元格与空字符串为None，数字按文本保存（XLSX 中的 1 与 CSV 中的 "1" 相同）
+        :param value: 单元格的值
+        :return: 字符串或None
+        """
+        if value is None:
+            return None
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        value = str(value).strip()
+        return value or None
+
+    @staticmethod
+    def _source_name(source):
+        """文件路径或上传文件对象（带 name 属性）的文件名"""
+        return source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+
+    def _iter_rows(self, source):
+        """
+        逐行读取文件（CSV 按流读取，XLSX 以只读模式流式解析第一个工作表）
+        :param source: 文件路径，或 Streamlit 上传的文件等二进制文件对象
+        :return: (行号, 表头, 值列表) 的生成器，行号从表头所在的第 1 行起算
+        :raises ValueError: 文件类型不受支持时
+        """
+        name = str(self._source_name(source)).lower()
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+
+        if name.endswith(".xlsx"):
+            if openpyxl is None:
+                raise ValueError("读取 XLSX 需要安装 openpyxl")
+            workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+            try:
+                rows = workbook.worksheets[0].iter_rows(values_only=True)
+                header = None
+                for line, values in enumerate(rows, 1):
+                    if header is None:
+                        header = [self._normalize(value) for value in values]
+                    else:
+                        yield line, header, values
+            finally:
+                workbook.close()
+        elif name.endswith(".csv"):
+            # utf-8-sig 去掉 Excel 导出的 BOM
+            if isinstance(source, (str, os.PathLike)):
+                text = open(source, encoding="utf-8-sig", newline="")
+            else:
+                text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+            try:
+                reader = csv.reader(text)
+                header = None
+                for line, values in enumerate(reader, 1):
+                    if header is None:
+                        header = [self._normalize(value) for value in values]
+                    else:
+                        yield line, header, values
+            finally:
+                if isinstance(source, (str, os.PathLike)):
+                    text.close()
+                else:
+                    # 不关闭调用方的文件对象
+                    text.detach()
+        else:
+            raise ValueError(f"不支持的文件类型: {name or '未知'}（仅支持 .csv 和 .xlsx）")
+
+    def _iter_records(self, source):
+        """
+        把文件中的行转换为行字典，跳过空行
+        :param source: 文件路径或文件对象
+        :return: (行号, 行字典) 的生成器
+        :raises ValueError: 表头包含表中没有的列或缺少主键列时
+        """
+        checked_header = None
+        for line, header, values in self._iter_rows(source):
+            if header is not checked_header:
+                self._check_header(header)
+                checked_header = header
+            row_data = {col: self._normalize(value) for col, value in zip(header, values) if col}
+            if any(value is not None for value in row_data.values()):
+                yield line, row_data
+
+    @staticmethod
+    def _is_xlsx(source):
+        """是否为 XLSX 文件"""
+        return str(RuleImporter._source_name(source)).lower().endswith(".xlsx")
+
+    @staticmethod
+    def _spool_records(records, spool):
+        """
+        在读取的同时把行字典写入临时 CSV 文件（第一列为原文件中的行号）
+        :param records: (行号, 行字典) 的可迭代对象
+        :param spool: 以文本模式打开的临时文件
+        :return: 原样产出 records 的生成器
+        """
+        writer = csv.writer(spool)
+        header = None
+        for line, row_data in records:
+            if header is None:
+                header = list(row_data)
+                writer.writerow(["行号"] + header)
+            writer.writerow([line] + ["" if row_data.get(col) is None else row_data[col] for col in header])
+            yield line, row_data
+
+    def _read_spool(self, spool):
+        """
+        读取 _spool_records 写入的临时文件
+        :param spool: 临时文件
+        :return: (行号, 行字典) 的生成器
+        """
+        spool.seek(0)
+        reader = csv.reader(spool)
+        header = next(reader, None)
+        for values in reader:
+            yield int(values[0]), {col: value or None for col, value in zip(header[1:], values[1:])}
+
+    def _check_header(self, header):
+        """
+        检查表头
+        :param header: 表头列名列表
+        :raises ValueError: 表头无效时
+        """
+        columns = [col for col in header if col]
+        unknown = [col for col in columns if col not in self.data_manager.columns]
+        if unknown:
+            raise ValueError(f"文件包含表中没有的列: {', '.join(unknown)}")
+        if self.data_manager.primary_key not in columns:
+            raise ValueError(f"文件缺少主键列 {self.data_manager.primary_key}")
+        if len(set(columns)) != len(columns):
+            raise ValueError("文件表头有重复的列")
+
+    def _chunks(self, records):
+        """按 chunk_size 分块"""
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    # —————— 检查 ——————
+
+    def _row_errors(self, row_data):
+        """
+        检查单行：主键、时间规则写法，以及物理位置与适用时间是否成对
+        :param row_data: 行字典
+        :return: (错误列表, 提醒列表)
+        """
+        errors, warnings = [], []
+        if not row_data.get(self.data_manager.primary_key):
+            errors.append(f"缺少{self.data_manager.primary_key}")
+        for location_column, rule_column in self.TIME_RULE_COLUMNS.items():
+            rule_str = row_data.get(rule_column)
+            if rule_str is not None:
+                try:
+                    check_time_rule(rule_str)
+                except ValueError as e:
+                    errors.append(f"{rule_column}: {e}")
+            if (location_column in row_data or rule_column in row_data) \
+                    and (row_data.get(location_column) is None) != (rule_str is None):
+                warnings.append(f"{location_column} 与 {rule_column} 只填写了一个，该位置不会生效")
+        return errors, warnings
+
+    def _table_mappings(self):
+        """读取表中现有的映射码集合"""
+        column = self.MAPPING_COLUMN
+        if column not in self.data_manager.columns:
+            return set()
+        self.data_manager.cursor.execute(
+            f"SELECT DISTINCT {column} FROM {self.data_manager.table_name} WHERE {column} IS NOT NULL")
+        return {self._normalize(row[0]) for row in self.data_manager.cursor.fetchall()}
+
+    def validate(self, source, spool=None):
+        """
+        第一遍：逐行检查文件，并确认挂靠流向引用的映射码在导入后存在（表中已有或文件中新增）
+        :param source: 文件路径或文件对象
+        :param spool: 可选的临时文件，读出的行同时写入其中供第二遍读取
+        :return: (无效行 {行号: {"key", "errors"}}, 提醒列表 [{"line", "key", "message"}], 有效行数)
+        :raises ValueError: 文件无法读取或表头无效时
+        """
+        key_column = self.data_manager.primary_key
+        invalid, warnings = {}, []
+        mappings = self._table_mappings()
+        references = []  # (行号, 代码, 挂靠的映射码)
+        seen_keys = {}
+        total = 0
+
+        records = self._iter_records(source)
+        if spool is not None:
+            records = self._spool_records(records, spool)
+        for line, row_data in records:
+            total += 1
+            key = row_data.get(key_column)
+            errors, row_warnings = self._row_errors(row_data)
+            if errors:
+                invalid[line] = {"key": key, "errors": errors}
+                continue
+            warnings.extend({"line": line, "key": key, "message": message} for message in row_warnings)
+            if key in seen_keys:
+                warnings.append({"line": line, "key": key,
+                                 "message": f"与第 {seen_keys[key]} 行的{key_column}重复，以后出现的为准"})
+            seen_keys[key] = line
+            if row_data.get(self.MAPPING_COLUMN) is not None:
+                mappings.add(row_data[self.MAPPING_COLUMN])
+            if row_data.get(self.ATTACHED_COLUMN) is not None:
+                references.append((line, key, row_data[self.ATTACHED_COLUMN]))
+
+        for line, key, attached in references:
+            if attached not in mappings:
+                invalid[line] = {"key": key, "errors": [f"挂靠流向 '{attached}' 不是任何流向的映射码"]}
+        return invalid, warnings, total - len(invalid)
+
+    # —————— 比较与写入 ——————
+
+    def _current_rows(self, keys):
+        """
+        读取表中给定主键的当前行
+        :param keys: 主键值列表
+        :return: 主键 -> 行字典（值已统一格式）
+        """
+        manager = self.data_manager
+        placeholders = ', '.join(['?'] * len(keys))
+        manager.cursor.execute(
+            f"SELECT * FROM {manager.table_name} WHERE {manager.primary_key} IN ({placeholders})", keys)
+        current = {}
+        for row in manager.cursor.fetchall():
+            row_data = {col: self._normalize(value) for col, value in zip(manager.columns, row)}
+            current.setdefault(row_data[manager.primary_key], row_data)
+        return current
+
+    def run(self, source, dry_run=True, skip_invalid=False, notify=None, on_progress=None):
+        """
+        导入文件：检查后按块与当前表比较，非试运行时每块在一个事务中批量写入
+        :param source: 文件路径，或 Streamlit 上传的文件等二进制文件对象
+        :param dry_run: 为True时只生成差异，不写入
+        :param skip_invalid: 为True时跳过无效行继续导入，否则有无效行时不写入任何行
+        :param notify: 写入完成后调用一次的回调（如 notify_rules_changed），使规则缓存只失效一次
+        :param on_progress: 每处理完一块调用 on_progress(已处理行数, 有效行数)
+        :return: 导入报告字典：
+                 total / inserted / updated / unchanged 行数，
+                 invalid [{"line", "key", "errors"}]，warnings [{"line", "key", "message"}]，
+                 changes 差异明细 [{"line", "key", "action", "columns": {列: [原值, 新值]}}]（最多 MAX_CHANGE_DETAILS 条），
+                 failures 写入失败的行 [{"line", "key", "error"}]，written 是否已写入
+        :raises ValueError: 文件无法读取或表头无效时
+        """
+        spool_context = tempfile.TemporaryFile("w+", encoding="utf-8", newline="") if self._is_xlsx(source) \
+            else contextlib.nullcontext()
+        with spool_context as spool:
+            invalid, warnings, valid_count = self.validate(source, spool)
+            records = self._iter_records(source) if spool is None else self._read_spool(spool)
+            return self._apply(records, invalid, warnings, valid_count, dry_run, skip_invalid, notify, on_progress)
+
+    def _apply(self, records, invalid, warnings, valid_count, dry_run, skip_invalid, notify, on_progress):
+        """
+        第二遍：按块与当前表比较，需要时批量写入（参数与返回值见 run）
+        :param records: (行号, 行字典) 的可迭代对象
+        :param invalid: validate 返回的无效行
+        :param warnings: validate 返回的提醒列表
+        :param valid_count: 有效行数
+        """
+        report = {
+            "total": valid_count + len(invalid), "inserted": 0, "updated": 0, "unchanged": 0,
+            "invalid": [{"line": line, **details} for line, details in sorted(invalid.items())],
+            "warnings": warnings, "changes": [], "failures": [], "written": False
+        }
+        write = not dry_run and (skip_invalid or not invalid)
+
+        key_column = self.data_manager.primary_key
+        processed = 0
+        for chunk in self._chunks(records):
+            valid = [(line, row_data) for line, row_data in chunk if line not in invalid]
+            processed += len(valid)
+            if not valid:
+                continue
+
+            current = self._current_rows(list({row_data[key_column] for _, row_data in valid}))
+            rows_to_write = []
+            for line, row_data in valid:
+                key = row_data[key_column]
+                old = current.get(key)
+                if old is None:
+                    action = "新增"
+                    columns = {col: [None, value] for col, value in row_data.items() if value is not None}
+                else:
+                    columns = {col: [old.get(col), value] for col, value in row_data.items() if old.get(col) != value}
+                    action = "修改" if columns else None
+                # 同一块中重复的主键，后面的行与前面的行比较
+                current[key] = {**(old or {}), **row_data}
+
+                if action is None:
+                    report["unchanged"] += 1
+                    continue
+                report["inserted" if action == "新增" else "updated"] += 1
+                if len(report["changes"]) < self.MAX_CHANGE_DETAILS:
+                    report["changes"].append({"line": line, "key": key, "action": action, "columns": columns})
+                rows_to_write.append((line, row_data))
+
+            if write and rows_to_write:
+                result = self.data_manager.upsert_rows([row_data for _, row_data in rows_to_write])
+                if "error" in result:
+                    report["failures"].append({"line": None, "key": None, "error": result["error"]})
+                    break
+                report["failures"].extend(
+                    {"line": rows_to_write[failure["index"]][0], "key": failure["key"], "error": failure["error"]}
+                    for failure in result["failures"])
+                report["written"] = True
+
+            if on_progress is not None:
+                on_progress(processed, valid_count)
+
+        if report["written"] and notify is not None:
+            notify()
+        return report
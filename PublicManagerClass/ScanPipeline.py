@@ -0,0 +1,194 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import sys
+import threading
+import time
+
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+
+
+class ScanPipeline:
+    CSV_COLUMNS = ["扫描时间", "流向代码", "流向", "映射", "最终代码", "是否挂靠", "物理位置"]
+
+    def __init__(self, rule_manager, output, output_format="csv", buffer_lines=256,
+                 flush_interval=1.0, report_interval=10.0, report_stream=None):
+        """
+        初始化扫描流水线：逐行读取扫描到的流向代码，按当前时间解析物理位置并以流的形式输出
+        :param rule_manager: WarehouseRuleManager 实例（启动时一次性加载全部规则）
+        :param output: 输出文本流
+        :param output_format: 输出格式，"csv" 或 "jsonl"
+        :param buffer_lines: 缓冲区最多积累的行数，达到后立即写出
+        :param flush_interval: 最长刷新间隔（秒），输入空闲时也会按此间隔写出缓冲区
+        :param report_interval: 吞吐量报告间隔（秒），为 0 时不报告
+        :param report_stream: 吞吐量报告和规则加载报告（包括之后的后台刷新）的输出流，默认为标准错误
+        """
+        if output_format not in ("csv", "jsonl"):
+            raise ValueError(f"不支持的输出格式: {output_format}")
+
+        self.rule_manager = rule_manager
+        self.output = output
+        self.output_format = output_format
+        self.buffer_lines = buffer_lines
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.report_stream = report_stream if report_stream is not None else sys.stderr
+        # 加载报告写到报告流，避免首次加载和之后的后台刷新把警告混入输出
+        if rule_manager.report_stream is None:
+            rule_manager.report_stream = self.report_stream
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._running = False
+        self._flusher_thread = None
+        self.processed = 0
+        self.unknown = 0
+
+    def resolve_line(self, line, current_time=None):
+        """
+        解析一行扫描输入
+        :param line: 输入行（首个逗号或空白前的内容视为流向代码）
+        :param current_time: 解析使用的时间，默认为当前系统时间
+        :return: 结果字典，空行返回None
+        """
+        fields = line.replace(",", " ").split()
+        if not fields:
+            return None
+        code = fields[0]
+
+        if current_time is None:
+            current_time = datetime.datetime.now()
+
+        results = self.rule_manager.find_current_locations(code, current_time)
+        if not results:
+            self.unknown += 1
+            return {
+                "扫描时间": current_time.strftime("%Y-%m-%d %H:%M:%S"),
+                "流向代码": code,
+                "流向": None,
+                "映射": None,
+                "最终代码": None,
+                "是否挂靠": False,
+                "物理位置": []
+            }
+
+        return {
+            "扫描时间": current_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "流向代码": code,
+            "流向": results[0]["流向"],
+            "映射": results[0]["映射"],
+            "最终代码": results[0]["最终代码"],
+            "是否挂靠": results[0]["是否挂靠"],
+            "物理位置": [result["当前物理位置"] for result in results]
+        }
+
+    def _format(self, record):
+        """
+        将结果字典格式化为一行输出文本
+        :param record: 结果字典
+        :return: 以换行结尾的字符串
+        """
+        if self.output_format == "jsonl":
+            return json.dumps(record, ensure_ascii=False) + "\n"
+
+        line = io.StringIO()
+        row = dict(record, 物理位置="、".join(record["物理位置"]))
+        csv.DictWriter(line, fieldnames=self.CSV_COLUMNS, lineterminator="\n").writerow(row)
+        return line.getvalue()
+
+    def flush(self):
+        """写出缓冲区中的所有行"""
+        with self._lock:
+            if not self._buffer:
+                return
+            self.output.write("".join(self._buffer))
+            self._buffer.clear()
+            self.output.flush()
+
+    def _flusher_loop(self):
+        """后台定时刷新缓冲区，保证输入空闲时结果也能按时送出"""
+        while self._running:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def run(self, input_stream):
+        """
+        持续处理输入流直到结束
+        :param input_stream: 输入文本流（标准输入、文件或命名管道）
+        :return: 处理的行数
+        """
+        # 启动前一次性加载规则，逐行查询只访问内存缓存
+        self.rule_manager.load_rules_from_database()
+
+        if self.output_format == "csv":
+            self.output.write(",".join(self.CSV_COLUMNS) + "\n")
+            self.output.flush()
+
+        self._running = True
+        self._flusher_thread = threading.Thread(target=self._flusher_loop, daemon=True)
+        self._flusher_thread.start()
+
+        start_time = time.perf_counter()
+        last_report_time = start_time
+        last_report_count = 0
+
+        try:
+            for line in input_stream:
+                record = self.resolve_line(line)
+                if record is None:
+                    continue
+
+                with self._lock:
+                    self._buffer.append(self._format(record))
+                    buffer_full = len(self._buffer) >= self.buffer_lines
+                if buffer_full:
+                    self.flush()
+
+                self.processed += 1
+                if self.report_interval:
+                    now = time.perf_counter()
+                    if now - last_report_time >= self.report_interval:
+                        rate = (self.processed - last_report_count) / (now - last_report_time)
+                        print(f"已处理 {self.processed} 行，当前 {rate:.0f} 行/秒", file=self.report_stream)
+                        last_report_time = now
+                        last_report_count = self.processed
+        finally:
+            self._running = False
+            self.flush()
+
+        elapsed = time.perf_counter() - start_time
+        if self.report_interval:
+            rate = self.processed / elapsed if elapsed > 0 else 0.0
+            print(f"处理完成: 共 {self.processed} 行（未知代码 {self.unknown} 行），"
+                  f"耗时 {elapsed:.2f} 秒，平均 {rate:.0f} 行/秒", file=self.report_stream)
+        return self.processed
+
+
+# —————— 以下是命令行入口 ——————
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="扫描流水线：从标准输入、文件或命名管道逐行读取流向代码并输出物理位置")
+    parser.add_argument("input", nargs="?", default="-", help="输入文件或命名管道，默认为标准输入")
+    parser.add_argument("-o", "--output", default="-", help="输出文件，默认为标准输出")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv", help="输出格式")
+    parser.add_argument("--db", default="announcements.db", help="SQLite数据库文件路径")
+    parser.add_argument("--buffer-lines", type=int, default=256, help="缓冲区行数")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="最长刷新间隔（秒）")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="吞吐量报告间隔（秒），0 表示不报告")
+    args = parser.parse_args()
+
+    input_stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        pipeline = ScanPipeline(WarehouseRuleManager(args.db), output_stream, output_format=args.format,
+                                buffer_lines=args.buffer_lines, flush_interval=args.flush_interval,
+                                report_interval=args.report_interval)
+        pipeline.run(input_stream)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
@@ -0,0 +1,237 @@
+import argparse
+import contextlib
+import datetime
+
+import numpy as np
+import pandas as pd
+from dateutil import tz
+
+from PublicManagerClass.WarehouseRuleManager import MINUTES_PER_DAY, MINUTES_PER_WEEK, WarehouseRuleManager
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装 pyarrow 时只支持 CSV
+    pq = None
+
+# 1970-01-01 是星期四，换算周内分钟时需要的偏移
+_EPOCH_MINUTE_OFFSET = 3 * MINUTES_PER_DAY
+_MASK_BYTES = MINUTES_PER_WEEK // 8
+
+UNKNOWN_LOCATION = "未知（未找到适用于当前时间的位置规则）"
+
+
+class ScanReplayEngine:
+    def __init__(self, rule_manager):
+        """
+        初始化扫描记录回放引擎：把规则管理器中的预编译规则展开为 NumPy 数组，
+        对整批 (流向代码, 扫描时间) 向量化求出应去的物理位置。
+        :param rule_manager: WarehouseRuleManager 实例（未加载时会自动加载全部规则）
+        """
+        self.rule_manager = rule_manager
+        self.rule_version = None
+        self.build()
+
+    def build(self):
+        """根据规则管理器当前的规则构建查找数组"""
+        manager = self.rule_manager
+        if manager.snapshot is None:
+            manager.load_rules_from_database()
+        # 整个构建过程只使用同一个快照，期间发布的新快照留到下次重建
+        snapshot = manager.snapshot
+        warehouse_rules = snapshot.warehouse_rules if snapshot is not None else {}
+        attachment_closure = snapshot.attachment_closure if snapshot is not None else {}
+
+        codes = list(warehouse_rules)
+        self.code_index = pd.Index(codes)
+
+        # 挂靠闭包展开为 代码序号 -> 最终代码序号
+        self.final_index = self.code_index.get_indexer(
+            [attachment_closure.get(code, code) for code in codes]).astype(np.int32)
+
+        max_rules = max((len(rule_info["location_rules"]) for rule_info in warehouse_rules.values()), default=0)
+        self.location_mask_ids = np.full((len(codes), max_rules), -1, dtype=np.int32)
+        self.location_name_ids = np.full((len(codes), max_rules), -1, dtype=np.int32)
+
+        mask_ids = {}  # 规则文本 -> 位图行号
+        mask_rows = []
+        name_ids = {}  # 物理位置 -> 名称序号
+        for code_id, rule_info in enumerate(warehouse_rules.values()):
+            for slot, loc_rule in enumerate(rule_info["location_rules"]):
+                if loc_rule["rule"] not in mask_ids:
+                    mask_ids[loc_rule["rule"]] = len(mask_rows)
+                    mask_rows.append(self._mask_row(loc_rule))
+                self.location_mask_ids[code_id, slot] = mask_ids[loc_rule["rule"]]
+                self.location_name_ids[code_id, slot] = name_ids.setdefault(loc_rule["location"], len(name_ids))
+
+        # 每条不同的时间规则一行，按位小端存放 10080 分钟
+        self.mask_bits = np.vstack(mask_rows) if mask_rows else np.zeros((0, _MASK_BYTES), dtype=np.uint8)
+        self.location_names = np.array(list(name_ids), dtype=object)
+        self.rule_version = snapshot.version if snapshot is not None else 0
+
+    @staticmethod
+    def _mask_row(loc_rule):
+        """
+        把位置规则的位图转换为按位存放的 uint8 数组
+        :param loc_rule: 位置规则字典
+        :return: 长度为 1260 的 uint8 数组
+        """
+        mask = loc_rule["mask"]
+        if mask is None:
+            # 无法编译的规则：逐分钟回退到字符串解析，解析出错的分钟视为不生效
+            mask = 0
+            week_start = datetime.datetime(2024, 1, 1)  # 星期一
+            for minute in range(MINUTES_PER_WEEK):
+                current_time = week_start + datetime.timedelta(minutes=minute)
+                with contextlib.suppress(ValueError):
+                    if WarehouseRuleManager.parse_time_rule(loc_rule["rule"], current_time):
+                        mask |= 1 << minute
+        return np.frombuffer(mask.to_bytes(_MASK_BYTES, "little"), dtype=np.uint8)
+
+    @staticmethod
+    def minutes_of_week(scan_times):
+        """
+        向量化计算周内分钟序号。带时区的时间与 find_current_locations 一样先换算为本地时间
+        （同一批中不要混用带时区和不带时区的时间）
+        :param scan_times: 可被 pandas.to_datetime 解析的时间序列
+        :return: (周内分钟 int32 数组, 时间是否有效的布尔数组)
+        """
+        scan_times = pd.Series(scan_times)
+        try:
+            timestamps = pd.to_datetime(scan_times, errors="coerce")
+            aware = isinstance(timestamps.dtype, pd.DatetimeTZDtype)
+        except ValueError:
+            aware = True  # 混有不同的时区偏移的字符串
+        if aware:
+            # 先统一换算到 UTC（否则与第一个时区偏移不同的时间会被当成无效），
+            # 再换算为本地时间并去掉时区，否则 to_numpy 得到的是 UTC 时间
+            timestamps = pd.to_datetime(scan_times, errors="coerce", utc=True)
+            timestamps = timestamps.dt.tz_convert(tz.tzlocal()).dt.tz_localize(None)
+        timestamps = timestamps.to_numpy().astype("datetime64[m]")
+        valid = ~np.isnat(timestamps)
+        epoch_minutes = timestamps.astype(np.int64)
+        minutes = ((epoch_minutes + _EPOCH_MINUTE_OFFSET) % MINUTES_PER_WEEK).astype(np.int32)
+        minutes[~valid] = 0
+        return minutes, valid
+
+    def replay(self, codes, scan_times):
+        """
+        批量回放扫描记录
+        :param codes: 流向代码序列
+        :param scan_times: 扫描时间序列，与 codes 等长
+        :return: DataFrame，列为 流向代码、扫描时间、最终代码、是否挂靠、当前物理位置、当前物理位置2，
+                 代码与位置列为分类类型（未知代码或无效时间的位置为空；同一时间有两个位置生效时第二个写入 当前物理位置2）
+        """
+        # 规则重新加载后自动重建数组
+        if self.rule_version != self.rule_manager.rule_version:
+            self.build()
+
+        codes = np.asarray(codes, dtype=object)
+        scan_times = pd.Series(scan_times).to_numpy()
+        row_count = len(codes)
+
+        code_ids = self.code_index.get_indexer(codes)
+        minutes, valid_time = self.minutes_of_week(scan_times)
+        known = code_ids >= 0
+        resolvable = known & valid_time
+
+        # 位置列以分类编码输出：-1 为空，最后一个类别为"未知"
+        unknown_id = len(self.location_names)
+        first_ids = np.full(row_count, -1, dtype=np.int32)
+        second_ids = np.full(row_count, -1, dtype=np.int32)
+        final_ids = np.full(row_count, -1, dtype=np.int32)
+
+        if known.any():
+            # 未知代码暂按序号 0 计算，最后统一用 known/resolvable 屏蔽
+            lookup_ids = np.where(known, self.final_index[np.maximum(code_ids, 0)], 0)
+            final_ids[known] = lookup_ids[known]
+
+            mask_ids = self.location_mask_ids[lookup_ids]
+            name_ids = self.location_name_ids[lookup_ids]
+            # 没有任何位置规则时数组为 n×0，可解析的行都是"未知"
+            if mask_ids.shape[1]:
+                active = np.zeros(mask_ids.shape, dtype=bool)
+                for slot in range(mask_ids.shape[1]):
+                    slot_ids = mask_ids[:, slot]
+                    bits = self.mask_bits[np.maximum(slot_ids, 0), minutes >> 3] >> (minutes & 7)
+                    active[:, slot] = resolvable & (slot_ids >= 0) & (bits & 1).astype(bool)
+
+                # 按规则顺序取第一个和第二个生效的位置
+                rows = np.arange(row_count)
+                for target in (first_ids, second_ids):
+                    has_active = active.any(axis=1)
+                    slot = active.argmax(axis=1)
+                    target[has_active] = name_ids[rows, slot][has_active]
+                    active[rows, slot] = False
+
+            first_ids[resolvable & (first_ids < 0)] = unknown_id
+
+        location_categories = pd.Index(list(self.location_names) + [UNKNOWN_LOCATION])
+        return pd.DataFrame({
+            "流向代码": codes,
+            "扫描时间": scan_times,
+            "最终代码": pd.Categorical.from_codes(final_ids, categories=self.code_index),
+            "是否挂靠": known & (final_ids != code_ids),
+            "当前物理位置": pd.Categorical.from_codes(first_ids, categories=location_categories),
+            "当前物理位置2": pd.Categorical.from_codes(second_ids, categories=location_categories)
+        })
+
+    def replay_file(self, input_path, code_column="流向代码", time_column="扫描时间", chunk_size=500_000):
+        """
+        分块读取扫描日志并回放，内存占用只与块大小有关
+        :param input_path: CSV 或 Parquet 文件路径
+        :param code_column: 流向代码列名
+        :param time_column: 扫描时间列名
+        :param chunk_size: 每块行数
+        :return: 逐块产出回放结果 DataFrame 的生成器
+        """
+        for chunk in self._read_chunks(input_path, [code_column, time_column], chunk_size):
+            yield self.replay(chunk[code_column], chunk[time_column])
+
+    @staticmethod
+    def _read_chunks(input_path, columns, chunk_size):
+        """
+        按块读取 CSV 或 Parquet 文件中的指定列
+        :param input_path: 文件路径
+        :param columns: 需要读取的列
+        :param chunk_size: 每块行数
+        :return: DataFrame 生成器
+        """
+        if str(input_path).lower().endswith(".parquet"):
+            if pq is None:
+                raise ImportError("读取 Parquet 文件需要安装 pyarrow")
+            parquet_file = pq.ParquetFile(input_path)
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(input_path, usecols=columns, dtype={columns[0]: str}, chunksize=chunk_size)
+
+    def replay_to_csv(self, input_path, output_path, **kwargs):
+        """
+        回放整个扫描日志并逐块追加写入 CSV
+        :param input_path: 输入文件路径（CSV 或 Parquet）
+        :param output_path: 输出 CSV 路径
+        :param kwargs: 传给 replay_file 的参数
+        :return: 回放的总行数
+        """
+        total = 0
+        for index, result in enumerate(self.replay_file(input_path, **kwargs)):
+            result.to_csv(output_path, mode="w" if index == 0 else "a", header=index == 0, index=False)
+            total += len(result)
+        return total
+
+
+# —————— 以下是命令行入口 ——————
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="扫描记录回放：按扫描时间求出每件货应去的物理位置")
+    parser.add_argument("input", help="扫描日志文件（CSV 或 Parquet）")
+    parser.add_argument("output", help="回放结果 CSV 文件")
+    parser.add_argument("--db", default="announcements.db", help="SQLite数据库文件路径")
+    parser.add_argument("--code-column", default="流向代码", help="流向代码列名")
+    parser.add_argument("--time-column", default="扫描时间", help="扫描时间列名")
+    parser.add_argument("--chunk-size", type=int, default=500_000, help="每块行数")
+    args = parser.parse_args()
+
+    engine = ScanReplayEngine(WarehouseRuleManager(args.db))
+    rows = engine.replay_to_csv(args.input, args.output, code_column=args.code_column,
+                                time_column=args.time_column, chunk_size=args.chunk_size)
+    print(f"回放完成，共 {rows} 条记录，结果已写入 {args.output}")
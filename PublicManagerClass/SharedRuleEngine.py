@@ -0,0 +1,28 @@
+import streamlit as st
+
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+
+
+@st.cache_resource(show_spinner=False)
+def get_rule_manager(db_path='announcements.db'):
+    """
+    获取进程内共享的规则管理器：所有会话、所有页面以及每次脚本重跑共用同一个实例和同一份规则快照。
+    管理器在后台按数据库版本信号检查变化并整体替换快照，因此不需要清除这里的资源缓存。
+    :param db_path: SQLite数据库文件路径
+    :return: WarehouseRuleManager 实例
+    """
+    # 编译规则表与数据库放在一起：其他 Streamlit 进程冷启动时直接映射该文件回答查询
+    # 首页的搜索索引和输入时的补全索引由后台刷新线程在每次发布快照后构建，不在页面脚本中构建
+    rule_manager = WarehouseRuleManager(db_path, snapshot_file=f"{db_path}.rules", prefix_completion=True,
+                                        build_search_index=True, pinyin_search=True)
+    # 创建后立即在后台开始首次加载，首个查询不必等待整张表读完
+    rule_manager.refresh_in_background(force_check=True)
+    return rule_manager
+
+
+def notify_rules_changed(db_path='announcements.db'):
+    """
+    本进程修改了规则表后调用：立即在后台检查并刷新共享快照，不等待下一个检查间隔
+    :param db_path: SQLite数据库文件路径
+    """
+    get_rule_manager(db_path).refresh_in_background(force_check=True)
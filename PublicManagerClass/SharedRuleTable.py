@@ -0,0 +1,315 @@
+import argparse
+import contextlib
+import os
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from PublicManagerClass.CompiledRuleTable import CompiledRuleTable, compile_rule_table
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+
+# 控制段：固定大小的头部，记录当前规则表所在的共享内存段。
+# 发布方按顺序锁（seqlock）写入：先把序号改为奇数，写完版本、大小和段名后再改为偶数；
+# 读取方读到奇数序号或前后序号不一致时重读，因此不需要跨进程锁。
+CONTROL_MAGIC = b"SFRULESC"
+# 魔数、序号、规则版本、规则表字节数、规则表所在的共享内存段名
+CONTROL = struct.Struct("<8sQQQ96s")
+_SEQ = struct.Struct("<Q")
+_SEQ_OFFSET = 8
+_attach_lock = threading.Lock()
+
+
+def _attach(name):
+    """
+    附加到已有的共享内存段，且不交给 resource_tracker 管理
+    （否则附加方进程退出时会删除发布方创建的共享内存）
+    :param name: 共享内存段名
+    :return: SharedMemory
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Python 3.13 之前没有 track 参数，附加时也会登记。子进程与父进程共用同一个 resource_tracker，
+    # 事后取消登记会连同发布方的登记一起取消，因此在附加期间跳过登记。
+    # 只跳过本线程对该段的这一次登记，其他线程同时创建的共享内存照常登记
+    with _attach_lock:
+        register = resource_tracker.register
+        thread_id = threading.get_ident()
+
+        def skip_attach_register(resource_name, rtype):
+            if not (threading.get_ident() == thread_id and rtype == "shared_memory"
+                    and resource_name.lstrip("/") == name):
+                register(resource_name, rtype)
+
+        resource_tracker.register = skip_attach_register
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def read_control(control_buffer):
+    """
+    按顺序锁协议读取控制段
+    :param control_buffer: 控制段缓冲区
+    :return: (规则版本, 规则表字节数, 规则表所在的段名)
+    :raises ValueError: 控制段不是由 SharedRulePublisher 创建时
+    """
+    while True:
+        seq = _SEQ.unpack_from(control_buffer, _SEQ_OFFSET)[0]
+        if seq & 1:
+            # 发布方正在写入，让出时间片后重读
+            time.sleep(0)
+            continue
+        magic, _, version, size, segment_name = CONTROL.unpack_from(control_buffer, 0)
+        if _SEQ.unpack_from(control_buffer, _SEQ_OFFSET)[0] == seq:
+            break
+    if magic != CONTROL_MAGIC:
+        raise ValueError("不是规则共享内存的控制段")
+    return version, size, segment_name.rstrip(b"\0").decode("ascii")
+
+
+class SharedRulePublisher:
+    """
+    把规则管理器发布的每个快照编译为规则表，写入新的共享内存段，再切换控制段指向它。
+    同一台机器上的其他进程用 SharedRuleReader 只读附加，所有进程共用同一份物理内存。
+    """
+
+    def __init__(self, rule_manager, name="sf_rules"):
+        """
+        创建（或接管已有的）控制段，并订阅规则管理器的快照发布
+        :param rule_manager: WarehouseRuleManager 实例，由它负责检测数据库变化
+        :param name: 控制段名，读取方用同一个名字附加
+        """
+        self.rule_manager = rule_manager
+        self.name = name
+        self._lock = threading.Lock()
+        self._segments = []  # 已发布的规则表段，旧到新
+        try:
+            self._control = shared_memory.SharedMemory(name=name, create=True, size=CONTROL.size)
+            CONTROL.pack_into(self._control.buf, 0, CONTROL_MAGIC, 0, 0, 0, b"")
+        except FileExistsError:
+            # 沿用上一个发布方留下的控制段，已附加的读取方可以继续跟随新的发布
+            self._control = _attach(name)
+            if _SEQ.unpack_from(self._control.buf, _SEQ_OFFSET)[0] & 1:
+                # 上一个发布方在写入中途退出，恢复为偶数序号
+                self._bump_seq()
+        else:
+            # 控制段在发布方重启之间保留，不随本进程退出而删除
+            resource_tracker.unregister(self._control._name, "shared_memory")
+
+        rule_manager.add_publish_listener(self.publish)
+        if rule_manager.snapshot is not None:
+            self.publish(rule_manager.snapshot)
+
+    def _bump_seq(self):
+        seq = _SEQ.unpack_from(self._control.buf, _SEQ_OFFSET)[0]
+        _SEQ.pack_into(self._control.buf, _SEQ_OFFSET, seq + 1)
+        return seq + 1
+
+    def publish(self, snapshot):
+        """
+        把快照写入新的共享内存段并切换控制段（作为快照发布回调调用）
+        :param snapshot: RuleSnapshot
+        :return: 新的共享内存段名
+        """
+        buffer = compile_rule_table(snapshot, (0,) * 5)
+        with self._lock:
+            # 段名包含发布方进程号，发布方重启后版本号从头开始也不会与残留的段重名
+            segment_name = f"{self.name}_{os.getpid()}_{snapshot.version}"
+            segment = shared_memory.SharedMemory(name=segment_name, create=True, size=len(buffer))
+            segment.buf[:len(buffer)] = buffer
+
+            self._bump_seq()
+            CONTROL.pack_into(self._control.buf, 0, CONTROL_MAGIC, _SEQ.unpack_from(self._control.buf, _SEQ_OFFSET)[0],
+                              snapshot.version, len(buffer), segment_name.encode("ascii"))
+            self._bump_seq()
+
+            self._segments.append(segment)
+            # 保留上一个版本，给正在切换的读取方留出附加时间；更早的段删除名字，
+            # 仍在使用它的进程持有的映射在关闭前一直有效
+            while len(self._segments) > 2:
+                retired = self._segments.pop(0)
+                retired.close()
+                retired.unlink()
+        return segment_name
+
+    def close(self, unlink_control=False):
+        """
+        停止发布并删除本发布方创建的规则表段
+        :param unlink_control: 是否同时删除控制段（之后读取方需要重新附加）
+        """
+        self.rule_manager.remove_publish_listener(self.publish)
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+                segment.unlink()
+            self._segments = []
+            self._control.close()
+            if unlink_control:
+                shared_memory.SharedMemory(name=self.name).unlink()
+
+
+class SharedRuleReader:
+    """
+    只读附加发布方的共享规则表。每次查询先读取控制段，发现新版本时附加新的段，
+    不复制规则数据，因此所有读取方在同一次发布之后的第一次查询就使用新规则。
+    查询期间对所用的规则表计数，切换后的旧规则表在没有查询使用时才关闭。
+    """
+
+    # 要附加的段已被发布方删除时，重新读取控制段并附加其最新段的最多次数
+    ATTACH_RETRIES = 5
+
+    def __init__(self, name="sf_rules"):
+        """
+        附加控制段
+        :param name: 发布方使用的控制段名
+        :raises FileNotFoundError: 发布方尚未创建控制段时
+        """
+        self.name = name
+        self._control = _attach(name)
+        self._lock = threading.Lock()
+        self._segment_name = None
+        self._table = None
+        self._readers = {}  # 规则表 -> 正在使用它的查询数
+        self._retired = []  # 已切换掉、仍有查询在使用的规则表
+
+    @property
+    def rule_version(self):
+        """当前使用的规则表版本，尚未附加时为0"""
+        return self._table.rule_version if self._table is not None else 0
+
+    def current_table(self):
+        """
+        返回当前版本的规则表，控制段指向新的段时先切换。
+        返回的规则表不计数，下次切换后可能被关闭；需要持有时使用 use_table
+        :return: CompiledRuleTable，发布方尚未发布过任何规则表时为None
+        """
+        _, _, segment_name = read_control(self._control.buf)
+        if segment_name and segment_name != self._segment_name:
+            with self._lock:
+                if segment_name != self._segment_name:
+                    self._swap(segment_name)
+        return self._table
+
+    @contextlib.contextmanager
+    def use_table(self):
+        """
+        取得当前版本的规则表并在 with 块内持有，期间即使切换到新版本也不会被关闭
+        :return: 上下文管理器，得到 CompiledRuleTable 或None（发布方尚未发布过任何规则表时）
+        """
+        self.current_table()
+        with self._lock:
+            table = self._table
+            if table is not None:
+                self._readers[table] = self._readers.get(table, 0) + 1
+        try:
+            yield table
+        finally:
+            if table is not None:
+                with self._lock:
+                    self._readers[table] -= 1
+                    if not self._readers[table]:
+                        del self._readers[table]
+                        if table in self._retired:
+                            self._retired.remove(table)
+                            table.close()
+
+    def _swap(self, segment_name):
+        """
+        附加新的规则表段。读取控制段之后、附加之前发布方可能已连续发布并删除了该段，
+        此时重新读取控制段，改为附加其指向的最新段
+        :param segment_name: 段名
+        :raises FileNotFoundError: 尚未附加过规则表，且重试 ATTACH_RETRIES 次后仍没有可附加的段时
+        """
+        segment = None
+        for _ in range(self.ATTACH_RETRIES):
+            try:
+                segment = _attach(segment_name)
+                break
+            except FileNotFoundError:
+                _, _, latest = read_control(self._control.buf)
+                if latest == self._segment_name:
+                    return
+                if not latest or latest == segment_name:
+                    # 控制段仍指向已删除的段（发布方已退出）
+                    break
+                segment_name = latest
+        if segment is None:
+            # 没有可附加的新段，继续使用手上的规则表
+            if self._table is None:
+                raise FileNotFoundError(f"共享规则表段 {segment_name} 不存在")
+            return
+        table = CompiledRuleTable(segment.buf.toreadonly())
+        table._owner = segment
+
+        retired = self._table
+        self._table = table
+        self._segment_name = segment_name
+        if retired is not None:
+            # 仍有查询在使用时由最后一个查询关闭
+            if self._readers.get(retired):
+                self._retired.append(retired)
+            else:
+                retired.close()
+
+    def find_current_locations(self, code, current_time):
+        """
+        根据流向代码和当前时间查找当前应使用的物理位置（结果与 WarehouseRuleManager.find_current_locations 相同）
+        :param code: 流向代码
+        :param current_time: 当前时间
+        :return: 结果列表，未找到时返回None
+        """
+        with self.use_table() as table:
+            if table is None:
+                return None
+            return table.find_current_locations(code, current_time)
+
+    def find_current_locations_batch(self, codes, current_time):
+        """
+        在同一时间点批量查询多个流向代码，整批使用同一个版本的规则表
+        :param codes: 流向代码序列
+        :param current_time: 当前时间
+        :return: 与 codes 一一对应的结果列表
+        """
+        code_results = {}
+        with self.use_table() as table:
+            for code in codes:
+                if code not in code_results:
+                    code_results[code] = table.find_current_locations(code, current_time) if table is not None else None
+        return [code_results[code] for code in codes]
+
+    def close(self):
+        """关闭所有附加的共享内存（不会删除它们），应在没有查询进行时调用"""
+        with self._lock:
+            for table in self._retired + [self._table]:
+                if table is not None:
+                    table.close()
+            self._retired = []
+            self._readers = {}
+            self._table = None
+            self._segment_name = None
+            self._control.close()
+
+
+# —————— 以下是命令行入口：常驻的发布进程 ——————
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="把规则表发布到共享内存")
+    parser.add_argument("--db", default="announcements.db", help="SQLite数据库文件路径")
+    parser.add_argument("--name", default="sf_rules", help="控制段名")
+    parser.add_argument("--interval", type=float, default=1.0, help="检查数据库变化的间隔（秒）")
+    args = parser.parse_args()
+
+    manager = WarehouseRuleManager(args.db, reload_check_interval=args.interval, background_refresh=False)
+    manager.load_rules_from_database()
+    publisher = SharedRulePublisher(manager, args.name)
+    print(f"规则表已发布到共享内存 {args.name}（版本 {manager.rule_version}）")
+    try:
+        while True:
+            time.sleep(args.interval)
+            manager.reload_if_changed(force_check=True)
+    except KeyboardInterrupt:
+        publisher.close()
+        print("规则共享内存发布已停止")
@@ -0,0 +1,195 @@
+import csv
+import io
+import os
+
+try:
+    import openpyxl
+except ImportError:  # 未安装 openpyxl 时不能导出 XLSX
+    openpyxl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装 pyarrow 时不能导出 Parquet
+    pa = pq = None
+
+
+class TableExporter:
+    """
+    把查询结果流式导出为 CSV / Parquet / XLSX 文件（如与总部主数据对账）。
+    通过 cursor.fetchmany 按固定批量读取，每批读出后立即写入目标文件，
+    内存中只保留一批行数据，与表的大小无关。
+    """
+
+    # 每批读取的行数（Parquet 中每批为一个行组）
+    BATCH_SIZE = 5000
+
+    # 格式 -> (扩展名, MIME 类型)
+    FORMATS = {
+        "csv": (".csv", "text/csv"),
+        "parquet": (".parquet", "application/vnd.apache.parquet"),
+        "xlsx": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    }
+
+    def __init__(self, fmt, batch_size=BATCH_SIZE):
+        """
+        初始化导出器
+        :param fmt: 导出格式，csv / parquet / xlsx
+        :param batch_size: 每批读取的行数
+        :raises ValueError: 格式不受支持或缺少对应的依赖时
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError(f"不支持的导出格式: {fmt}（仅支持 {' / '.join(self.FORMATS)}）")
+        if fmt == "xlsx" and openpyxl is None:
+            raise ValueError("导出 XLSX 需要安装 openpyxl")
+        if fmt == "parquet" and pa is None:
+            raise ValueError("导出 Parquet 需要安装 pyarrow")
+        self.fmt = fmt
+        self.batch_size = batch_size
+
+    @property
+    def extension(self):
+        """导出文件的扩展名"""
+        return self.FORMATS[self.fmt][0]
+
+    @property
+    def mime_type(self):
+        """导出文件的 MIME 类型（用于 st.download_button）"""
+        return self.FORMATS[self.fmt][1]
+
+    @staticmethod
+    def declared_types(conn, table_name):
+        """
+        读取表中各列声明的类型
+        :param conn: 数据库连接
+        :param table_name: 表名
+        :return: 列名 -> 声明类型（如 TEXT(255)、INTEGER）
+        """
+        return {col[1]: col[2] for col in conn.execute(f"PRAGMA table_info({table_name})")}
+
+    def column_types(self, conn, table_name):
+        """
+        确定导出时各列的类型（只有 Parquet 需要）。SQLite 的整数、浮点列中仍可能存有文本等其他值，
+        先扫描一遍这些列的实际存储类型，含有其他值的列改为按文本导出，保证整个文件使用同一个表结构
+        :param conn: 数据库连接
+        :param table_name: 表名
+        :return: 列名 -> 类型，可作为 export 的 column_types；非 Parquet 格式时为空字典
+        """
+        if self.fmt != "parquet":
+            return {}
+        column_types = self.declared_types(conn, table_name)
+        # 列名 -> 数值列允许的存储类型
+        numeric = {}
+        for col, declared in column_types.items():
+            arrow_type = self._arrow_type(declared)
+            if arrow_type == pa.int64():
+                numeric[col] = "'integer', 'null'"
+            elif arrow_type == pa.float64():
+                numeric[col] = "'integer', 'real', 'null'"
+        if numeric:
+            checks = ", ".join(f'MAX(typeof("{col}") NOT IN ({allowed}))' for col, allowed in numeric.items())
+            mixed = conn.execute(f"SELECT {checks} FROM {table_name}").fetchone()
+            for col, is_mixed in zip(numeric, mixed):
+                if is_mixed:
+                    column_types[col] = "TEXT"
+        return column_types
+
+    @staticmethod
+    def _arrow_type(declared):
+        """按 SQLite 的类型亲和性规则把声明类型转换为 Arrow 类型，日期等其余类型按文本导出"""
+        declared = (declared or "").upper()
+        if "INT" in declared:
+            return pa.int64()
+        if any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+            return pa.float64()
+        return pa.string()
+
+    def _batches(self, cursor):
+        """按批读取查询结果"""
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                return
+            yield rows
+
+    def export(self, cursor, target, column_types=None):
+        """
+        导出已执行查询的游标中的全部行
+        :param cursor: 已执行 SELECT 的游标
+        :param target: 文件路径，或 io.BytesIO 等二进制文件对象（如作为 st.download_button 的数据）
+        :param column_types: 列名 -> 声明类型（见 column_types），Parquet 按其确定列类型，缺省时全部按文本导出
+        :return: 导出的行数
+        :raises ValueError: Parquet 的数值列中出现无法转换的值时（导出到文件路径时不留下不完整的文件）
+        """
+        columns = [description[0] for description in cursor.description]
+        if self.fmt == "csv":
+            return self._export_csv(cursor, columns, target)
+        if self.fmt == "parquet":
+            return self._export_parquet(cursor, columns, target, column_types or {})
+        return self._export_xlsx(cursor, columns, target)
+
+    def _export_csv(self, cursor, columns, target):
+        # utf-8-sig 带 BOM，Excel 打开时中文不乱码；与 RuleImporter 读取的格式一致
+        if isinstance(target, (str, os.PathLike)):
+            text = open(target, "w", encoding="utf-8-sig", newline="")
+        else:
+            text = io.TextIOWrapper(target, encoding="utf-8-sig", newline="")
+        try:
+            writer = csv.writer(text)
+            writer.writerow(columns)
+            count = 0
+            for rows in self._batches(cursor):
+                writer.writerows(rows)
+                count += len(rows)
+            return count
+        finally:
+            if isinstance(target, (str, os.PathLike)):
+                text.close()
+            else:
+                # 不关闭调用方的文件对象
+                text.flush()
+                text.detach()
+
+    def _export_parquet(self, cursor, columns, target, column_types):
+        if isinstance(target, (str, os.PathLike)):
+            # 先写入临时文件，全部成功后再替换，中途出错时不留下只有前几个行组的文件
+            temp_path = f"{os.fspath(target)}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, "wb") as temp_file:
+                    count = self._export_parquet(cursor, columns, temp_file, column_types)
+                os.replace(temp_path, target)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            return count
+
+        schema = pa.schema([(col, self._arrow_type(column_types.get(col))) for col in columns])
+        count = 0
+        with pq.ParquetWriter(target, schema) as writer:
+            for rows in self._batches(cursor):
+                arrays = []
+                for index, field in enumerate(schema):
+                    values = [row[index] for row in rows]
+                    if field.type == pa.string():
+                        # SQLite 列中可能混有数字，统一转为文本
+                        values = [None if value is None else str(value) for value in values]
+                    try:
+                        arrays.append(pa.array(values, type=field.type))
+                    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                        raise ValueError(f"列 {field.name} 中有无法按 {field.type} 导出的值: {e}") from None
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                count += len(rows)
+        return count
+
+    def _export_xlsx(self, cursor, columns, target):
+        # 只写模式逐行写入，不在内存中保留整个工作表
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(columns)
+        count = 0
+        for rows in self._batches(cursor):
+            for row in rows:
+                sheet.append(row)
+            count += len(rows)
+        workbook.save(target)
+        return count
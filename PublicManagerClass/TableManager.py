@@ -1,9 +1,42 @@
+import itertools
+import os
 import sqlite3
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from PublicManagerClass.TableExporter import TableExporter
+
 
 class GenericDataManager:
+    # 批量写入时每次 executemany 的行数
+    BULK_CHUNK_SIZE = 500
+    # 分页查询默认每页行数
+    PAGE_SIZE = 50
+    # 行选择器最多返回的候选行数
+    PICKER_LIMIT = 50
+    # 分页表格允许排序的列，由 ensure_sort_indexes 为其建立索引
+    SORT_INDEX_COLUMNS = ("代码", "流向")
+    # 行数缓存最多保存的筛选条件数
+    COUNT_CACHE_SIZE = 256
+
+    # 行数缓存：(数据库路径, 表名, 筛选条件) -> (数据库指纹, 行数)，页面每次重新运行都会新建管理器，因此在类上共享
+    _count_cache = {}
+
+    # 筛选运算符 -> SQL 条件模板（{col} 为列名）
+    FILTER_OPERATORS = {
+        "=": "{col} = ?",
+        "!=": "{col} != ?",
+        "<": "{col} < ?",
+        "<=": "{col} <= ?",
+        ">": "{col} > ?",
+        ">=": "{col} >= ?",
+        "包含": "{col} LIKE ? ESCAPE '\\'",
+        "开头是": "{col} LIKE ? ESCAPE '\\'",
+        "为空": "({col} IS NULL OR {col} = '')",
+        "不为空": "({col} IS NOT NULL AND {col} != '')",
+    }
+
     def __init__(self, db_path='announcements.db', table_name='warehouse_management'):
         """
         初始化通用数据管理器
@@ -16,6 +49,7 @@ class GenericDataManager:
         self.cursor = None
         self.columns = []
         self.primary_key = '代码'  # 假设主键为"代码"
+        self._conflict_target_ready = None  # 主键列上是否已有可用于 ON CONFLICT 的唯一约束，None 表示尚未检查
 
         # 初始化数据库连接
         self.connect_db()
@@ -73,6 +107,198 @@ class GenericDataManager:
             st.error(f"获取行数据失败: {str(e)}")
             return None
 
+    # —————— 分页查询 ——————
+
+    @staticmethod
+    def _like_pattern(value, prefix_only=False):
+        """把文本转换为 LIKE 模式，转义其中的 % 和 _"""
+        escaped = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"{escaped}%" if prefix_only else f"%{escaped}%"
+
+    def _check_column(self, column):
+        """
+        检查列名属于本表（列名会拼入 SQL）
+        :raises ValueError: 列名未知时
+        """
+        if column not in self.columns:
+            raise ValueError(f"未知的列: {column}")
+
+    def _filter_clause(self, filters):
+        """
+        把筛选条件转换为 WHERE 子句
+        :param filters: [(列名, 运算符, 值), ...]，运算符见 FILTER_OPERATORS
+        :return: (条件列表, 参数列表)
+        :raises ValueError: 列名或运算符未知时
+        """
+        conditions, params = [], []
+        for column, operator, value in filters or ():
+            self._check_column(column)
+            if operator not in self.FILTER_OPERATORS:
+                raise ValueError(f"未知的筛选运算符: {operator}")
+            conditions.append(self.FILTER_OPERATORS[operator].format(col=column))
+            if operator in ("包含", "开头是"):
+                params.append(self._like_pattern(value, prefix_only=operator == "开头是"))
+            elif operator not in ("为空", "不为空"):
+                params.append(value)
+        return conditions, params
+
+    def ensure_sort_indexes(self, columns=SORT_INDEX_COLUMNS):
+        """
+        为分页排序的列建立普通索引（显式的建表步骤，不会在查询时自动执行）。
+        SQLite 的索引项以 rowid 结尾，单列索引即可按 (列, rowid) 的顺序读取，翻页时只读取一个索引区间
+        :param columns: 要建立索引的列，表中没有的列会被跳过
+        :return: 是否成功
+        """
+        try:
+            for column in columns:
+                if column in self.columns:
+                    self.cursor.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_{self.table_name}_{column} ON {self.table_name} ({column})")
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            st.error(f"建立索引失败: {str(e)}")
+            return False
+
+    def sortable_columns(self):
+        """
+        可以高效排序的列：作为某个索引第一列的列
+        :return: 列名列表（按表中列的顺序）
+        """
+        indexed = set()
+        try:
+            for index in self.conn.execute(f"PRAGMA index_list({self.table_name})").fetchall():
+                first = self.conn.execute(f"PRAGMA index_info({index[1]})").fetchone()
+                if first is not None:
+                    indexed.add(first[2])
+        except sqlite3.Error as e:
+            st.error(f"获取索引失败: {str(e)}")
+        return [col for col in self.columns if col in indexed]
+
+    def count_rows(self, filters=None):
+        """
+        统计满足筛选条件的行数。结果按数据库指纹（文件头修改计数器等）缓存，
+        数据没有变化时翻页、重新运行页面都不会重复执行 COUNT(*)
+        :param filters: 筛选条件，见 query_rows
+        :return: 行数
+        """
+        from PublicManagerClass.CompiledRuleTable import database_fingerprint
+
+        conditions, params = self._filter_clause(filters)
+        cache_key = (os.path.abspath(self.db_path), self.table_name, tuple(map(tuple, filters or ())))
+        fingerprint = database_fingerprint(self.db_path)
+        cached = self._count_cache.get(cache_key)
+        if fingerprint is not None and cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            self.cursor.execute(f"SELECT COUNT(*) FROM {self.table_name}{where}", params)
+            count = self.cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            st.error(f"统计行数失败: {str(e)}")
+            return 0
+        if fingerprint is not None:
+            if len(self._count_cache) >= self.COUNT_CACHE_SIZE:
+                self._count_cache.pop(next(iter(self._count_cache)), None)
+            self._count_cache[cache_key] = (fingerprint, count)
+        return count
+
+    def query_rows(self, filters=None, order_by=None, descending=False, after=None, limit=PAGE_SIZE):
+        """
+        按条件分页查询，筛选、排序和分页都在 SQL 中完成。
+        使用键集分页：记住上一页最后一行的 (排序列的值, rowid)，下一页从它之后开始读取，
+        翻到任何一页都只读取 limit 行，不需要 OFFSET 跳过前面的行
+        :param filters: [(列名, 运算符, 值), ...]，多个条件之间为 AND，运算符见 FILTER_OPERATORS
+        :param order_by: 排序列，默认为主键；同值的行按 rowid 排序，保证翻页不重复、不遗漏。
+                         只有 sortable_columns 中的列（有索引）每页只读取一个索引区间，其余列每页都要扫描并排序全表
+        :param descending: 是否降序
+        :param after: 上一页返回的翻页游标，None 表示第一页
+        :param limit: 每页行数
+        :return: (本页数据 DataFrame, 下一页的翻页游标；没有下一页时为 None)
+        :raises ValueError: 列名或运算符未知时
+        """
+        order_by = order_by or self.primary_key
+        self._check_column(order_by)
+        conditions, params = self._filter_clause(filters)
+        comparison, direction = ("<", "DESC") if descending else (">", "ASC")
+
+        # 排序列为 NULL 的行与其余行分两段读取（SQLite 升序时 NULL 在前，降序时在后），
+        # 每段内的翻页条件都是排序列索引上的一个区间，翻到后面的页也不需要从头扫描
+        segments = [True, False] if descending else [False, True]  # 是否为非空段
+        if after is not None:
+            segments = segments[segments.index(after[0] is not None):]
+
+        rows = []
+        try:
+            for not_null in segments:
+                segment_conditions, segment_params = list(conditions), list(params)
+                if not_null:
+                    segment_conditions.append(f"{order_by} IS NOT NULL")
+                    order = f"{order_by} {direction}, rowid {direction}"
+                    if after is not None and after[0] is not None:
+                        value, rowid = after
+                        segment_conditions.append(f"{order_by} {comparison}= ?")
+                        segment_conditions.append(f"({order_by} {comparison} ? OR rowid {comparison} ?)")
+                        segment_params += [value, value, rowid]
+                else:
+                    segment_conditions.append(f"{order_by} IS NULL")
+                    order = f"rowid {direction}"
+                    if after is not None and after[0] is None:
+                        segment_conditions.append(f"rowid {comparison} ?")
+                        segment_params.append(after[1])
+                # 多读一行判断是否还有下一页
+                self.cursor.execute(
+                    f"SELECT rowid, * FROM {self.table_name} WHERE {' AND '.join(segment_conditions)} "
+                    f"ORDER BY {order} LIMIT ?", segment_params + [limit + 1 - len(rows)]
+                )
+                rows += self.cursor.fetchall()
+                if len(rows) > limit:
+                    break
+                # 游标只约束它所在的段，之后的段从头读取
+                after = None
+        except sqlite3.Error as e:
+            st.error(f"查询数据失败: {str(e)}")
+            return pd.DataFrame(columns=self.columns), None
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = dict(zip(["rowid"] + self.columns, rows[-1]))
+            next_cursor = (last[order_by], last["rowid"])
+        return pd.DataFrame([row[1:] for row in rows], columns=self.columns), next_cursor
+
+    def find_keys(self, keyword, columns=None, limit=PICKER_LIMIT):
+        """
+        行选择器的候选行：主键或给定列包含关键字的行（跳过主键为空的行），主键以关键字开头的排在前面
+        :param keyword: 关键字，为空时返回按主键排序的前 limit 行
+        :param columns: 要匹配的列，默认只匹配主键
+        :param limit: 最多返回的行数
+        :return: [(主键值, {列名: 值}), ...]，字典中为 columns 中各列的值
+        """
+        columns = [self.primary_key] + [col for col in (columns or ()) if col != self.primary_key]
+        for column in columns:
+            self._check_column(column)
+        keyword = (keyword or "").strip()
+        select = ', '.join(columns)
+        try:
+            if keyword:
+                conditions = ' OR '.join(f"{col} LIKE ? ESCAPE '\\'" for col in columns)
+                pattern = self._like_pattern(keyword)
+                self.cursor.execute(
+                    f"SELECT {select} FROM {self.table_name} WHERE {self.primary_key} IS NOT NULL AND ({conditions}) "
+                    f"ORDER BY {self.primary_key} NOT LIKE ? ESCAPE '\\', {self.primary_key} LIMIT ?",
+                    [pattern] * len(columns) + [self._like_pattern(keyword, prefix_only=True), limit]
+                )
+            else:
+                self.cursor.execute(
+                    f"SELECT {select} FROM {self.table_name} WHERE {self.primary_key} IS NOT NULL "
+                    f"ORDER BY {self.primary_key} LIMIT ?", (limit,))
+            return [(row[0], dict(zip(columns, row))) for row in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            st.error(f"查找行失败: {str(e)}")
+            return []
+
     def add_row(self, row_data):
         """添加新行"""
         try:
@@ -126,6 +352,317 @@ class GenericDataManager:
             st.error(f"删除行失败: {str(e)}")
             return False
 
+    def export_data(self, target, fmt="csv", batch_size=TableExporter.BATCH_SIZE):
+        """
+        把整张表流式导出为文件，按批读取，内存占用与表的大小无关
+        :param target: 文件路径，或 io.BytesIO 等二进制文件对象
+        :param fmt: 导出格式，csv / parquet / xlsx
+        :param batch_size: 每批读取的行数
+        :return: 导出的行数
+        :raises ValueError: 格式不受支持，或 Parquet 的数值列中出现无法导出的值时
+        """
+        exporter = TableExporter(fmt, batch_size)
+        # 使用单独的游标，导出过程中 self.cursor 仍可用于其他查询
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"SELECT * FROM {self.table_name}")
+            return exporter.export(cursor, target, exporter.column_types(self.conn, self.table_name))
+        finally:
+            cursor.close()
+
+    # —————— 批量写入 ——————
+
+    def _bulk_write(self, items):
+        """
+        在一个事务中执行批量写入：相邻且语句相同的行合并为 executemany，
+        某一块执行出错时回滚该块并逐行重试，只记录失败的行，不中断整批写入
+        :param items: [(行序号, 主键值, SQL语句, 参数元组), ...]，或在事务开始后调用、返回该列表的函数
+                      （写入前需要的查询与写入在同一事务中执行，查询出错时同样回滚并返回带 "error" 的报告）
+        :return: 写入报告 {"succeeded": 成功行数, "failures": [{"index", "key", "error"}, ...]}，
+                 整个事务失败时另有 "error"
+        """
+        report = {"succeeded": 0, "failures": []}
+        try:
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            if callable(items):
+                items = items()
+            for query, group in itertools.groupby(items, key=lambda item: item[2]):
+                group = list(group)
+                for start in range(0, len(group), self.BULK_CHUNK_SIZE):
+                    chunk = group[start:start + self.BULK_CHUNK_SIZE]
+                    self.conn.execute("SAVEPOINT bulk_chunk")
+                    try:
+                        self.conn.executemany(query, [params for _, _, _, params in chunk])
+                        report["succeeded"] += len(chunk)
+                    except sqlite3.Error:
+                        # 出错的语句由 SQLite 自动撤销，逐行重试时其余行仍在同一事务中生效
+                        self.conn.execute("ROLLBACK TO bulk_chunk")
+                        for index, key, _, params in chunk:
+                            try:
+                                self.conn.execute(query, params)
+                                report["succeeded"] += 1
+                            except sqlite3.Error as e:
+                                report["failures"].append({"index": index, "key": key, "error": str(e)})
+                    self.conn.execute("RELEASE bulk_chunk")
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            st.error(f"批量写入失败: {str(e)}")
+            report = {"succeeded": 0, "failures": report["failures"], "error": str(e)}
+        return report
+
+    def _validate_rows(self, rows, require_key):
+        """
+        检查批量写入的行：列名必须属于本表
+        :param rows: 行字典的可迭代对象
+        :param require_key: 是否要求每行包含主键
+        :return: (有效行列表 [(行序号, 行字典)], 失败列表)
+        """
+        valid_rows, failures = [], []
+        for index, row_data in enumerate(rows):
+            row_data = dict(row_data)
+            unknown = [col for col in row_data if col not in self.columns]
+            if unknown:
+                failures.append({"index": index, "key": row_data.get(self.primary_key),
+                                 "error": f"未知的列: {', '.join(map(str, unknown))}"})
+            elif not row_data:
+                failures.append({"index": index, "key": None, "error": "没有要写入的列"})
+            elif require_key and row_data.get(self.primary_key) in (None, ""):
+                failures.append({"index": index, "key": None, "error": f"缺少主键 {self.primary_key}"})
+            else:
+                valid_rows.append((index, row_data))
+        return valid_rows, failures
+
+    def _existing_keys(self, keys):
+        """
+        查询已存在的主键值
+        :param keys: 主键值集合
+        :return: 已存在的主键值集合
+        """
+        keys = list(keys)
+        existing = set()
+        for start in range(0, len(keys), self.BULK_CHUNK_SIZE):
+            chunk = keys[start:start + self.BULK_CHUNK_SIZE]
+            placeholders = ', '.join(['?'] * len(chunk))
+            self.cursor.execute(
+                f"SELECT {self.primary_key} FROM {self.table_name} WHERE {self.primary_key} IN ({placeholders})",
+                chunk
+            )
+            existing.update(row[0] for row in self.cursor.fetchall())
+        return existing
+
+    def _has_conflict_target(self):
+        """
+        检查主键列上是否已有唯一约束（表的主键或只含该列的唯一索引），只检查一次。
+        不会修改表结构：没有唯一约束时 upsert_rows 改为先更新、不存在再插入
+        :return: 是否可以使用 INSERT ... ON CONFLICT
+        """
+        if self._conflict_target_ready is None:
+            ready = False
+            try:
+                # 单列主键（多列主键不能作为单列的冲突目标）
+                key_columns = [col[1] for col in self.conn.execute(f"PRAGMA table_info({self.table_name})") if col[5]]
+                ready = key_columns == [self.primary_key]
+                for index in self.conn.execute(f"PRAGMA index_list({self.table_name})").fetchall():
+                    if index[2]:  # 唯一索引
+                        columns = [info[2] for info in self.conn.execute(f"PRAGMA index_info({index[1]})")]
+                        ready = ready or columns == [self.primary_key]
+            except sqlite3.Error as e:
+                st.error(f"获取索引失败: {str(e)}")
+            self._conflict_target_ready = ready
+        return self._conflict_target_ready
+
+    @staticmethod
+    def _merge_failures(report, failures):
+        """把写入前检查出的失败行并入写入报告，按行序号排列"""
+        report["failures"] = sorted(failures + report["failures"], key=lambda failure: failure["index"])
+        return report
+
+    def add_rows(self, rows):
+        """
+        批量添加行（一个事务）
+        :param rows: 行字典的可迭代对象，每行的列可以不同
+        :return: 写入报告 {"succeeded": 成功行数, "failures": [{"index", "key", "error"}, ...]}
+        """
+        valid_rows, failures = self._validate_rows(rows, require_key=False)
+        items = []
+        for index, row_data in valid_rows:
+            columns = ', '.join(row_data.keys())
+            placeholders = ', '.join(['?'] * len(row_data))
+            query = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders})"
+            items.append((index, row_data.get(self.primary_key), query, tuple(row_data.values())))
+        return self._merge_failures(self._bulk_write(items), failures)
+
+    def upsert_rows(self, rows):
+        """
+        按主键批量新增或更新行（一个事务）：主键不存在时插入，存在时只更新行中给出的列。
+        主键列上已有唯一约束时使用 INSERT ... ON CONFLICT，否则先查出已存在的主键，存在的更新、不存在的插入
+        （不会为此修改表结构，表中允许重复主键时的行为与 update_row 相同）
+        :param rows: 行字典的可迭代对象，每行必须包含主键
+        :return: 写入报告 {"succeeded": 成功行数, "failures": [{"index", "key", "error"}, ...]}
+        """
+        valid_rows, failures = self._validate_rows(rows, require_key=True)
+        items = []
+        unchanged = 0  # 只给出主键且已存在的行，无需写入
+        if self._has_conflict_target():
+            for index, row_data in valid_rows:
+                columns = ', '.join(row_data.keys())
+                placeholders = ', '.join(['?'] * len(row_data))
+                updates = [f"{col} = excluded.{col}" for col in row_data if col != self.primary_key]
+                query = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders}) ON CONFLICT ({self.primary_key}) "
+                query += f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+                items.append((index, row_data[self.primary_key], query, tuple(row_data.values())))
+        else:
+            def plan():
+                nonlocal unchanged
+                planned = []
+                existing = self._existing_keys({row_data[self.primary_key] for _, row_data in valid_rows})
+                for index, row_data in valid_rows:
+                    key = row_data[self.primary_key]
+                    if key in existing:
+                        new_data = {col: value for col, value in row_data.items() if col != self.primary_key}
+                        if not new_data:
+                            unchanged += 1
+                            continue
+                        set_clause = ', '.join([f"{col} = ?" for col in new_data])
+                        query = f"UPDATE {self.table_name} SET {set_clause} WHERE {self.primary_key} = ?"
+                        planned.append((index, key, query, tuple(new_data.values()) + (key,)))
+                    else:
+                        # 同一批中重复出现的新主键，第二次起按更新处理
+                        existing.add(key)
+                        columns = ', '.join(row_data.keys())
+                        placeholders = ', '.join(['?'] * len(row_data))
+                        query = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders})"
+                        planned.append((index, key, query, tuple(row_data.values())))
+                return planned
+
+            # 已存在的主键在写入事务中查询
+            items = plan
+        report = self._bulk_write(items)
+        if "error" not in report:
+            report["succeeded"] += unchanged
+        return self._merge_failures(report, failures)
+
+    def delete_rows(self, row_ids):
+        """
+        按主键批量删除行（一个事务），不存在的主键记为失败
+        :param row_ids: 主键值的可迭代对象
+        :return: 写入报告 {"succeeded": 成功行数, "failures": [{"index", "key", "error"}, ...]}
+        """
+        row_ids = list(row_ids)
+        failures = []
+
+        def plan():
+            existing = self._existing_keys(set(row_ids))
+            items = []
+            query = f"DELETE FROM {self.table_name} WHERE {self.primary_key} = ?"
+            for index, row_id in enumerate(row_ids):
+                if row_id in existing:
+                    items.append((index, row_id, query, (row_id,)))
+                else:
+                    failures.append({"index": index, "key": row_id, "error": "主键不存在"})
+            return items
+
+        return self._merge_failures(self._bulk_write(plan), failures)
+
+    # —————— 表格编辑 ——————
+
+    @staticmethod
+    def _cell_value(value):
+        """表格单元格的值转换为写入数据库的值：空单元格（None、NaN、空字符串）为None，numpy 标量转换为 Python 值"""
+        if pd.isna(value) or (isinstance(value, str) and value == ""):
+            return None
+        return value.item() if isinstance(value, np.generic) else value
+
+    def editor_changes(self, original, editor_state):
+        """
+        根据 st.data_editor 记录的编辑状态整理出表格的改动。编辑状态中的行号是行在 original 中的位置，
+        修改、新增和删除分开记录，因此删除末尾几行后再新增的行不会被当成对已删除行的修改
+        :param original: 传给 st.data_editor 的 DataFrame，列为本表的列
+        :param editor_state: 编辑器的状态 st.session_state[key]，
+                             {"edited_rows": {位置: {列名: 新值}}, "added_rows": [{列名: 值}], "deleted_rows": [位置]}
+        :return: {"updates": [(原主键值, {列名: 新值})], "inserts": [行字典], "deletes": [主键值]}，
+                 空单元格之间视为相同，只有值改变的单元格出现在 updates 中；已删除行上的修改被忽略
+        """
+        columns = [col for col in self.columns if col in original.columns]
+        deleted = sorted(set(editor_state.get("deleted_rows", [])))
+
+        updates = []
+        for position, cells in sorted((int(position), cells)
+                                      for position, cells in editor_state.get("edited_rows", {}).items()):
+            if position in deleted:
+                continue
+            changed = {}
+            for col, value in cells.items():
+                value = self._cell_value(value)
+                if col in columns and value != self._cell_value(original.iat[position, original.columns.get_loc(col)]):
+                    changed[col] = value
+            if changed:
+                updates.append((self._cell_value(original.iat[position, original.columns.get_loc(self.primary_key)]),
+                                changed))
+
+        inserts = []
+        for row_data in editor_state.get("added_rows", []):
+            row_data = {col: self._cell_value(value) for col, value in row_data.items() if col in columns}
+            if any(value is not None for value in row_data.values()):
+                inserts.append({col: value for col, value in row_data.items() if value is not None})
+
+        deletes = [self._cell_value(original.iat[position, original.columns.get_loc(self.primary_key)])
+                   for position in deleted]
+        return {"updates": updates, "inserts": inserts, "deletes": deletes}
+
+    def apply_changes(self, updates=(), inserts=(), deletes=()):
+        """
+        在一个事务中写入表格编辑的改动：先删除、再更新、最后新增，
+        更新只写入改变的列（改动列相同的行合并为一次 executemany）
+        :param updates: [(原主键值, {列名: 新值})]，见 editor_changes
+        :param inserts: [行字典]
+        :param deletes: [主键值]
+        :return: 写入报告 {"succeeded": 成功行数, "failures": [{"index", "key", "error"}, ...]}，
+                 index 为改动在 删除、更新、新增 依次排列中的序号；整个事务失败时另有 "error"
+        """
+        deletes, updates, inserts = list(deletes), list(updates), list(inserts)
+        items, failures = [], []
+        # 主键为空的行无法用主键定位（WHERE 主键 = NULL 不匹配任何行），报告为失败而不是静默跳过
+        missing_key = {"key": None, "error": f"主键 {self.primary_key} 为空，无法定位该行"}
+        for index, row_id in enumerate(deletes):
+            if row_id is None:
+                failures.append({"index": index, **missing_key})
+                continue
+            items.append((index, row_id, f"DELETE FROM {self.table_name} WHERE {self.primary_key} = ?", (row_id,)))
+
+        offset = len(deletes)
+        changed_rows, update_failures = self._validate_rows((cells for _, cells in updates), require_key=False)
+        failures += [{**failure, "index": offset + failure["index"], "key": updates[failure["index"]][0]}
+                     for failure in update_failures]
+        update_items = []
+        for index, cells in changed_rows:
+            if updates[index][0] is None:
+                failures.append({"index": offset + index, **missing_key})
+                continue
+            columns = [col for col in self.columns if col in cells]
+            set_clause = ', '.join(f"{col} = ?" for col in columns)
+            update_items.append((offset + index, updates[index][0],
+                                 f"UPDATE {self.table_name} SET {set_clause} WHERE {self.primary_key} = ?",
+                                 tuple(cells[col] for col in columns) + (updates[index][0],)))
+        # 按语句排序，改动列相同的行相邻，可以合并执行
+        items += sorted(update_items, key=lambda item: item[2])
+
+        offset += len(updates)
+        new_rows, insert_failures = self._validate_rows(inserts, require_key=True)
+        failures += [{**failure, "index": offset + failure["index"]} for failure in insert_failures]
+        for index, row_data in new_rows:
+            columns = [col for col in self.columns if col in row_data]
+            placeholders = ', '.join(['?'] * len(columns))
+            items.append((offset + index, row_data[self.primary_key],
+                          f"INSERT INTO {self.table_name} ({', '.join(columns)}) VALUES ({placeholders})",
+                          tuple(row_data[col] for col in columns)))
+
+        if not items:
+            return {"succeeded": 0, "failures": failures}
+        return self._merge_failures(self._bulk_write(items), failures)
+
     def close(self):
         """关闭数据库连接"""
         if self.conn:
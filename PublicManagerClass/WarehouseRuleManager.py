@@ -1,81 +1,504 @@
+import bisect
+import collections
 import datetime
+import functools
+import os
 import re  # 确保导入 re 模块
 import sqlite3
+import sys
+import threading
+import time
+import types
 import pandas as pd
 
+from PublicManagerClass.FlowPrefixTrie import FlowPrefixTrie
+from PublicManagerClass.FlowSearchIndex import FlowSearchIndex
+
+# 一周按分钟编码：星期一 00:00 为第 0 分钟，星期日 23:59 为第 10079 分钟
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+FULL_WEEK_MASK = (1 << MINUTES_PER_WEEK) - 1
+
+# 一天内每分钟对应的 "HHMM" 字符串（按字典序递增），用于复现原规则中的字符串时间比较
+_HHMM_OF_DAY = [f"{minute // 60:02d}{minute % 60:02d}" for minute in range(MINUTES_PER_DAY)]
+
+
+# 触发器维护的变更日志：warehouse_management 的每次增删改都追加 (序号, 代码, 操作) 一行
+CHANGE_LOG_TABLE = "warehouse_management_changes"
+CHANGE_LOG_DDL = f"""
+CREATE TABLE IF NOT EXISTS {CHANGE_LOG_TABLE} (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    代码 TEXT,
+    op TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS warehouse_management_log_insert AFTER INSERT ON warehouse_management
+BEGIN
+    INSERT INTO {CHANGE_LOG_TABLE} (代码, op) VALUES (NEW.代码, 'I');
+END;
+CREATE TRIGGER IF NOT EXISTS warehouse_management_log_update AFTER UPDATE ON warehouse_management
+BEGIN
+    INSERT INTO {CHANGE_LOG_TABLE} (代码, op) VALUES (OLD.代码, 'U');
+    INSERT INTO {CHANGE_LOG_TABLE} (代码, op) SELECT NEW.代码, 'U' WHERE NEW.代码 IS NOT OLD.代码;
+END;
+CREATE TRIGGER IF NOT EXISTS warehouse_management_log_delete AFTER DELETE ON warehouse_management
+BEGIN
+    INSERT INTO {CHANGE_LOG_TABLE} (代码, op) VALUES (OLD.代码, 'D');
+END;
+"""
+
+
+def minute_of_week(current_time):
+    """
+    将时间转换为周内分钟序号
+    :param current_time: datetime.datetime 对象
+    :return: 0 ~ 10079 之间的整数
+    """
+    return current_time.weekday() * MINUTES_PER_DAY + current_time.hour * 60 + current_time.minute
+
+
+def local_time(current_time):
+    """
+    把带时区的时间转换为本地时区的无时区时间（规则按仓库本地时间编写），无时区的时间原样返回。
+    查询入口统一转换后，缓存中的有效期与查询时间始终可以比较
+    :param current_time: datetime.datetime 对象
+    :return: 无时区的 datetime.datetime 对象
+    """
+    if current_time.tzinfo is not None and current_time.utcoffset() is not None:
+        return current_time.astimezone().replace(tzinfo=None)
+    return current_time
+
+
+@functools.lru_cache(maxsize=None)
+def compile_time_rule(rule_str):
+    """
+    将时间规则字符串编译为周内分钟位图（按规则文本缓存，相同文本返回同一对象）。
+    语义与 WarehouseRuleManager.parse_time_rule 完全一致：
+    第 n 位为 1 表示周内第 n 分钟规则生效。
+    :param rule_str: 规则字符串，如 "7:0600or1-7:1230"
+    :return: 位图整数
+    :raises ValueError: 星期部分无法解析时
+    """
+    if rule_str == "all":
+        return FULL_WEEK_MASK
+
+    mask = 0
+    # 处理'or'连接的条件
+    for condition in rule_str.split('or'):
+        and_mask = FULL_WEEK_MASK
+
+        # 处理'and'连接的条件
+        for and_cond in condition.split('and'):
+            if ':' not in and_cond:
+                continue
+
+            weekday_part, time_part = and_cond.split(':', 1)
+            target_time = time_part.strip()
+
+            if '-' in weekday_part:
+                start_day, end_day = map(int, weekday_part.split('-'))
+            else:
+                start_day = end_day = int(weekday_part)
+
+            # 当天 "HHMM" <= target_time 的分钟构成从 00:00 开始的连续区间
+            day_mask = (1 << bisect.bisect_right(_HHMM_OF_DAY, target_time)) - 1
+            cond_mask = 0
+            for day in range(max(start_day, 1), min(end_day, 7) + 1):
+                cond_mask |= day_mask << ((day - 1) * MINUTES_PER_DAY)
+
+            and_mask &= cond_mask
+
+        mask |= and_mask
+
+    return mask
+
+
+_TIME_CONDITION = re.compile(r"([1-7])(?:-([1-7]))?:(\d{4})")
+
+
+def check_time_rule(rule_str):
+    """
+    检查时间规则的写法："all"，或由 or / and 连接的 "星期[-星期]:HHMM" 条件（星期为 1~7）。
+    compile_time_rule 会跳过无法识别的条件，导入和编辑规则时先用本函数检查。
+    :param rule_str: 规则字符串
+    :raises ValueError: 写法无效时，异常信息说明原因
+    """
+    if rule_str == "all":
+        return
+    if not rule_str:
+        raise ValueError("时间规则为空")
+    for condition in rule_str.split('or'):
+        for and_cond in condition.split('and'):
+            match = _TIME_CONDITION.fullmatch(and_cond.strip())
+            if not match:
+                raise ValueError(f"无法识别的条件 '{and_cond}'，应为 星期[-星期]:HHMM，如 1-7:1230")
+            start_day, end_day, target_time = match.groups()
+            if end_day and int(end_day) < int(start_day):
+                raise ValueError(f"条件 '{and_cond}' 的星期区间起点大于终点")
+            if int(target_time[:2]) > 23 or int(target_time[2:]) > 59:
+                raise ValueError(f"条件 '{and_cond}' 的时间 {target_time} 无效")
+
+
+def _mask_transitions(mask):
+    """
+    找出位图中生效状态发生变化的分钟（第 m 位与第 m-1 位不同）
+    :param mask: 周内分钟位图
+    :return: 变化点分钟序号的生成器
+    """
+    changes = (mask ^ (mask << 1)) & FULL_WEEK_MASK
+    while changes:
+        lowest = changes & -changes
+        yield lowest.bit_length() - 1
+        changes ^= lowest
+
+
+@functools.lru_cache(maxsize=None)
+def compile_weekly_schedule(masks):
+    """
+    将一组位置规则的位图合并为周时段表（按位图组合缓存，相同组合共用同一张表）。
+    时段表由两个等长元组组成：boundaries[i] 为第 i 个时段的起始分钟，
+    active[i] 为该时段内生效的位置规则下标。
+    :param masks: 各位置规则位图组成的元组
+    :return: (boundaries, active) 二元组
+    """
+    boundaries = sorted({0}.union(*(_mask_transitions(mask) for mask in masks)))
+    active = tuple(
+        tuple(index for index, mask in enumerate(masks) if (mask >> boundary) & 1)
+        for boundary in boundaries
+    )
+    return tuple(boundaries), active
+
+
+def schedule_window(schedule, current_minute):
+    """
+    找出周时段表中当前分钟所在的不变区间：区间内生效的位置规则集合保持不变。
+    相邻时段的生效集合必然不同，只有第 0 个时段可能与上周最后一个时段相同（区间跨周）。
+    :param schedule: compile_weekly_schedule 返回的周时段表
+    :param current_minute: 当前周内分钟序号
+    :return: (距区间开始的分钟数, 距区间结束的分钟数) 二元组，整周都不变时返回None
+    """
+    boundaries, active = schedule
+    changes = boundaries if active[0] != active[-1] else boundaries[1:]
+    if not changes:
+        return None
+    position = bisect.bisect_right(changes, current_minute)
+    start = changes[position - 1] if position else changes[-1] - MINUTES_PER_WEEK
+    end = changes[position] if position < len(changes) else changes[0] + MINUTES_PER_WEEK
+    return current_minute - start, end - current_minute
+
+
+def _intern(text):
+    """驻留字符串，使大量重复的位置、规则文本共用同一个对象"""
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+class _Record:
+    """
+    紧凑记录的基类：字段存放在 __slots__ 中，
+    同时保留原字典写法（record["name"]、record.get("挂靠流向")），已有调用方无需修改。
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def _fields(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self):
+        return hash(self._fields())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__)})"
+
+
+class LocationRule(_Record):
+    """位置规则记录：物理位置、适用时间规则文本及其预编译位图（无法编译时为None）"""
+    __slots__ = ("location", "rule", "mask")
+
+    def __init__(self, location, rule, mask):
+        self.location = location
+        self.rule = rule
+        self.mask = mask
+
+
+class RuleRecord(_Record):
+    """流向规则记录：映射、流向名称、位置规则元组和挂靠映射码"""
+    __slots__ = ("mapping", "name", "location_rules", "挂靠流向")
+
+    def __init__(self, mapping, name, location_rules, attached_mapping):
+        self.mapping = mapping
+        self.name = name
+        self.location_rules = location_rules
+        self.挂靠流向 = attached_mapping
+
+
+class RuleSnapshot:
+    """
+    规则缓存快照：规则字典与全部派生索引一起构建，发布后不再修改。
+    新规则总是先构建为新快照，再通过一次引用赋值整体替换，读取方拿到的快照始终前后一致。
+    """
+
+    def __init__(self, version, warehouse_rules, mapping_index, flow_index, duplicate_mappings, attached_index,
+                 attachment_closure, load_report, weekly_schedules, search_index, code_positions):
+        self.version = version  # 快照版本号，每发布一个新快照递增
+        self.warehouse_rules = warehouse_rules  # 代码 -> 规则
+        self.mapping_index = mapping_index  # 映射 -> [代码]（按表中顺序）
+        self.flow_index = flow_index  # 流向 -> [代码]（按表中顺序）
+        self.duplicate_mappings = duplicate_mappings  # 被多个代码共用的映射 -> [代码]
+        self.attached_index = attached_index  # 挂靠映射 -> [挂靠到该映射的代码]
+        self.attachment_closure = attachment_closure  # 有挂靠的代码 -> 最终代码
+        self.load_report = load_report  # 构建时发现的问题（重复映射、循环挂靠、无效挂靠）
+        self.weekly_schedules = weekly_schedules  # 代码 -> 周时段表（仅在 precompute_schedule 模式下构建）
+        self.search_index = search_index  # 代码/流向/映射 的子串搜索索引，首次搜索时才构建（见 get_search_index）
+        self._search_index_lock = threading.Lock()
+        self.code_positions = code_positions  # 代码 -> 第一行的 rowid，增量刷新时用于保持表中顺序
+        self.prefix_trie = None  # 前缀补全索引，发布后在发布线程中构建（未开启 prefix_completion 时首次补全时构建）
+        self.load_time = datetime.datetime.now()
+        self._created_at = time.monotonic()
+
+    @property
+    def age(self):
+        """快照构建至今的秒数"""
+        return time.monotonic() - self._created_at
+
+    def get_search_index(self, pinyin=False):
+        """
+        取得本快照的搜索索引，尚未构建时构建（同一快照只构建一次，并发调用等待同一次构建）
+        :param pinyin: 构建时是否建立拼音索引
+        :return: FlowSearchIndex
+        """
+        search_index = self.search_index
+        if search_index is None:
+            with self._search_index_lock:
+                search_index = self.search_index
+                if search_index is None:
+                    search_index = self.search_index = FlowSearchIndex(self.warehouse_rules, version=self.version,
+                                                                                  pinyin=pinyin)
+        return search_index
+
+    def derive(self, version):
+        """
+        复制出用于增量修补的新快照：字典浅拷贝，搜索索引（已构建时）写时复制，修补新快照不会影响本快照
+        :param version: 新快照的版本号
+        :return: RuleSnapshot
+        """
+        load_report = {
+            "duplicate_mappings": self.load_report["duplicate_mappings"],
+            "cycles": list(self.load_report["cycles"]),
+            "dangling": dict(self.load_report["dangling"])
+        }
+        return RuleSnapshot(version, dict(self.warehouse_rules), dict(self.mapping_index), dict(self.flow_index),
+                            dict(self.duplicate_mappings), dict(self.attached_index), dict(self.attachment_closure),
+                            load_report, dict(self.weekly_schedules),
+                            self.search_index.copy() if self.search_index is not None else None,
+                            dict(self.code_positions))
+
+
+def _snapshot_property(name, empty=None):
+    """
+    把当前快照的属性暴露为管理器的只读属性
+    :param name: 快照属性名
+    :param empty: 尚未加载时返回的默认值的工厂函数
+    :return: property
+    """
+    def getter(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return empty() if empty else None
+        return getattr(snapshot, name)
+    return property(getter, doc=f"当前快照的 {name}（只读）")
+
 
 class WarehouseRuleManager:
-    def __init__(self, db_path='announcements.db'):
+    # 单次变更涉及的代码超过该比例时直接全量重新加载
+    INCREMENTAL_MAX_RATIO = 0.2
+    # 变更日志保留的最近条数，更早的记录由 prune_change_log 清理
+    CHANGE_LOG_KEEP = 10000
+    # 查询结果缓存的最大条目数，超过后淘汰最久未使用的条目
+    RESULT_CACHE_SIZE = 10000
+
+    def __init__(self, db_path='announcements.db', precompute_schedule=False, reload_check_interval=1.0,
+                 incremental_refresh=True, background_refresh=True, snapshot_file=None, result_cache=True,
+                 report_stream=None, prefix_completion=False, build_search_index=False, pinyin_search=False):
         """
         初始化仓库规则管理器
         :param db_path: SQLite数据库文件路径
+        :param precompute_schedule: 是否在加载时为每个代码预计算周时段表，查询时改为二分查找
+        :param reload_check_interval: 查询前检查数据库是否变化的最短间隔（秒），None 表示不自动重新加载
+        :param incremental_refresh: 数据库中已安装变更日志（见 ensure_change_log）时，是否只刷新变化的代码；
+                                    未安装时始终全量重新加载。加载和刷新从不修改数据库结构
+        :param background_refresh: 查询时是否在后台线程检查更新并构建新快照（查询不等待数据库）；
+                                   为False时在查询线程中同步检查
+        :param snapshot_file: 编译规则表文件路径。每次发布快照后写入该文件；新进程冷启动时，
+                              若文件与数据库当前版本一致，则在后台加载完成前直接从内存映射的文件回答查询
+        :param result_cache: 是否缓存单个代码的查询结果。结果按 (代码, 规则版本) 缓存，
+                             在该代码生效位置下一次变化之前的查询直接返回缓存
+        :param report_stream: 加载报告和警告的输出流，默认为标准输出；
+                              首次加载和之后的后台、增量刷新都写到这里
+        :param prefix_completion: 是否在每次发布快照后由发布线程（通常是后台刷新线程）构建前缀补全索引。
+                                  构建完成前补全使用上一版本的索引，输入时的补全查询不会等待构建；
+                                  为False时在首次补全时于查询线程中构建
+        :param build_search_index: 是否在每次发布快照后由发布线程构建搜索索引（开启 prefix_completion 时总会构建）；
+                                   为False时在首次搜索时构建，从不搜索的调用方（如扫描流水线、回放、共享内存发布）不承担构建开销
+        :param pinyin_search: 搜索和补全是否支持流向名称的拼音（全拼或首字母），需要安装 pypinyin
         """
         self.db_path = db_path
-        self.warehouse_rules = None
-        self.last_load_time = None
+        self.precompute_schedule = precompute_schedule
+        self.reload_check_interval = reload_check_interval
+        self.incremental_refresh = incremental_refresh
+        self.background_refresh = background_refresh
+        self.snapshot_file = snapshot_file
+        self._mapped_table = None  # 冷启动期间使用的内存映射规则表
+        self._mapped_table_checked = False
+        self._snapshot = None  # 当前发布的规则快照，只整体替换、从不就地修改
+        self._next_version = 1  # 下一个快照的版本号
+        self.last_refresh_error = None  # 最近一次加载或刷新失败的原因，成功后清空
+        # 变更检测：常驻连接上的 PRAGMA data_version 加数据库文件指纹
+        self._version_conn = None
+        self._data_signal = None  # 当前快照对应的版本信号
+        self._last_check_time = 0.0
+        self._build_lock = threading.Lock()  # 同一时间只构建一个快照
+        self._refresh_thread = None
+        # 增量刷新：已应用到的变更日志序号
+        self._change_seq = None
+        self._publish_listeners = []  # 每次发布新快照后调用的回调
+        self.result_cache = result_cache
+        # (代码, 规则版本) -> (结果, 有效期开始, 有效期结束)，有效期两端为None表示不受限，按最近使用排序
+        self._result_cache = collections.OrderedDict()
+        self._result_cache_version = None
+        self.report_stream = report_stream
+        self.prefix_completion = prefix_completion
+        self.build_search_index = build_search_index
+        self.pinyin_search = pinyin_search
+        if pinyin_search and not FlowSearchIndex.PINYIN_AVAILABLE:
+            print("警告: 未安装 pypinyin，流向搜索和输入提示不支持拼音", file=report_stream)
+        self._prefix_trie = None  # 最近构建完成的前缀补全索引
+
+    # 当前快照的只读视图，尚未加载时 warehouse_rules 为None、各索引为空
+    warehouse_rules = _snapshot_property("warehouse_rules")
+    last_load_time = _snapshot_property("load_time")
+    rule_version = _snapshot_property("version", int)
+    mapping_index = _snapshot_property("mapping_index", dict)
+    flow_index = _snapshot_property("flow_index", dict)
+    duplicate_mappings = _snapshot_property("duplicate_mappings", dict)
+    attached_index = _snapshot_property("attached_index", dict)
+    attachment_closure = _snapshot_property("attachment_closure", dict)
+    load_report = _snapshot_property("load_report", dict)
+    weekly_schedules = _snapshot_property("weekly_schedules", dict)
+    search_index = _snapshot_property("search_index")
+    snapshot_age = _snapshot_property("age")
+
+    @property
+    def snapshot(self):
+        """当前发布的规则快照（尚未加载时为None）"""
+        return self._snapshot
+
+    @property
+    def snapshot_version(self):
+        """当前快照的版本号（尚未加载时为0）"""
+        return self.rule_version
+
+    def _current_snapshot(self):
+        """
+        取得一次查询使用的快照。已有快照时立即返回（必要时在后台检查更新），只有冷启动时才同步加载
+        :return: RuleSnapshot，加载失败时为None
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.load_rules_from_database()
+            return self._snapshot
 
-    def search_flows(self, query):
+        if self.background_refresh:
+            self.refresh_in_background()
+        elif self.reload_if_changed():
+            snapshot = self._snapshot
+        return snapshot
+
+    def search_flows(self, query, limit=FlowSearchIndex.SEARCH_LIMIT):
         """
-        根据查询字符串搜索流向（模糊搜索）
+        根据查询字符串搜索流向（模糊搜索，使用 n-gram 倒排索引，索引在首次搜索时构建）
         :param query: 查询字符串
-        :return: 匹配的流向列表
+        :param limit: 最多返回的条数（按表中顺序取前若干条），None 表示不限
+        :return: 匹配的流向列表，每项的 highlights 字段为 code/name/mapping 的高亮区间；
+                 开启 pinyin_search 时，仅通过流向名称拼音（全拼或首字母）命中的结果匹配类型为"拼音"
         """
         # 确保规则已加载
-        if self.warehouse_rules is None:
-            self.warehouse_rules = self.load_rules_from_database()  # 修复：赋值给 self.warehouse_rules
+        snapshot = self._current_snapshot()
 
-        results = []
+        # 加载失败时没有可用的索引
+        if snapshot is None:
+            return []
 
-        # 如果查询为空，返回空结果
-        if not query:
-            return results
-
-        # 转换为小写以便不区分大小写搜索
-        query_lower = query.lower()
-
-        for code, rule_info in self.warehouse_rules.items():
-            # 检查代码是否匹配
-            if query_lower in code.lower():
-                results.append({
-                    "type": "代码",
-                    "code": code,
-                    "name": rule_info['name'],
-                    "mapping": rule_info['mapping']
-                })
-                continue
+        return snapshot.get_search_index(self.pinyin_search).search(query, limit)
 
-            # 检查流向名称是否匹配
-            if query_lower in rule_info['name'].lower():
-                results.append({
-                    "type": "流向",
-                    "code": code,
-                    "name": rule_info['name'],
-                    "mapping": rule_info['mapping']
-                })
-                continue
-
-            # 检查映射是否匹配
-            if query_lower in rule_info['mapping'].lower():
-                results.append({
-                    "type": "映射",
-                    "code": code,
-                    "name": rule_info['name'],
-                    "mapping": rule_info['mapping']
-                })
+    def did_you_mean(self, query, limit=5):
+        """
+        近似查找代码和映射（如把 574TLJ 纠正为 574TJL），用于精确和子串搜索都没有结果时提示
+        :param query: 查询字符串
+        :param limit: 最多返回的条数
+        :return: 近似匹配列表，按编辑距离排列，每项的 distance 为编辑距离
+        """
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return []
+        return snapshot.get_search_index(self.pinyin_search).similar(query, limit)
 
-        return results
+    def complete_flows(self, prefix, limit=FlowPrefixTrie.TOP_K):
+        """
+        输入时的前缀补全：按 代码、流向、映射、流向名称拼音 的前缀给出排名最高的候选
+        :param prefix: 已输入的前缀
+        :param limit: 最多返回的候选数
+        :return: 补全列表，每项包含补全类型 type 以及 code、name、mapping
+        """
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return []
+
+        trie = snapshot.prefix_trie
+        if trie is None and self.prefix_completion and self._prefix_trie is not None:
+            # 新快照的补全索引正在发布线程中构建，暂用上一版本的索引
+            trie = self._prefix_trie
+        if trie is None:
+            # 每个规则版本只构建一次，并发构建时以后完成的为准，结果相同
+            trie = snapshot.prefix_trie = FlowPrefixTrie(snapshot.get_search_index(self.pinyin_search))
+        return trie.complete(prefix, limit)
 
     @staticmethod
-    def highlight_match(text, query):
+    def highlight_match(text, query, spans=None):
         """
         高亮显示匹配的文本部分
         :param text: 原始文本
         :param query: 查询字符串
+        :param spans: search_flows 结果中附带的高亮区间，提供时直接按区间拼接
         :return: 带有高亮标记的HTML文本
         """
         if not query:
             return text
 
+        if spans is not None:
+            parts = []
+            last_end = 0
+            for start, end in spans:
+                parts.append(text[last_end:start])
+                parts.append(f'<span class="suggestion-highlight">{text[start:end]}</span>')
+                last_end = end
+            parts.append(text[last_end:])
+            return "".join(parts)
+
         # 使用正则表达式查找匹配部分（不区分大小写）
         pattern = re.compile(f'({re.escape(query)})', re.IGNORECASE)
         highlighted = pattern.sub(r'<span class="suggestion-highlight">\1</span>', text)
@@ -93,80 +516,656 @@ class WarehouseRuleManager:
             conn.row_factory = sqlite3.Row
             return conn
         except sqlite3.Error as e:
-            print(f"数据库连接失败: {e}")
+            print(f"数据库连接失败: {e}", file=self.report_stream)
             raise
 
+    def _read_data_signal(self):
+        """
+        读取数据库的廉价版本信号：常驻只读连接上的 PRAGMA data_version（其他连接提交后变化），
+        以及数据库文件的 inode、修改时间和大小（整个文件被替换时变化）
+        :return: 版本信号元组，读取失败时返回None
+        """
+        try:
+            if self._version_conn is None:
+                self._version_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            data_version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+            stat = os.stat(self.db_path)
+        except (sqlite3.Error, OSError):
+            return None
+        return data_version, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self, force_check=False):
+        """
+        检查数据库自上次加载后是否有变化，有变化时构建并发布新快照（失败时保留原快照）。
+        检查频率受 reload_check_interval 限制，未到间隔时直接返回，不访问数据库。
+        :param force_check: 是否忽略检查间隔立即检查
+        :return: 是否发布了新快照
+        """
+        if self._snapshot is None or (self.reload_check_interval is None and not force_check):
+            return False
+
+        now = time.monotonic()
+        if not force_check and now - self._last_check_time < self.reload_check_interval:
+            return False
+
+        # 其他线程正在检查或构建快照时不重复执行
+        if not self._build_lock.acquire(blocking=False):
+            return False
+        try:
+            self._last_check_time = now
+            data_signal = self._read_data_signal()
+            if data_signal is None or data_signal == self._data_signal:
+                return False
+            # 同一个数据库文件内的修改优先按变更日志增量刷新
+            same_file = self._data_signal is not None and data_signal[1] == self._data_signal[1]
+            if same_file:
+                refreshed = self._refresh_from_change_log(data_signal)
+                if refreshed is not None:
+                    return refreshed
+            return self._load_snapshot() is not None
+        finally:
+            self._build_lock.release()
+
+    def refresh_in_background(self, force_check=False):
+        """
+        在后台线程检查数据库变化并构建新快照，调用方不等待；尚未加载时在后台完成首次加载。
+        检查频率受 reload_check_interval 限制。
+        :param force_check: 是否忽略检查间隔
+        :return: 是否启动了后台线程
+        """
+        if self.reload_check_interval is None and not force_check and self._snapshot is not None:
+            return False
+
+        now = time.monotonic()
+        if not force_check and now - self._last_check_time < (self.reload_check_interval or 0):
+            return False
+
+        thread = self._refresh_thread
+        if thread is not None and thread.is_alive():
+            return False
+        self._last_check_time = now
+        self._refresh_thread = threading.Thread(target=self._refresh_worker, name="rule-refresh", daemon=True)
+        self._refresh_thread.start()
+        return True
+
+    def _refresh_worker(self):
+        """后台刷新线程：首次加载或检查更新，异常只记录不抛出，原快照继续使用"""
+        try:
+            if self._snapshot is None:
+                self.load_rules_from_database()
+            else:
+                self.reload_if_changed(force_check=True)
+        except Exception as e:
+            self.last_refresh_error = f"{type(e).__name__}: {e}"
+            print(f"后台刷新规则失败，继续使用当前快照: {e}", file=self.report_stream)
+
+    def _publish(self, snapshot, data_signal, change_seq, data_key=None):
+        """
+        发布新快照：一次引用赋值替换整个缓存
+        :param snapshot: 新快照
+        :param data_signal: 构建快照前读取的版本信号
+        :param change_seq: 快照已包含的变更日志序号
+        :param data_key: 构建快照前读取的持久数据键，配置了 snapshot_file 时用于写入编译规则表
+        """
+        self._data_signal = data_signal
+        self._change_seq = change_seq
+        self._next_version = snapshot.version + 1
+        self.last_refresh_error = None
+        self._snapshot = snapshot
+        # 有了完整快照后不再需要冷启动用的规则表（正在使用它的查询持有自己的引用）
+        self._mapped_table = None
+
+        if self.snapshot_file and data_key is not None:
+            # 在函数内导入，避免与 CompiledRuleTable 模块循环导入
+            from PublicManagerClass.CompiledRuleTable import CompiledRuleTable
+            try:
+                CompiledRuleTable.write_file(self.snapshot_file, snapshot, data_key)
+            except OSError as e:
+                print(f"警告: 无法写入编译规则表 {self.snapshot_file}: {e}", file=self.report_stream)
+
+        for listener in list(self._publish_listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"警告: 快照发布回调失败: {e}", file=self.report_stream)
+
+        if self.build_search_index or self.prefix_completion:
+            # 在快照发布之后构建，查询不必等待；构建期间的搜索等待本次构建，补全使用上一版本的索引
+            search_index = snapshot.get_search_index(self.pinyin_search)
+            if self.prefix_completion:
+                snapshot.prefix_trie = self._prefix_trie = FlowPrefixTrie(search_index)
+
+    def add_publish_listener(self, listener):
+        """
+        注册快照发布回调，每次发布新快照后以新快照为参数调用（在发布快照的线程中执行）
+        :param listener: 回调函数 listener(snapshot)
+        """
+        self._publish_listeners.append(listener)
+
+    def remove_publish_listener(self, listener):
+        """
+        移除快照发布回调
+        :param listener: 之前注册的回调函数
+        """
+        if listener in self._publish_listeners:
+            self._publish_listeners.remove(listener)
+
+    def _read_data_key(self):
+        """
+        读取数据库的持久数据键（未配置 snapshot_file 时不读取）
+        :return: 数据键元组或None
+        """
+        if not self.snapshot_file:
+            return None
+        from PublicManagerClass.CompiledRuleTable import database_fingerprint
+        return database_fingerprint(self.db_path)
+
+    def _cold_start_table(self):
+        """
+        冷启动时取得与数据库当前版本一致的内存映射规则表，并确保后台已开始全量加载
+        :return: CompiledRuleTable，没有可用的规则表时返回None
+        """
+        if not (self.snapshot_file and self.background_refresh):
+            return None
+        self.refresh_in_background(force_check=True)
+        if not self._mapped_table_checked:
+            self._mapped_table_checked = True
+            from PublicManagerClass.CompiledRuleTable import CompiledRuleTable
+            self._mapped_table = CompiledRuleTable.open_file(self.snapshot_file, self._read_data_key())
+        return self._mapped_table
+
+    def ensure_change_log(self):
+        """
+        创建变更日志表和 warehouse_management 上的增删改触发器（已存在时不做修改），并清理较早的日志。
+        这是修改数据库结构的一次性安装步骤，需显式调用（或运行本模块时加 --install-change-log），
+        加载规则时不会自动安装；可重复运行以定期清理日志
+        :return: 是否创建成功
+        """
+        conn = None
+        try:
+            conn = self.get_database_connection()
+            conn.executescript(CHANGE_LOG_DDL)
+            self.prune_change_log(conn)
+            return True
+        except sqlite3.Error as e:
+            print(f"无法创建变更日志，将使用全量重新加载: {e}", file=self.report_stream)
+            return False
+        finally:
+            if conn:
+                conn.close()
+
+    @staticmethod
+    def _read_change_seq(conn):
+        """
+        读取变更日志的最大和最小序号
+        :param conn: 数据库连接
+        :return: (最大序号, 最小序号)，日志为空时为 (0, None)，日志表不存在时为 (None, None)
+        """
+        try:
+            max_seq, min_seq = conn.execute(f"SELECT MAX(seq), MIN(seq) FROM {CHANGE_LOG_TABLE}").fetchone()
+        except sqlite3.Error:
+            return None, None
+        return max_seq or 0, min_seq
+
+    def _refresh_from_change_log(self, data_signal):
+        """
+        只重新读取变更日志中上次加载之后发生变化的代码，并就地修补规则和各个派生索引
+        :param data_signal: 本次检查读到的版本信号
+        :return: 是否发布了新快照；为None时无法增量刷新，调用方应全量重新加载
+        """
+        snapshot = self._snapshot
+        if not self.incremental_refresh or self._change_seq is None:
+            return None
+        data_key = self._read_data_key()
+
+        conn = None
+        try:
+            conn = self.get_database_connection()
+            max_seq, min_seq = self._read_change_seq(conn)
+            # 日志表被删除，或所需的日志已被清理
+            if max_seq is None or max_seq < self._change_seq:
+                return None
+            if min_seq is not None and min_seq > self._change_seq + 1 and max_seq > self._change_seq:
+                return None
+
+            changed_codes = {row[0] for row in conn.execute(
+                f"SELECT DISTINCT 代码 FROM {CHANGE_LOG_TABLE} WHERE seq > ? AND seq <= ?",
+                (self._change_seq, max_seq))}
+            if len(changed_codes) > max(100, len(snapshot.warehouse_rules) * self.INCREMENTAL_MAX_RATIO):
+                return None
+
+            # 重新读取变化代码的当前行（代码重复时与全量加载一样以最后一行为准，位置取第一行）
+            new_rules = {}
+            new_positions = {}
+            lookup_codes = [code for code in changed_codes if code is not None]
+            for start in range(0, len(lookup_codes), 500):
+                chunk = lookup_codes[start:start + 500]
+                cursor = conn.execute(
+                    f"SELECT rowid AS _rowid, * FROM warehouse_management "
+                    f"WHERE 代码 IN ({','.join('?' * len(chunk))}) ORDER BY rowid", chunk)
+                columns = self._rule_columns(cursor.description)
+                for row in cursor:
+                    code = row[columns[0]]
+                    new_rules[code] = self._build_rule(row, columns)
+                    new_positions.setdefault(code, row[0])
+
+            # 代码在表中的顺序发生变化（如修改代码、删除重复行）时，增量修补无法保持与全量加载相同的顺序
+            max_position = max(snapshot.code_positions.values(), default=-1)
+            for code, position in new_positions.items():
+                old_position = snapshot.code_positions.get(code)
+                if position != old_position and (old_position is not None or position < max_position):
+                    return None
+
+        except sqlite3.Error as e:
+            print(f"增量刷新失败，将全量重新加载: {e}", file=self.report_stream)
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+        if not changed_codes:
+            # 没有规则变化（如只清理了变更日志），沿用当前快照
+            self._data_signal = data_signal
+            self._change_seq = max_seq
+            return False
+
+        new_snapshot = snapshot.derive(self._next_version)
+        self._patch_rules(new_snapshot, changed_codes, new_rules, new_positions)
+        self._publish(new_snapshot, data_signal, max_seq, data_key)
+        return True
+
+    def prune_change_log(self, conn):
+        """
+        清理较早的变更日志，只保留最近 CHANGE_LOG_KEEP 条（落后更多的进程会回退到全量重新加载）。
+        清理会修改数据库文件，因此不在加载和刷新路径中执行，否则刚写入的编译规则表会立即过期
+        :param conn: 数据库连接
+        :return: 删除的日志条数
+        """
+        max_seq, min_seq = self._read_change_seq(conn)
+        if min_seq is None or min_seq > max_seq - self.CHANGE_LOG_KEEP:
+            return 0
+        with conn:
+            return conn.execute(f"DELETE FROM {CHANGE_LOG_TABLE} WHERE seq <= ?",
+                                (max_seq - self.CHANGE_LOG_KEEP,)).rowcount
+
+    def _patch_rules(self, snapshot, changed_codes, new_rules, new_positions):
+        """
+        用变化代码的新规则修补（尚未发布的）快照：规则字典、映射/流向/挂靠索引、挂靠闭包、周时段表和搜索索引。
+        索引中的代码列表先复制再修改，原快照共用的列表保持不变。
+        :param snapshot: 由当前快照 derive 出的新快照
+        :param changed_codes: 变化的代码集合
+        :param new_rules: 代码 -> 新规则 的字典，已删除的代码不在其中
+        :param new_positions: 代码 -> 在表中的顺序号（rowid）
+        """
+        warehouse_rules = snapshot.warehouse_rules
+        positions = snapshot.code_positions
+        changed_mappings = set()
+
+        def index_remove(index, key, code):
+            codes = index.get(key)
+            if codes and code in codes:
+                codes = [other for other in codes if other != code]
+                if codes:
+                    index[key] = codes
+                else:
+                    del index[key]
+
+        def index_add(index, key, code):
+            if key is not None:
+                codes = list(index.get(key, ()))
+                bisect.insort(codes, code, key=positions.__getitem__)
+                index[key] = codes
+
+        for code in changed_codes:
+            old_rule = warehouse_rules.get(code)
+            new_rule = new_rules.get(code)
+            if old_rule is not None:
+                changed_mappings.add(old_rule['mapping'])
+                index_remove(snapshot.mapping_index, old_rule['mapping'], code)
+                index_remove(snapshot.flow_index, old_rule['name'], code)
+                index_remove(snapshot.attached_index, old_rule.get('挂靠流向') or None, code)
+
+            if new_rule is None:
+                if old_rule is not None:
+                    del warehouse_rules[code]
+                    del positions[code]
+                    snapshot.weekly_schedules.pop(code, None)
+                    if snapshot.search_index is not None:
+                        snapshot.search_index.remove(code)
+                continue
+
+            # 已有代码保持原位置，新代码与全量加载一样排在最后
+            positions[code] = new_positions[code]
+            warehouse_rules[code] = new_rule
+            changed_mappings.add(new_rule['mapping'])
+            index_add(snapshot.mapping_index, new_rule['mapping'], code)
+            index_add(snapshot.flow_index, new_rule['name'], code)
+            index_add(snapshot.attached_index, new_rule.get('挂靠流向') or None, code)
+
+            if self.precompute_schedule:
+                snapshot.weekly_schedules.pop(code, None)
+                snapshot.weekly_schedules.update(self._build_weekly_schedules({code: new_rule}))
+            if snapshot.search_index is not None:
+                snapshot.search_index.upsert(code, new_rule)
+
+        for mapping in changed_mappings:
+            codes = snapshot.mapping_index.get(mapping, ())
+            if len(codes) > 1:
+                snapshot.duplicate_mappings[mapping] = codes
+            else:
+                snapshot.duplicate_mappings.pop(mapping, None)
+
+        self._patch_attachment_closure(snapshot, changed_codes, changed_mappings)
+        if snapshot.search_index is not None:
+            snapshot.search_index.version = snapshot.version
+
+    def _patch_attachment_closure(self, snapshot, changed_codes, changed_mappings):
+        """
+        只重新解析受变化影响的挂靠链：变化的代码、挂靠到变化映射的代码，以及沿挂靠链指向它们的所有上游代码
+        :param snapshot: 正在修补的新快照
+        :param changed_codes: 变化的代码集合
+        :param changed_mappings: 变化前后涉及的映射集合
+        """
+        warehouse_rules = snapshot.warehouse_rules
+        region = set(changed_codes)
+        for mapping in changed_mappings:
+            region.update(snapshot.attached_index.get(mapping, ()))
+
+        # 反向遍历挂靠图：挂靠到某个映射的代码指向该映射的第一个代码
+        pending = list(region)
+        while pending:
+            rule_info = warehouse_rules.get(pending.pop())
+            if rule_info is None:
+                continue
+            upstream = snapshot.attached_index.get(rule_info['mapping'], ())
+            for code in upstream:
+                if code not in region:
+                    region.add(code)
+                    pending.append(code)
+
+        codes = sorted((code for code in region if code in warehouse_rules), key=snapshot.code_positions.__getitem__)
+        closure, cycles, dangling = self._build_attachment_closure(
+            warehouse_rules, snapshot.mapping_index, codes=codes, resolved=snapshot.attachment_closure)
+
+        load_report = snapshot.load_report
+        for code in region:
+            snapshot.attachment_closure.pop(code, None)
+            load_report["dangling"].pop(code, None)
+        snapshot.attachment_closure.update(closure)
+        load_report["dangling"].update(dangling)
+        load_report["cycles"] = [cycle for cycle in load_report["cycles"] if region.isdisjoint(cycle)] + cycles
+        load_report["duplicate_mappings"] = snapshot.duplicate_mappings
+        self._print_load_report({
+            "duplicate_mappings": {mapping: snapshot.duplicate_mappings[mapping]
+                                   for mapping in changed_mappings if mapping in snapshot.duplicate_mappings},
+            "cycles": cycles,
+            "dangling": dangling
+        })
+
+    def close(self):
+        """关闭变更检测使用的常驻连接"""
+        if self._version_conn:
+            self._version_conn.close()
+            self._version_conn = None
+
+    def _build_location_rule(self, location, rule_str):
+        """
+        构建单条位置规则，并预编译其时间规则
+        :param location: 物理位置
+        :param rule_str: 适用时间规则字符串
+        :return: LocationRule 记录
+        """
+        try:
+            mask = compile_time_rule(rule_str)
+        except ValueError as e:
+            # 编译失败时保留原始规则，查询时回退到字符串解析
+            print(f"警告: 时间规则 '{rule_str}' 无法编译: {e}", file=self.report_stream)
+            mask = None
+
+        return LocationRule(_intern(location), _intern(rule_str), mask)
+
+    @staticmethod
+    def _rule_columns(description):
+        """
+        根据查询结果的列描述求出规则相关列的下标
+        :param description: cursor.description
+        :return: (代码, 映射, 流向, 物理位置1, 位置1适用时间, 物理位置2, 位置2适用时间, 挂靠流向) 的列下标，
+                 没有挂靠流向列时最后一项为None
+        """
+        indexes = {column[0]: index for index, column in enumerate(description)}
+        return (indexes['代码'], indexes['映射'], indexes['流向'], indexes['物理位置1'], indexes['位置1适用时间'],
+                indexes['物理位置2'], indexes['位置2适用时间'], indexes.get('挂靠流向'))
+
+    def _build_rule(self, row, columns):
+        """
+        将数据库中的一行转换为规则记录
+        :param row: 行元组（或 sqlite3.Row），按列下标读取
+        :param columns: _rule_columns 求出的列下标
+        :return: RuleRecord 记录
+        """
+        _, mapping_column, name_column, location1_column, rule1_column, \
+            location2_column, rule2_column, attached_column = columns
+
+        # 构建位置规则列表
+        location_rules = []
+
+        # 添加物理位置1的规则（如果存在）
+        if row[location1_column] and row[rule1_column]:
+            location_rules.append(self._build_location_rule(row[location1_column], row[rule1_column]))
+
+        # 添加物理位置2的规则（如果存在）
+        if row[location2_column] and row[rule2_column]:
+            location_rules.append(self._build_location_rule(row[location2_column], row[rule2_column]))
+
+        return RuleRecord(
+            row[mapping_column],
+            _intern(row[name_column]),
+            tuple(location_rules),
+            row[attached_column] if attached_column is not None else None  # 挂靠流向字段
+        )
+
+    def _read_warehouse_rules(self, conn):
+        """
+        逐行读取整张规则表（行以元组形式按列下标读取，不为每行创建字典）
+        :param conn: 数据库连接
+        :return: (代码 -> 规则记录, 代码 -> 第一行的 rowid) 二元组
+        """
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("SELECT rowid AS _rowid, * FROM warehouse_management")
+        columns = self._rule_columns(cursor.description)
+        code_column = columns[0]
+
+        warehouse_rules = {}
+        code_positions = {}  # 代码 -> 第一行的 rowid，增量刷新时用于保持表中顺序
+        for row in cursor:
+            code = row[code_column]
+            warehouse_rules[code] = self._build_rule(row, columns)
+            code_positions.setdefault(code, row[0])
+        return warehouse_rules, code_positions
+
+    @staticmethod
+    def _build_indexes(warehouse_rules):
+        """
+        为规则字典构建映射、流向名称索引
+        :param warehouse_rules: 代码 -> 规则 的字典
+        :return: (映射索引, 流向索引, 重复映射, 挂靠索引) 四元组
+        """
+        mapping_index = {}
+        flow_index = {}
+        attached_index = {}
+
+        for code, rule_info in warehouse_rules.items():
+            if rule_info['mapping'] is not None:
+                mapping_index.setdefault(rule_info['mapping'], []).append(code)
+            if rule_info['name'] is not None:
+                flow_index.setdefault(rule_info['name'], []).append(code)
+            if rule_info.get('挂靠流向'):
+                attached_index.setdefault(rule_info['挂靠流向'], []).append(code)
+
+        duplicate_mappings = {mapping: codes for mapping, codes in mapping_index.items() if len(codes) > 1}
+        return mapping_index, flow_index, duplicate_mappings, attached_index
+
+    @staticmethod
+    def _build_attachment_closure(warehouse_rules, mapping_index, codes=None, resolved=None):
+        """
+        一次性解析整张挂靠图，得到每个挂靠代码的最终代码。
+        结果与逐级递归解析相同：遇到无效映射停在当前代码，遇到循环停在首个重复出现的代码。
+        :param warehouse_rules: 代码 -> 规则 的字典
+        :param mapping_index: 映射 -> [代码] 的索引
+        :param codes: 只解析这些代码（增量刷新时使用），默认解析全部代码
+        :param resolved: 范围外代码已解析的挂靠闭包，挂靠链走出 codes 时直接沿用
+        :return: (挂靠闭包, 循环列表, 无效挂靠) 三元组
+        """
+        if codes is None:
+            codes = warehouse_rules
+        in_scope = codes if resolved is None else set(codes)
+
+        # 挂靠图的边：代码 -> 挂靠映射码对应的第一个代码
+        targets = {}
+        dangling = {}
+        for code in codes:
+            attached_mapping = warehouse_rules[code].get('挂靠流向')
+            if not attached_mapping:
+                continue
+            attached_codes = mapping_index.get(attached_mapping)
+            if attached_codes:
+                targets[code] = attached_codes[0]
+            else:
+                dangling[code] = attached_mapping
+
+        final_codes = {}
+        on_path = set()
+        cycles = []
+
+        for start in targets:
+            if start in final_codes:
+                continue
+
+            # 沿挂靠链前进，直到遇到已解析的代码、链的终点或当前路径上的代码
+            path = []
+            node = start
+            while node in targets and node not in final_codes and node not in on_path:
+                on_path.add(node)
+                path.append(node)
+                node = targets[node]
+
+            if node in on_path:
+                # 环上的每个代码都解析为自身
+                cycle = path[path.index(node):]
+                cycles.append(cycle)
+                for cycle_code in cycle:
+                    final_codes[cycle_code] = cycle_code
+            elif node not in final_codes:
+                final_codes[node] = node if node in in_scope else resolved.get(node, node)
+
+            # 反向回填路径上其余代码
+            for path_code in reversed(path):
+                if path_code not in final_codes:
+                    final_codes[path_code] = final_codes[targets[path_code]]
+            on_path.clear()
+
+        attachment_closure = {code: final_codes.get(code, code) for code in targets}
+        attachment_closure.update((code, code) for code in dangling)
+        return attachment_closure, cycles, dangling
+
+    @staticmethod
+    def _build_weekly_schedules(warehouse_rules):
+        """
+        为每个代码构建周时段表
+        :param warehouse_rules: 代码 -> 规则 的字典
+        :return: 代码 -> 周时段表 的字典（含无法编译规则的代码不参与预计算）
+        """
+        weekly_schedules = {}
+        for code, rule_info in warehouse_rules.items():
+            schedule = WarehouseRuleManager._rule_schedule(rule_info)
+            if schedule is not None:
+                weekly_schedules[code] = schedule
+        return weekly_schedules
+
+    def _print_load_report(self, load_report):
+        """
+        输出加载时发现的数据问题
+        :param load_report: 加载报告字典
+        """
+        for mapping, codes in load_report["duplicate_mappings"].items():
+            print(f"警告: 映射码 {mapping} 被多个流向共用: {', '.join(codes)}（按映射查找时返回 {codes[0]}）",
+                  file=self.report_stream)
+        for cycle in load_report["cycles"]:
+            print(f"警告: 检测到循环挂靠: {' -> '.join(cycle)} -> {cycle[0]}", file=self.report_stream)
+        for code, attached_mapping in load_report["dangling"].items():
+            print(f"警告: 流向 {code} 的挂靠映射码 {attached_mapping} 找不到对应的流向", file=self.report_stream)
+
     def load_rules_from_database(self, force_reload=False):
         """
-        从数据库加载规则数据并转换为字典格式
+        从数据库加载规则数据并转换为字典格式，构建完成后作为新快照整体发布
         :param force_reload: 是否强制重新加载数据
-        :return: 规则字典
+        :return: 规则字典（加载失败时返回原快照的规则，没有原快照时返回空字典）
         """
         # 如果已经加载过且不需要强制重新加载，则直接返回缓存
-        if self.warehouse_rules is not None and not force_reload:
-            return self.warehouse_rules
+        snapshot = self._snapshot
+        if snapshot is not None and not force_reload:
+            return snapshot.warehouse_rules
 
-        warehouse_rules = {}
+        with self._build_lock:
+            # 等待期间其他线程可能已经完成了首次加载
+            if self._snapshot is not None and not force_reload:
+                return self._snapshot.warehouse_rules
+            snapshot = self._load_snapshot() or self._snapshot
+
+        return snapshot.warehouse_rules if snapshot is not None else {}
+
+    def _load_snapshot(self):
+        """
+        全量读取规则表并构建、发布新快照（调用方需持有 _build_lock）
+        :return: 新快照，失败时返回None（原快照保持不变）
+        """
         conn = None
+        # 在读取数据之前记录版本信号和变更日志序号，加载期间发生的修改会在下次检查时被发现
+        data_signal = self._read_data_signal()
+        data_key = self._read_data_key()
 
         try:
             # 获取数据库连接
             conn = self.get_database_connection()
-            cursor = conn.cursor()
+            # 未安装变更日志时为None，之后的刷新都全量重新加载
+            change_seq = self._read_change_seq(conn)[0] if self.incremental_refresh else None
 
             # 执行查询获取所有规则
-            cursor.execute("SELECT * FROM warehouse_management")
-            rows = cursor.fetchall()
-
-            for row in rows:
-                # 将sqlite3.Row转换为字典，方便访问
-                row_dict = dict(row)
-                code = row_dict['代码']  # 使用中文字段名
-
-                # 构建位置规则列表
-                location_rules = []
-
-                # 添加物理位置1的规则（如果存在）
-                if row_dict['物理位置1'] and row_dict['位置1适用时间']:  # 使用中文字段名
-                    location_rules.append({
-                        "location": row_dict['物理位置1'],  # 使用中文字段名
-                        "rule": row_dict['位置1适用时间']  # 使用中文字段名
-                    })
-
-                # 添加物理位置2的规则（如果存在）
-                if row_dict['物理位置2'] and row_dict['位置2适用时间']:  # 使用中文字段名
-                    location_rules.append({
-                        "location": row_dict['物理位置2'],  # 使用中文字段名
-                        "rule": row_dict['位置2适用时间']  # 使用中文字段名
-                    })
-
-                # 构建规则条目
-                warehouse_rules[code] = {
-                    "mapping": row_dict['映射'],  # 使用中文字段名
-                    "name": row_dict['流向'],  # 使用中文字段名
-                    "location_rules": location_rules,
-                    "挂靠流向": row_dict.get('挂靠流向', None)  # 新增挂靠流向字段
-                }
-
-            # 更新缓存
-            self.warehouse_rules = warehouse_rules
-            self.last_load_time = datetime.datetime.now()
-
+            warehouse_rules, code_positions = self._read_warehouse_rules(conn)
         except sqlite3.Error as e:
-            print(f"数据库查询错误: {e}")
-            return {}
+            # 数据库被锁定或不可读时保留原快照
+            print(f"数据库查询错误: {e}", file=self.report_stream)
+            self.last_refresh_error = f"数据库查询错误: {e}"
+            return None
         finally:
             # 确保连接被关闭
             if conn:
                 conn.close()
 
-        return warehouse_rules
+        mapping_index, flow_index, duplicate_mappings, attached_index = self._build_indexes(warehouse_rules)
+        attachment_closure, cycles, dangling = self._build_attachment_closure(warehouse_rules, mapping_index)
+        load_report = {
+            "duplicate_mappings": duplicate_mappings,
+            "cycles": cycles,
+            "dangling": dangling
+        }
+        self._print_load_report(load_report)
+        weekly_schedules = self._build_weekly_schedules(warehouse_rules) if self.precompute_schedule else {}
+        version = self._next_version
+
+        # 规则与索引一起构建为新快照，整体替换，保证重新加载后保持一致；搜索索引在需要时才构建
+        snapshot = RuleSnapshot(version, warehouse_rules, mapping_index, flow_index, duplicate_mappings,
+                                attached_index, attachment_closure, load_report, weekly_schedules, None,
+                                code_positions)
+        self._publish(snapshot, data_signal, change_seq, data_key)
+        return snapshot
 
     def load_single_rule_from_db(self, code):
         """
         根据流向代码从数据库加载单条规则（优化版，减少内存使用）
         :param code: 流向代码
-        :return: 单条规则字典或None
+        :return: 单条规则记录或None
         """
         conn = None
         try:
@@ -183,32 +1182,10 @@ class WarehouseRuleManager:
             if not row:
                 return None
 
-            row_dict = dict(row)
-            location_rules = []
-
-            # 添加物理位置1的规则（如果存在）
-            if row_dict['物理位置1'] and row_dict['位置1适用时间']:  # 使用中文字段名
-                location_rules.append({
-                    "location": row_dict['物理位置1'],  # 使用中文字段名
-                    "rule": row_dict['位置1适用时间']  # 使用中文字段名
-                })
-
-            # 添加物理位置2的规则（如果存在）
-            if row_dict['物理位置2'] and row_dict['位置2适用时间']:  # 使用中文字段名
-                location_rules.append({
-                    "location": row_dict['物理位置2'],  # 使用中文字段名
-                    "rule": row_dict['位置2适用时间']  # 使用中文字段名
-                })
-
-            return {
-                "mapping": row_dict['映射'],  # 使用中文字段名
-                "name": row_dict['流向'],  # 使用中文字段名
-                "location_rules": location_rules,
-                "挂靠流向": row_dict.get('挂靠流向', None)  # 新增挂靠流向字段
-            }
+            return self._build_rule(row, self._rule_columns(cursor.description))
 
         except sqlite3.Error as e:
-            print(f"数据库查询错误: {e}")
+            print(f"数据库查询错误: {e}", file=self.report_stream)
             return None
         finally:
             if conn:
@@ -262,69 +1239,87 @@ class WarehouseRuleManager:
 
         return False
 
+    @staticmethod
+    def match_time_rule(rule_str, current_time):
+        """
+        使用预编译的位图判断当前时间是否符合规则，结果与 parse_time_rule 相同
+        :param rule_str: 规则字符串
+        :param current_time: 当前时间 datetime.datetime 对象
+        :return: 如果当前时间符合规则，返回True，否则返回False
+        """
+        return (compile_time_rule(rule_str) >> minute_of_week(current_time)) & 1 == 1
+
     def find_flow_by_mapping(self, mapping):
         """
         根据映射码查找对应的流向代码
         :param mapping: 映射码
         :return: 流向代码或None
         """
+        codes = self.find_codes_by_mapping(mapping)
+        return codes[0] if codes else None
+
+    def find_codes_by_mapping(self, mapping):
+        """
+        根据映射码精确查找所有对应的流向代码
+        :param mapping: 映射码
+        :return: 流向代码列表（可能为空）
+        """
         # 确保规则已加载
-        if self.warehouse_rules is None:
-            self.load_rules_from_database()
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return []
 
-        for code, rule_info in self.warehouse_rules.items():
-            if rule_info['mapping'] == mapping:
-                return code
-        return None
+        return list(snapshot.mapping_index.get(mapping, ()))
 
-    def resolve_attached_flow(self, code, visited=None):
+    def find_codes_by_flow_name(self, name):
         """
-        解析挂靠流向，处理多级挂靠和循环挂靠
-        :param code: 当前流向代码
-        :param visited: 已访问的流向代码集合（用于检测循环）
-        :return: 最终的基础流向代码
+        根据流向名称精确查找所有对应的流向代码
+        :param name: 流向名称，如 "龙山"
+        :return: 流向代码列表（可能为空）
         """
-        if visited is None:
-            visited = set()
-
-        # 检测循环挂靠
-        if code in visited:
-            print(f"警告: 检测到循环挂靠: {' -> '.join(visited)} -> {code}")
-            return code
+        # 确保规则已加载
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return []
 
-        visited.add(code)
+        return list(snapshot.flow_index.get(name, ()))
 
-        # 获取当前流向规则
-        rule_info = self.warehouse_rules.get(code) if self.warehouse_rules else self.load_single_rule_from_db(code)
-        if not rule_info:
+    def resolve_attached_flow(self, code):
+        """
+        解析挂靠流向，处理多级挂靠和循环挂靠（使用加载时预先计算的挂靠闭包）
+        :param code: 当前流向代码
+        :return: 最终的基础流向代码
+        """
+        # 确保规则已加载
+        snapshot = self._current_snapshot()
+        if snapshot is None:
             return code
 
-        # 检查是否有挂靠流向（映射码）
-        attached_mapping = rule_info.get('挂靠流向')
-        if attached_mapping:
-            # 根据映射码查找对应的流向代码
-            attached_code = self.find_flow_by_mapping(attached_mapping)
-
-            if attached_code and (self.warehouse_rules is None or attached_code in self.warehouse_rules):
-                print(f"流向 {code} 挂靠到 {attached_code} (映射码: {attached_mapping})")
-                return self.resolve_attached_flow(attached_code, visited)
-            else:
-                print(f"警告: 找不到映射码 {attached_mapping} 对应的流向")
-
-        return code
+        return snapshot.attachment_closure.get(code, code)
 
     def find_current_locations(self, code, current_time):
         """
         根据流向代码和当前时间查找当前应使用的物理位置。
         :param code: 流向代码，如 "574W"
-        :param current_time: 当前时间
-        :return: 返回一个列表，包含所有适用的物理位置信息
+        :param current_time: 当前时间（带时区的时间按本地时间计算）
+        :return: 返回一个列表，包含所有适用的物理位置信息；启用结果缓存时为只读记录组成的元组
         """
-        # 如果未加载规则，则尝试加载单条规则
-        if self.warehouse_rules is None:
+        current_time = local_time(current_time)
+        # 如果未加载规则，则尝试加载单条规则（同时在后台加载全部规则）
+        snapshot = self._snapshot
+        if snapshot is None:
+            # 有与数据库一致的编译规则表时直接查表
+            table = self._cold_start_table()
+            if table is not None:
+                return table.find_current_locations(code, current_time)
+            if self.background_refresh:
+                self.refresh_in_background(force_check=True)
             rule_info = self.load_single_rule_from_db(code)
         else:
-            rule_info = self.warehouse_rules.get(code)
+            snapshot = self._current_snapshot()
+            if self.result_cache:
+                return self._lookup_with_window(snapshot, code, current_time)[0]
+            rule_info = snapshot.warehouse_rules.get(code)
 
         if not rule_info:
             return None
@@ -335,35 +1330,156 @@ class WarehouseRuleManager:
         # 检查是否有挂靠流向
         final_code = code
         if rule_info.get('挂靠流向'):
-            # 确保规则已加载（如果使用缓存）
-            if self.warehouse_rules is None:
+            # 解析挂靠需要完整的挂靠图，冷启动时等待全部规则加载完成
+            if snapshot is None:
                 self.load_rules_from_database()
+                snapshot = self._snapshot
+
+            if snapshot is not None:
+                # 查询预先解析的挂靠闭包，并获取最终流向的规则
+                final_code = snapshot.attachment_closure.get(code, code)
+                rule_info = snapshot.warehouse_rules.get(final_code, rule_info)
+
+        schedule = snapshot.weekly_schedules.get(final_code) if snapshot is not None else None
+        active_rules = self._active_location_rules(schedule, rule_info, minute_of_week(current_time), current_time)
+        return self._build_location_results(code, final_code, rule_info, original_flow_name, active_rules)
+
+    def next_location_change(self, code, current_time):
+        """
+        查询流向代码当前生效的物理位置下一次变化的时间（挂靠代码按最终代码的规则计算）。
+        在该时间之前、规则未被修改时，find_current_locations 的结果保持不变，可据此设置客户端缓存时长。
+        :param code: 流向代码
+        :param current_time: 当前时间
+        :return: 下一次变化的时间（datetime.datetime，精确到分钟）；代码不存在或位置整周不变时返回None
+        """
+        current_time = local_time(current_time)
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return None
+        results, _, valid_until = self._lookup_with_window(snapshot, code, current_time)
+        return valid_until if results else None
+
+    def _lookup_with_window(self, snapshot, code, current_time):
+        """
+        在同一快照中查询代码当前的物理位置及结果的有效期，并按 (代码, 规则版本) 缓存。
+        缓存的结果在有效期内直接返回；规则版本变化时整个缓存清空，条目数超过上限时淘汰最久未使用的一条。
+        :param snapshot: 当前快照
+        :param code: 流向代码
+        :param current_time: 当前时间
+        :return: (结果元组或None, 有效期开始, 有效期结束)，有效期两端为None表示不受限。
+                 结果在多次查询间共用，因此是只读记录（types.MappingProxyType）组成的元组
+        """
+        if self._result_cache_version != snapshot.version:
+            self._result_cache = collections.OrderedDict()
+            self._result_cache_version = snapshot.version
+        key = (code, snapshot.version)
+        entry = self._result_cache.get(key)
+        if entry is not None and (entry[1] is None or entry[1] <= current_time) \
+                and (entry[2] is None or current_time < entry[2]):
+            self._result_cache.move_to_end(key)
+            return entry
+
+        rule_info = snapshot.warehouse_rules.get(code)
+        if not rule_info:
+            # 不存在的代码在规则版本变化之前一直不存在
+            entry = (None, None, None)
+        else:
+            final_code = snapshot.attachment_closure.get(code, code) if rule_info.get('挂靠流向') else code
+            final_rule = snapshot.warehouse_rules.get(final_code, rule_info)
+            schedule = snapshot.weekly_schedules.get(final_code) or self._rule_schedule(final_rule)
+            current_minute = minute_of_week(current_time)
+            active_rules = self._active_location_rules(schedule, final_rule, current_minute, current_time)
+            results = tuple(types.MappingProxyType(result) for result in
+                            self._build_location_results(code, final_code, final_rule, rule_info['name'], active_rules))
+
+            minute_start = current_time.replace(second=0, microsecond=0)
+            if schedule is None:
+                # 含无法编译的规则，只能保证在当前这一分钟内不变
+                window = (0, 1)
+            else:
+                window = schedule_window(schedule, current_minute)
+            if window is None:
+                entry = (results, None, None)
+            else:
+                entry = (results, minute_start - datetime.timedelta(minutes=window[0]),
+                         minute_start + datetime.timedelta(minutes=window[1]))
+
+        self._result_cache[key] = entry
+        self._result_cache.move_to_end(key)
+        if len(self._result_cache) > self.RESULT_CACHE_SIZE:
+            self._result_cache.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _rule_schedule(rule_info):
+        """
+        获取规则的周时段表（按位图组合缓存）
+        :param rule_info: 规则
+        :return: 周时段表，含无法编译的位置规则时返回None
+        """
+        masks = tuple(loc_rule["mask"] for loc_rule in rule_info["location_rules"])
+        if None in masks:
+            return None
+        return compile_weekly_schedule(masks)
+
+    def _active_location_rules(self, schedule, rule_info, current_minute, current_time, rule_cache=None):
+        """
+        找出当前时间生效的位置规则
+        :param schedule: 最终代码在同一快照中的周时段表，没有预计算时为None
+        :param rule_info: 最终代码的规则
+        :param current_minute: 当前周内分钟序号
+        :param current_time: 当前时间（仅无法编译的规则回退解析时使用）
+        :param rule_cache: 可选的 规则文本 -> 是否生效 缓存，批量查询时同一规则只判定一次
+        :return: 生效的位置规则列表
+        """
+        location_rules = rule_info["location_rules"]
 
-            # 解析挂靠流向链
-            final_code = self.resolve_attached_flow(code)
-            print(f"流向 {code} 最终挂靠到 {final_code}")
+        if schedule is not None:
+            # 预计算模式：在周时段表中二分查找当前时段
+            boundaries, active = schedule
+            return [location_rules[index] for index in active[bisect.bisect_right(boundaries, current_minute) - 1]]
 
-            # 获取最终流向的规则
-            if self.warehouse_rules:
-                rule_info = self.warehouse_rules.get(final_code, rule_info)
+        # 遍历该代码的所有位置规则，检查哪些在当前时间生效
+        active_rules = []
+        for loc_rule in location_rules:
+            if rule_cache is not None and loc_rule["rule"] in rule_cache:
+                matched = rule_cache[loc_rule["rule"]]
             else:
-                rule_info = self.load_single_rule_from_db(final_code) or rule_info
+                mask = loc_rule["mask"]
+                if mask is None:
+                    matched = self.parse_time_rule(loc_rule["rule"], current_time)
+                else:
+                    matched = (mask >> current_minute) & 1 == 1
+                if rule_cache is not None:
+                    rule_cache[loc_rule["rule"]] = matched
+            if matched:
+                active_rules.append(loc_rule)
+        return active_rules
 
+    @staticmethod
+    def _build_location_results(code, final_code, rule_info, original_flow_name, active_rules):
+        """
+        将生效的位置规则转换为查询结果列表
+        :param code: 查询的流向代码
+        :param final_code: 解析挂靠后的最终代码
+        :param rule_info: 最终代码的规则
+        :param original_flow_name: 查询代码自身的流向名称
+        :param active_rules: 生效的位置规则列表
+        :return: 结果字典列表
+        """
         # 存储所有适用的位置
         applicable_locations = []
 
-        # 遍历该代码的所有位置规则，检查哪些在当前时间生效
-        for loc_rule in rule_info["location_rules"]:
-            if self.parse_time_rule(loc_rule["rule"], current_time):
-                applicable_locations.append({
-                    "映射": rule_info["mapping"],
-                    "流向": rule_info["name"],
-                    "原始流向名称": original_flow_name,  # 保存原始流向名称
-                    "当前物理位置": loc_rule["location"],
-                    "是否挂靠": final_code != code,  # 标记是否为挂靠结果
-                    "原始代码": code,
-                    "最终代码": final_code
-                })
+        for loc_rule in active_rules:
+            applicable_locations.append({
+                "映射": rule_info["mapping"],
+                "流向": rule_info["name"],
+                "原始流向名称": original_flow_name,  # 保存原始流向名称
+                "当前物理位置": loc_rule["location"],
+                "是否挂靠": final_code != code,  # 标记是否为挂靠结果
+                "原始代码": code,
+                "最终代码": final_code
+            })
 
         # 如果没有找到任何生效的位置规则
         if not applicable_locations:
@@ -379,14 +1495,69 @@ class WarehouseRuleManager:
 
         return applicable_locations
 
+    def find_current_locations_batch(self, codes, current_time, as_frame=False):
+        """
+        在同一时间点批量查询多个流向代码的物理位置（例如整张进港清单的波次规划）。
+        只加载一次规则，同一时间规则只判定一次，重复代码共用同一结果。
+        :param codes: 流向代码序列
+        :param current_time: 当前时间
+        :param as_frame: 为True时返回列式的 DataFrame（每个生效位置一行），否则返回结果列表
+        :return: 与 codes 一一对应的结果列表（元素同 find_current_locations 的返回值，未找到为None），
+                 或 DataFrame（未找到的代码对应一行，除 原始代码 外均为空）
+        """
+        current_time = local_time(current_time)
+        # 冷启动时有与数据库一致的编译规则表则直接查表，否则整批只加载一次全部规则，不逐条访问数据库
+        table = self._cold_start_table() if self._snapshot is None else None
+        snapshot = self._current_snapshot() if table is None else None
+        warehouse_rules = snapshot.warehouse_rules if snapshot is not None else {}
+
+        current_minute = minute_of_week(current_time)
+        rule_cache = {}  # 规则文本 -> 当前是否生效
+        code_results = {}  # 代码 -> 结果列表，重复代码直接复用
+
+        batch_results = []
+        for code in codes:
+            if code not in code_results:
+                rule_info = warehouse_rules.get(code)
+                if table is not None:
+                    code_results[code] = table.find_current_locations(code, current_time)
+                elif not rule_info:
+                    code_results[code] = None
+                else:
+                    final_code = snapshot.attachment_closure.get(code, code) if rule_info.get('挂靠流向') else code
+                    final_rule = warehouse_rules.get(final_code, rule_info)
+                    active_rules = self._active_location_rules(snapshot.weekly_schedules.get(final_code), final_rule,
+                                                               current_minute, current_time, rule_cache)
+                    code_results[code] = self._build_location_results(code, final_code, final_rule,
+                                                                      rule_info['name'], active_rules)
+            batch_results.append(code_results[code])
+
+        if not as_frame:
+            return batch_results
+
+        columns = ["映射", "流向", "原始流向名称", "当前物理位置", "是否挂靠", "原始代码", "最终代码"]
+        records = []
+        for code, results in zip(codes, batch_results):
+            if results is None:
+                records.append(dict.fromkeys(columns, None) | {"原始代码": code})
+            else:
+                records.extend(results)
+        return pd.DataFrame.from_records(records, columns=columns)
+
 
 # —————— 以下是主程序交互部分 ——————
 if __name__ == '__main__':
-    print("流向代码查询系统（数据库版）")
-
     # 创建仓库规则管理器
     rule_manager = WarehouseRuleManager()
 
+    # 安装变更日志（修改数据库结构的一次性步骤，之后的修改可以增量刷新）
+    if "--install-change-log" in sys.argv[1:]:
+        if rule_manager.ensure_change_log():
+            print(f"已在 {rule_manager.db_path} 中安装变更日志")
+        sys.exit(0)
+
+    print("流向代码查询系统（数据库版）")
+
     # 预加载所有规则到内存（适用于数据量不大且频繁查询的场景）
     print("正在从数据库加载规则数据...")
     try:
@@ -400,34 +1571,35 @@ if __name__ == '__main__':
         print(f"加载数据时出错: {e}")
         print("将使用按需查询模式")
 
-    print("\n请输入流向代码 (例如: 574W, 574TJL, S574WJ): ")
-    target_code = input().strip()
+    print("\n请输入流向代码，多个代码用空格或逗号分隔 (例如: 574W, 574TJL, S574WJ): ")
+    target_codes = [code for code in re.split(r'[\s,，]+', input().strip()) if code]
 
     # 获取当前系统时间
     now = datetime.datetime.now()
     print(f"当前系统时间: {now.strftime('%Y-%m-%d %H:%M:%S 星期%w')}")
 
-    # 查询并输出结果
-    results = rule_manager.find_current_locations(target_code, now)
-    if results:
-        print(f"\n查询结果:")
-        print(f"流向代码: {target_code}")
+    # 批量查询并逐个输出结果
+    batch_results = rule_manager.find_current_locations_batch(target_codes, now)
+    for target_code, results in zip(target_codes, batch_results):
+        if results:
+            print(f"\n查询结果:")
+            print(f"流向代码: {target_code}")
+
+            # 如果是挂靠结果，显示原始流向和最终流向
+            if results[0]['是否挂靠']:
+                print(f"原始流向: {results[0]['原始流向名称']} (代码: {target_code})")
+                print(f"最终流向: {results[0]['流向']} (代码: {results[0]['最终代码']})")
+            else:
+                print(f"流向: {results[0]['流向']}")
+
+            print(f"映射: {results[0]['映射']}")
 
-        # 如果是挂靠结果，显示原始流向和最终流向
-        if results[0]['是否挂靠']:
-            print(f"原始流向: {results[0]['原始流向名称']} (代码: {target_code})")
-            print(f"最终流向: {results[0]['流向']} (代码: {results[0]['最终代码']})")
+            # 输出所有适用的物理位置
+            print("当前适用的物理位置:")
+            for i, result in enumerate(results, 1):
+                location_info = result['当前物理位置']
+                if result['是否挂靠']:
+                    location_info += " (挂靠)"
+                print(f"{i}. {location_info}")
         else:
-            print(f"流向: {results[0]['流向']}")
-
-        print(f"映射: {results[0]['映射']}")
-
-        # 输出所有适用的物理位置
-        print("当前适用的物理位置:")
-        for i, result in enumerate(results, 1):
-            location_info = result['当前物理位置']
-            if result['是否挂靠']:
-                location_info += " (挂靠)"
-            print(f"{i}. {location_info}")
-    else:
-        print(f"\n错误: 未找到流向代码 '{target_code}' 的配置信息。")
\ No newline at end of file
+            print(f"\n错误: 未找到流向代码 '{target_code}' 的配置信息。")
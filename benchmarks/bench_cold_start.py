@@ -0,0 +1,81 @@
+"""
+冷启动基准测试：新进程从数据库全量加载规则，与直接内存映射编译规则表（snapshot_file）对比，
+报告首次可以回答查询所需的时间、规则表大小以及两种方式的单次查询延迟。
+
+在项目根目录运行:
+    python -m benchmarks.bench_cold_start [--db announcements.db] [--synthetic 100000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from PublicManagerClass.CompiledRuleTable import CompiledRuleTable, database_fingerprint
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager, compile_time_rule, compile_weekly_schedule
+from benchmarks.synthetic_db import create_synthetic_db, sample_times
+
+
+def clear_caches():
+    """清空进程内的编译缓存，模拟新进程"""
+    compile_time_rule.cache_clear()
+    compile_weekly_schedule.cache_clear()
+
+
+def bench(label, db_path, table_path, lookups):
+    clear_caches()
+    manager = WarehouseRuleManager(db_path, incremental_refresh=False, background_refresh=False)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager.load_rules_from_database()
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    CompiledRuleTable.write_file(table_path, manager.snapshot, database_fingerprint(db_path))
+    write_seconds = time.perf_counter() - start
+
+    rng = random.Random(1)
+    codes = list(manager.warehouse_rules)
+    queries = [(rng.choice(codes), t) for t in sample_times(lookups)]
+
+    clear_caches()
+    start = time.perf_counter()
+    table = CompiledRuleTable.open_file(table_path, database_fingerprint(db_path))
+    first_result = table.find_current_locations(*queries[0])
+    open_seconds = time.perf_counter() - start
+    assert first_result == list(manager.find_current_locations(*queries[0])), "编译规则表与全量加载的结果不一致"
+
+    timings = {}
+    for name, lookup in (("内存快照", manager.find_current_locations), ("编译规则表", table.find_current_locations)):
+        start = time.perf_counter()
+        for code, t in queries:
+            lookup(code, t)
+        timings[name] = (time.perf_counter() - start) / lookups
+    table.close()
+
+    print(f"[{label}] 代码 {len(codes)} 个")
+    print(f"  全量加载到首次查询: {load_seconds:.3f}s")
+    print(f"  映射规则表到首次查询: {open_seconds * 1000:.2f}ms（规则表 {os.path.getsize(table_path) / 2 ** 20:.1f} MiB，"
+          f"写入耗时 {write_seconds:.3f}s）")
+    print(f"  冷启动加速: {load_seconds / open_seconds:.0f} 倍")
+    for name, seconds in timings.items():
+        print(f"  {name} 单次查询: {seconds * 1e6:.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动基准测试")
+    parser.add_argument("--db", default="announcements.db", help="SQLite数据库文件路径")
+    parser.add_argument("--synthetic", type=int, default=100000, help="合成规则条数")
+    parser.add_argument("--lookups", type=int, default=20000, help="查询次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench("真实表", args.db, os.path.join(tmp_dir, "real.rules"), args.lookups)
+        db_path = create_synthetic_db(os.path.join(tmp_dir, "synthetic.db"), args.synthetic)
+        bench("合成表", db_path, os.path.join(tmp_dir, "synthetic.rules"), args.lookups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+规则记录内存基准测试：对比原先的嵌套字典表示（dict(row) 加字典列表）与
+紧凑记录表示（__slots__ 记录、驻留字符串、按列下标读取元组），报告每条规则的内存和读取耗时。
+
+在项目根目录运行:
+    python -m benchmarks.bench_rule_memory [--sizes 1000,100000,1000000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager, compile_time_rule
+from benchmarks.synthetic_db import create_synthetic_db
+
+
+def load_dict_rules(db_path):
+    """原先的读取方式：sqlite3.Row 转为字典，规则与位置规则都是字典"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        warehouse_rules = {}
+        for row in conn.execute("SELECT * FROM warehouse_management").fetchall():
+            row_dict = dict(row)
+            location_rules = []
+            for location_column, rule_column in (("物理位置1", "位置1适用时间"), ("物理位置2", "位置2适用时间")):
+                if row_dict[location_column] and row_dict[rule_column]:
+                    location_rules.append({
+                        "location": row_dict[location_column],
+                        "rule": row_dict[rule_column],
+                        "mask": compile_time_rule(row_dict[rule_column])
+                    })
+            warehouse_rules[row_dict['代码']] = {
+                "mapping": row_dict['映射'],
+                "name": row_dict['流向'],
+                "location_rules": location_rules,
+                "挂靠流向": row_dict.get('挂靠流向', None)
+            }
+        return warehouse_rules
+    finally:
+        conn.close()
+
+
+def load_record_rules(db_path):
+    """紧凑记录的读取方式：与 WarehouseRuleManager 全量加载时读取规则表的代码相同"""
+    manager = WarehouseRuleManager(db_path, incremental_refresh=False)
+    conn = manager.get_database_connection()
+    try:
+        return manager._read_warehouse_rules(conn)[0]
+    finally:
+        conn.close()
+
+
+def measure(loader, db_path):
+    """测量读取后仍被引用的内存和读取耗时（tracemalloc 会拖慢读取，因此分两次测量）"""
+    compile_time_rule.cache_clear()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        rules = loader(db_path)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(rules)
+    del rules
+
+    compile_time_rule.cache_clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        rules = loader(db_path)
+    seconds = time.perf_counter() - start
+    del rules
+    return count, current, peak, seconds
+
+
+def bench(size, tmp_dir):
+    db_path = create_synthetic_db(os.path.join(tmp_dir, f"synthetic_{size}.db"), size)
+    print(f"[{size} 条规则]")
+    results = {}
+    for name, loader in (("嵌套字典", load_dict_rules), ("紧凑记录", load_record_rules)):
+        count, current, peak, seconds = measure(loader, db_path)
+        results[name] = current
+        print(f"  {name}: 每条规则 {current / count:.0f} B，常驻 {current / 2 ** 20:.1f} MiB，"
+              f"峰值 {peak / 2 ** 20:.1f} MiB，读取 {seconds:.3f}s（{seconds / count * 1e6:.2f} us/条）")
+    print(f"  内存节省: {1 - results['紧凑记录'] / results['嵌套字典']:.0%}")
+    os.remove(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="规则记录内存基准测试")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="逗号分隔的合成规则条数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in map(int, args.sizes.split(",")):
+            bench(size, tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
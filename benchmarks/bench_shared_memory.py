@@ -0,0 +1,119 @@
+"""
+共享内存基准测试：N 个工作进程各自全量加载规则，与一个发布进程把规则表写入共享内存、
+工作进程只读附加对比，报告所有工作进程为规则增加的独占内存（USS）与按比例分摊的内存（PSS），
+以及修改一条规则后各工作进程看到新版本的时间（从开始刷新和从发布完成起算）。
+
+仅支持 Linux（读取 /proc/self/smaps_rollup）。在项目根目录运行:
+    python -m benchmarks.bench_shared_memory [--synthetic 50000] [--workers 1,2,4,8]
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from PublicManagerClass.SharedRuleTable import SharedRulePublisher, SharedRuleReader
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+from benchmarks.synthetic_db import create_synthetic_db, sample_times
+
+def memory_usage():
+    """
+    读取本进程的内存占用
+    :return: (USS, PSS) 字节数
+    """
+    fields = {}
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return fields["Private_Clean"] + fields["Private_Dirty"], fields["Pss"]
+
+
+def worker(mode, db_path, shared_name, codes, ready, results, changed_code):
+    """工作进程：加载或附加规则，查询一遍，报告规则带来的内存增量，然后等待规则变化"""
+    times = sample_times(len(codes))
+    baseline = memory_usage()
+    if mode == "shared":
+        lookup = SharedRuleReader(shared_name)
+        version = lambda: lookup.rule_version
+    else:
+        lookup = WarehouseRuleManager(db_path, reload_check_interval=0.0, background_refresh=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            lookup.load_rules_from_database()
+        version = lambda: lookup.rule_version
+    for code, t in zip(codes, times):
+        lookup.find_current_locations(code, t)
+    results.put(("memory",) + tuple(after - before for after, before in zip(memory_usage(), baseline)))
+    ready.wait()
+
+    start_version = version()
+    with contextlib.redirect_stdout(io.StringIO()):
+        while version() == start_version:
+            lookup.find_current_locations(changed_code, times[0])
+            time.sleep(0.001)  # 模拟两次查询之间的空闲，避免单核机器上轮询拖慢发布进程
+    results.put(("seen", time.perf_counter()))
+
+
+def bench(mode, manager, shared_name, worker_count, codes):
+    db_path = manager.db_path
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Event()
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(mode, db_path, shared_name, codes, ready, results, codes[0]))
+                 for _ in range(worker_count)]
+    for process in processes:
+        process.start()
+    memory = [results.get()[1:] for _ in processes]
+    ready.set()
+    time.sleep(0.5)  # 等待工作进程进入轮询
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE warehouse_management SET 物理位置1 = 物理位置1 || '*' WHERE 代码 = ?", (codes[0],))
+    conn.commit()
+    conn.close()
+    changed_at = time.perf_counter()
+    if mode == "shared":
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.reload_if_changed(force_check=True)
+    seen = [results.get()[1] for _ in processes]
+    for process in processes:
+        process.join()
+
+    total_uss = sum(uss for uss, _ in memory)
+    total_pss = sum(pss for _, pss in memory)
+    print(f"  {worker_count} 个工作进程: 规则合计 USS {total_uss / 2 ** 20:.1f} MiB，PSS {total_pss / 2 ** 20:.1f} MiB；"
+          f"修改后 {(min(seen) - changed_at) * 1000:.1f}~{(max(seen) - changed_at) * 1000:.1f}ms 看到新规则，"
+          f"各进程相差 {(max(seen) - min(seen)) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享内存基准测试")
+    parser.add_argument("--synthetic", type=int, default=50000, help="合成规则条数")
+    parser.add_argument("--workers", default="1,2,4,8", help="逗号分隔的工作进程数")
+    parser.add_argument("--lookups", type=int, default=5000, help="每个工作进程的查询次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = create_synthetic_db(os.path.join(tmp_dir, "synthetic.db"), args.synthetic)
+        manager = WarehouseRuleManager(db_path, background_refresh=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.load_rules_from_database()
+        rng = random.Random(1)
+        codes = [rng.choice(list(manager.warehouse_rules)) for _ in range(args.lookups)]
+        publisher = SharedRulePublisher(manager, f"sf_rules_bench_{os.getpid()}")
+        try:
+            for mode, label in (("private", "每个进程各自加载"), ("shared", "共享内存")):
+                print(f"[{label}] {args.synthetic} 条规则")
+                for worker_count in map(int, args.workers.split(",")):
+                    bench(mode, manager, publisher.name, worker_count, codes)
+        finally:
+            publisher.close(unlink_control=True)
+
+
+if __name__ == "__main__":
+    main()
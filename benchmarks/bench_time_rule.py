@@ -0,0 +1,61 @@
+"""
+时间规则引擎基准测试：字符串解析（parse_time_rule）与预编译位图（compile_time_rule）对比。
+
+在项目根目录运行:
+    python -m benchmarks.bench_time_rule [--db announcements.db] [--synthetic 100000]
+"""
+import argparse
+import time
+
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager, compile_time_rule, minute_of_week
+from benchmarks.synthetic_db import sample_times, synthetic_rules
+
+
+def bench(label, rules, times):
+    """对同一批规则和时间点分别测量两种实现"""
+    compile_time_rule.cache_clear()
+
+    start = time.perf_counter()
+    parsed = [WarehouseRuleManager.parse_time_rule(rule, t) for t in times for rule in rules]
+    parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    masks = [compile_time_rule(rule) for rule in rules]
+    compile_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = []
+    for t in times:
+        current_minute = minute_of_week(t)
+        compiled.extend((mask >> current_minute) & 1 == 1 for mask in masks)
+    eval_seconds = time.perf_counter() - start
+
+    assert parsed == compiled, "编译结果与字符串解析结果不一致"
+
+    checks = len(rules) * len(times)
+    distinct = compile_time_rule.cache_info().currsize
+    print(f"[{label}] 规则 {len(rules)} 条（不同文本 {distinct} 个），时间点 {len(times)} 个，共 {checks} 次判定")
+    print(f"  字符串解析: {parse_seconds:.3f}s  ({parse_seconds / checks * 1e9:.0f} ns/次)")
+    print(f"  位图编译:   {compile_seconds:.3f}s  (仅加载时一次)")
+    print(f"  位图判定:   {eval_seconds:.3f}s  ({eval_seconds / checks * 1e9:.0f} ns/次)")
+    print(f"  加速比:     {parse_seconds / eval_seconds:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="时间规则引擎基准测试")
+    parser.add_argument("--db", default="announcements.db", help="SQLite数据库文件路径")
+    parser.add_argument("--synthetic", type=int, default=100000, help="合成规则条数")
+    parser.add_argument("--times", type=int, default=2000, help="真实表使用的时间点数")
+    args = parser.parse_args()
+
+    manager = WarehouseRuleManager(args.db)
+    real_rules = [loc_rule["rule"]
+                  for rule_info in manager.load_rules_from_database().values()
+                  for loc_rule in rule_info["location_rules"]]
+    bench("真实表", real_rules, sample_times(args.times))
+
+    bench("合成表", synthetic_rules(args.synthetic), sample_times(20))
+
+
+if __name__ == "__main__":
+    main()
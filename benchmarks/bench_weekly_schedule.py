@@ -0,0 +1,98 @@
+"""
+周时段表基准测试：逐条判定位置规则与预计算周时段表（precompute_schedule=True）对比，
+报告加载耗时、时段表内存占用和单次 find_current_locations 延迟。
+
+在项目根目录运行:
+    python -m benchmarks.bench_weekly_schedule [--db announcements.db] [--synthetic 100000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager, compile_time_rule, compile_weekly_schedule
+from benchmarks.synthetic_db import create_synthetic_db, sample_times
+
+
+def load_manager(db_path, precompute_schedule):
+    """加载规则并测量耗时与新增内存（屏蔽加载报告输出；tracemalloc 会拖慢加载，因此分两次测量）"""
+    manager = WarehouseRuleManager(db_path, precompute_schedule=precompute_schedule)
+    compile_time_rule.cache_clear()
+    compile_weekly_schedule.cache_clear()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager.load_rules_from_database()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    compile_time_rule.cache_clear()
+    compile_weekly_schedule.cache_clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager.load_rules_from_database(force_reload=True)
+    seconds = time.perf_counter() - start
+    return manager, seconds, current
+
+
+def schedule_bytes(manager):
+    """统计去重后时段表本身的内存估算值（不含代码 -> 时段表的字典）"""
+    seen = set()
+    total = 0
+    for schedule in manager.weekly_schedules.values():
+        if id(schedule) in seen:
+            continue
+        seen.add(id(schedule))
+        boundaries, active = schedule
+        total += sys.getsizeof(schedule) + sys.getsizeof(boundaries) + sys.getsizeof(active)
+        total += sum(sys.getsizeof(item) for item in boundaries)
+        total += sum(sys.getsizeof(item) for item in active)
+    return total, len(seen)
+
+
+def bench(label, db_path, lookups):
+    plain, plain_seconds, plain_memory = load_manager(db_path, precompute_schedule=False)
+    scheduled, scheduled_seconds, scheduled_memory = load_manager(db_path, precompute_schedule=True)
+
+    rng = random.Random(1)
+    codes = list(plain.warehouse_rules)
+    queries = [(rng.choice(codes), t) for t in sample_times(lookups)]
+
+    timings = {}
+    for name, manager in (("逐条判定", plain), ("周时段表", scheduled)):
+        start = time.perf_counter()
+        results = [manager.find_current_locations(code, t) for code, t in queries]
+        timings[name] = (time.perf_counter() - start, results)
+
+    assert timings["逐条判定"][1] == timings["周时段表"][1], "两种模式结果不一致"
+
+    table_bytes, distinct = schedule_bytes(scheduled)
+    print(f"[{label}] 代码 {len(codes)} 个，查询 {lookups} 次")
+    print(f"  加载耗时:   逐条判定 {plain_seconds:.3f}s / 周时段表 {scheduled_seconds:.3f}s")
+    print(f"  加载内存:   逐条判定 {plain_memory / 1024:.0f} KiB / 周时段表 {scheduled_memory / 1024:.0f} KiB")
+    print(f"  时段表:     不同时段表 {distinct} 张，约 {table_bytes / 1024:.1f} KiB；"
+          f"代码索引字典 {sys.getsizeof(scheduled.weekly_schedules) / 1024:.0f} KiB")
+    for name, (seconds, _) in timings.items():
+        print(f"  {name}: {seconds / lookups * 1e6:.2f} us/次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="周时段表基准测试")
+    parser.add_argument("--db", default="announcements.db", help="SQLite数据库文件路径")
+    parser.add_argument("--synthetic", type=int, default=100000, help="合成规则条数")
+    parser.add_argument("--lookups", type=int, default=200000, help="查询次数")
+    args = parser.parse_args()
+
+    bench("真实表", args.db, args.lookups)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = create_synthetic_db(os.path.join(tmp_dir, "synthetic.db"), args.synthetic)
+        bench("合成表", db_path, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+流向查询服务压力测试：在本机启动 LookupService，建立大量并发长连接持续请求 /lookup，
+报告吞吐量与 p50/p99 延迟。
+
+在项目根目录运行:
+    python -m benchmarks.load_test_lookup_service [--connections 1000] [--requests 20] [--db announcements.db]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+
+async def wait_until_ready(host, port, timeout=30.0):
+    """等待服务可以接受连接，返回已加载的规则代码数"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        writer.write(f"GET /health HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return json.loads(response.split(b"\r\n\r\n", 1)[1])["rule_count"]
+    raise TimeoutError("查询服务未能在规定时间内启动")
+
+
+def fetch_codes(db_path):
+    """读取数据库中的全部代码作为请求样本"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute("SELECT 代码 FROM warehouse_management")]
+    finally:
+        conn.close()
+
+
+async def client(host, port, codes, request_count, latencies, errors, start_event):
+    """单个长连接客户端：连接建立后等待统一开始信号，再顺序发送请求"""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        errors.append("connect")
+        return
+    await start_event.wait()
+
+    rng = random.Random()
+    try:
+        for _ in range(request_count):
+            request = (f"GET /lookup?code={quote(rng.choice(codes))} HTTP/1.1\r\n"
+                       f"Host: {host}\r\n\r\n").encode()
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = next(int(line.split(b":", 1)[1]) for line in head.split(b"\r\n")
+                          if line.lower().startswith(b"content-length"))
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if not head.startswith(b"HTTP/1.1 200"):
+                errors.append(head.split(b"\r\n", 1)[0].decode())
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errors.append(type(e).__name__)
+    finally:
+        writer.close()
+
+
+async def run_load_test(args):
+    rule_count = await wait_until_ready(args.host, args.port)
+    codes = fetch_codes(args.db)
+    print(f"服务已就绪，规则 {rule_count} 条；建立 {args.connections} 个并发连接，每个连接 {args.requests} 次请求")
+
+    latencies = []
+    errors = []
+    start_event = asyncio.Event()
+    tasks = [asyncio.create_task(client(args.host, args.port, codes, args.requests, latencies, errors, start_event))
+             for _ in range(args.connections)]
+    await asyncio.sleep(1.0)  # 等待所有连接建立
+
+    started = time.perf_counter()
+    start_event.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    if not latencies:
+        print("没有成功的请求", errors[:5])
+        return
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"完成请求 {len(latencies)} 次，失败 {len(errors)} 次，耗时 {elapsed:.2f}s，"
+          f"吞吐 {len(latencies) / elapsed:.0f} 请求/秒")
+    print(f"延迟 p50 {quantiles[49] * 1000:.2f} ms  p99 {quantiles[98] * 1000:.2f} ms  "
+          f"max {max(latencies) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流向查询服务压力测试")
+    parser.add_argument("--host", default="127.0.0.1", help="服务地址")
+    parser.add_argument("--port", type=int, default=8601, help="服务端口")
+    parser.add_argument("--db", default="announcements.db", help="SQLite数据库文件路径")
+    parser.add_argument("--connections", type=int, default=1000, help="并发连接数")
+    parser.add_argument("--requests", type=int, default=20, help="每个连接的请求数")
+    parser.add_argument("--external", action="store_true", help="不启动服务，直接测试已在运行的实例")
+    args = parser.parse_args()
+
+    server = None
+    if not args.external:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "PublicManagerClass.LookupService",
+             "--host", args.host, "--port", str(args.port), "--db", args.db],
+            stdout=subprocess.DEVNULL
+        )
+    try:
+        asyncio.run(run_load_test(args))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
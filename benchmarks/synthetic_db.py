@@ -0,0 +1,83 @@
+"""
+基准测试共用的合成数据：按真实规则表的写法生成时间规则和 warehouse_management 表。
+"""
+import datetime
+import random
+import sqlite3
+
+WAREHOUSE_COLUMNS = ("代码", "映射", "流向", "物理位置1", "物理位置2",
+                     "位置1适用时间", "位置2适用时间", "月台1", "月台2", "挂靠流向")
+
+LOCATIONS = ("一号库前排", "一号库后排", "二号库前排", "三号库前排", "三号库后排",
+             "四号库前排", "四号库后排", "一号库前排A1-A2卡位", "一号库前排A3-A5卡位")
+
+FLOW_NAMES = ("鄞州", "顺心", "航泰路", "江口", "高桥", "邱隘", "余姚", "太平鸟", "定海", "周巷",
+              "春晓", "舟山", "杭州湾", "坎墩", "陆巷", "江北", "庄市", "六横", "舜宇", "东陈",
+              "梅林", "黄坛", "东钱湖", "渤海", "景江", "龙山")
+
+
+def sample_times(count, seed=0):
+    """生成覆盖整周的随机时间点"""
+    rng = random.Random(seed)
+    base = datetime.datetime(2024, 1, 1)  # 星期一
+    return [base + datetime.timedelta(minutes=rng.randrange(7 * 24 * 60)) for _ in range(count)]
+
+
+def synthetic_rules(count, seed=0):
+    """生成合成规则表：随机组合星期区间与截止时间"""
+    rng = random.Random(seed)
+    rules = []
+    for _ in range(count):
+        if rng.random() < 0.4:
+            rules.append("all")
+            continue
+        parts = []
+        for _ in range(rng.randint(1, 2)):
+            start_day = rng.randint(1, 7)
+            end_day = rng.randint(start_day, 7)
+            day_part = str(start_day) if start_day == end_day else f"{start_day}-{end_day}"
+            parts.append(f"{day_part}:{rng.randint(0, 23):02d}{rng.choice((0, 30)):02d}")
+        rules.append("or".join(parts))
+    return rules
+
+
+def synthetic_rows(count, seed=0):
+    """
+    生成合成的 warehouse_management 行，约 5% 的流向挂靠到其他映射码。
+    时间规则取自真实表常见写法，代码、映射唯一。
+    """
+    rng = random.Random(seed)
+    common_rules = ("all", "7:0600or1-7:1230", "2-6:0600", "1-7:0600", "1-7:1230")
+    rows = []
+    for index in range(count):
+        rule1 = rng.choice(common_rules)
+        has_second = rng.random() < 0.3
+        rows.append((
+            f"S{index:07d}",
+            f"M{index}",
+            f"{rng.choice(FLOW_NAMES)}{index % 97}",
+            rng.choice(LOCATIONS),
+            rng.choice(LOCATIONS) if has_second else None,
+            rule1,
+            rng.choice(common_rules) if has_second else None,
+            None,
+            None,
+            f"M{rng.randrange(count)}" if rng.random() < 0.05 else None
+        ))
+    return rows
+
+
+def create_synthetic_db(db_path, count, seed=0):
+    """创建包含合成 warehouse_management 表的数据库文件"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("DROP TABLE IF EXISTS warehouse_management")
+        conn.execute(f"CREATE TABLE warehouse_management ({', '.join(f'{col} TEXT(255)' for col in WAREHOUSE_COLUMNS)})")
+        conn.executemany(
+            f"INSERT INTO warehouse_management VALUES ({', '.join('?' * len(WAREHOUSE_COLUMNS))})",
+            synthetic_rows(count, seed)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return db_path
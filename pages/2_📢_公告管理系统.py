@@ -1,8 +1,10 @@
 # 保存为 pages/2_📢_公告管理系统.py
+import io
 import time
 
 import streamlit as st
 from PublicManagerClass.AnnouncementManager import *
+from PublicManagerClass.TableExporter import TableExporter
 from datetime import datetime, timedelta
 import os
 
@@ -354,6 +356,35 @@ def manage_announcements(manager):
                 st.rerun()
 
 
+# 导出公告页面
+def export_announcements(manager):
+    st.header("导出公告")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fmt = st.selectbox("导出格式", list(TableExporter.FORMATS), key="announcement_export_format")
+    with col2:
+        include_deleted = st.checkbox("包含已删除的公告", value=True, key="announcement_export_include_deleted")
+
+    if st.button("生成导出文件", key="announcement_export_button"):
+        buffer = io.BytesIO()
+        try:
+            with st.spinner("正在导出..."):
+                count = manager.export_announcements(buffer, fmt, include_deleted=include_deleted)
+        except ValueError as e:
+            st.error(f"导出失败: {e}")
+            return
+        st.session_state.announcement_export_file = (fmt, include_deleted, buffer.getvalue(), count)
+
+    export_file = st.session_state.get("announcement_export_file")
+    if export_file and export_file[:2] == (fmt, include_deleted):
+        _, _, data, count = export_file
+        exporter = TableExporter(fmt)
+        st.download_button(f"下载（{count} 条公告）", data,
+                           file_name=f"announcements_{datetime.now():%Y%m%d_%H%M%S}{exporter.extension}",
+                           mime=exporter.mime_type, on_click="ignore", key="announcement_export_download")
+
+
 # 主页面函数
 def main():
     # 应用访问控制
@@ -374,7 +405,8 @@ def main():
         "公告列表": show_announcement_list,
         "创建公告": create_announcement,
         "搜索公告": search_announcements,
-        "管理公告": manage_announcements
+        "管理公告": manage_announcements,
+        "导出公告": export_announcements
     }
 
     # 侧边栏导航
@@ -1,6 +1,11 @@
 # app.py - 数据管理界面
+import io
 import streamlit as st
 from PublicManagerClass.TableManager import GenericDataManager
+from PublicManagerClass.TableExporter import TableExporter
+from PublicManagerClass.SharedRuleEngine import notify_rules_changed
+from PublicManagerClass.RuleImporter import RuleImporter
+from PublicManagerClass.WarehouseRuleManager import check_time_rule
 import time
 
 # 设置页面配置
@@ -79,6 +84,148 @@ def access_control():
         st.stop()  # 停止执行后续代码直到密码正确
 
 
+# 行选择器搜索时同时匹配的列
+PICKER_COLUMNS = [col for col in ("流向", "映射") if col in data_manager.columns]
+# 每页行数选项
+PAGE_SIZE_OPTIONS = [20, 50, 100, 200]
+
+
+# 分页浏览数据表格（筛选、排序和翻页都由数据库完成，每次只读取一页）
+def data_table_view():
+    st.subheader("数据表格")
+
+    with st.expander("筛选与排序"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            filter_column = st.selectbox("筛选列", data_manager.columns, key="filter_column")
+        with col2:
+            operators = list(GenericDataManager.FILTER_OPERATORS)
+            operator = st.selectbox("条件", operators, index=operators.index("包含"), key="filter_operator")
+        with col3:
+            filter_value = st.text_input("值", key="filter_value",
+                                         disabled=operator in ("为空", "不为空"))
+        sortable_columns = data_manager.sortable_columns()
+        missing_indexes = [col for col in GenericDataManager.SORT_INDEX_COLUMNS
+                           if col in data_manager.columns and col not in sortable_columns]
+        if missing_indexes:
+            # 建立索引会修改表结构，由管理员在这里显式执行，不在打开页面时自动执行
+            st.caption(f"{'、'.join(missing_indexes)} 尚未建立索引，不能按其排序")
+            if st.button("建立排序索引", key="create_sort_indexes"):
+                if data_manager.ensure_sort_indexes(missing_indexes):
+                    st.rerun()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            # 只提供有索引的列，翻到任何一页都只读取一个索引区间
+            order_by = st.selectbox("排序列", sortable_columns or [data_manager.primary_key], key="order_by")
+        with col2:
+            page_size = st.selectbox("每页行数", PAGE_SIZE_OPTIONS, index=1, key="page_size")
+        with col3:
+            descending = st.checkbox("降序", key="order_descending")
+
+    filters = []
+    if operator in ("为空", "不为空"):
+        filters.append((filter_column, operator, None))
+    elif filter_value:
+        filters.append((filter_column, operator, filter_value))
+
+    # 查询条件变化时回到第一页；table_pages 保存每一页的翻页游标
+    query = (tuple(filters), order_by, descending, page_size)
+    if st.session_state.get("table_query") != query:
+        st.session_state.table_query = query
+        st.session_state.table_pages = [None]
+    pages = st.session_state.table_pages
+
+    df, next_cursor = data_manager.query_rows(filters, order_by, descending, pages[-1], page_size)
+    total = data_manager.count_rows(filters)
+    edit_mode = st.toggle("表格编辑", key="grid_edit_mode", help="直接在表格中修改、增加或删除行，保存时只写入改动的单元格")
+    if edit_mode:
+        # 每一页、每次保存后使用新的编辑器，避免把旧的改动套用到刷新后的数据上
+        grid_editor(df, f"grid_editor_{hash((query, len(pages)))}_{st.session_state.get('grid_version', 0)}")
+    elif df.empty and len(pages) == 1:
+        st.warning("没有符合条件的数据" if filters else "表中没有数据")
+        return
+    else:
+        st.dataframe(df, use_container_width=True, hide_index=True)
+
+    col1, col2, col3 = st.columns([1, 3, 1])
+    with col1:
+        if st.button("⬅️ 上一页", disabled=len(pages) == 1, use_container_width=True):
+            pages.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"第 {len(pages)} 页，共 {max(1, -(-total // page_size))} 页（{total} 行）")
+    with col3:
+        if st.button("下一页 ➡️", disabled=next_cursor is None, use_container_width=True):
+            pages.append(next_cursor)
+            st.rerun()
+
+
+# 检查表格改动中的时间规则
+def grid_errors(changes):
+    errors = []
+    rows = [(key, cells) for key, cells in changes["updates"]]
+    rows += [(row_data.get(data_manager.primary_key), row_data) for row_data in changes["inserts"]]
+    for key, cells in rows:
+        for rule_column in RuleImporter.TIME_RULE_COLUMNS.values():
+            if cells.get(rule_column) is not None:
+                try:
+                    check_time_rule(cells[rule_column])
+                except ValueError as e:
+                    errors.append(f"{key or '新行'} 的{rule_column}: {e}")
+    return errors
+
+
+# 表格编辑：在表单中编辑，提交前不触发页面重新运行；保存时只写入改动的单元格，且在一个事务中完成
+def grid_editor(df, editor_key):
+    with st.form(key="grid_edit_form"):
+        st.data_editor(df, key=editor_key, num_rows="dynamic", use_container_width=True, hide_index=True)
+        submitted = st.form_submit_button("保存修改")
+    if not submitted:
+        return
+
+    # 使用编辑器分别记录的修改、新增和删除，而不是按索引比较前后两个表格
+    changes = data_manager.editor_changes(df, st.session_state[editor_key])
+    if not any(changes.values()):
+        st.info("没有修改")
+        return
+    errors = grid_errors(changes)
+    if errors:
+        for error in errors:
+            st.error(error)
+        return
+
+    report = data_manager.apply_changes(**changes)
+    if "error" in report:
+        return
+    # 写入后行的位置可能变化，换用新的编辑器
+    st.session_state.grid_version = st.session_state.get("grid_version", 0) + 1
+    if report["succeeded"]:
+        # 一次保存只让规则缓存失效一次
+        notify_rules_changed()
+    if report["failures"]:
+        st.error(f"{len(report['failures'])} 处改动保存失败，其余 {report['succeeded']} 处已保存")
+        st.dataframe([{data_manager.primary_key: item["key"], "错误": item["error"]}
+                      for item in report["failures"]], use_container_width=True, hide_index=True)
+    else:
+        st.success(f"已保存：修改 {len(changes['updates'])} 行，新增 {len(changes['inserts'])} 行，"
+                   f"删除 {len(changes['deletes'])} 行")
+        st.rerun()
+
+
+# 可搜索的行选择器，只读取与关键字匹配的前若干行
+def row_picker(label, key):
+    keyword = st.text_input(f"搜索{'/'.join([data_manager.primary_key] + PICKER_COLUMNS)}", key=f"{key}_keyword")
+    candidates = dict(data_manager.find_keys(keyword, PICKER_COLUMNS))
+    if not candidates:
+        st.info("没有匹配的行")
+        return None
+    if len(candidates) >= data_manager.PICKER_LIMIT:
+        st.caption(f"仅显示前 {data_manager.PICKER_LIMIT} 个匹配项，输入更多字符可缩小范围")
+    return st.selectbox(label, list(candidates), key=f"{key}_select",
+                        format_func=lambda row_id: " / ".join(str(value) for value in candidates[row_id].values()
+                                                              if value))
+
+
 # 添加新行表单
 def add_row_form():
     st.subheader("添加新行")
@@ -97,6 +244,7 @@ def add_row_form():
         if submitted:
             # 添加新行
             if data_manager.add_row(row_data):
+                notify_rules_changed()
                 st.success("添加成功!")
                 st.rerun()
             else:
@@ -104,16 +252,11 @@ def add_row_form():
 
 
 # 编辑行表单
-def edit_row_form(df):
+def edit_row_form():
     st.subheader("编辑行")
 
     # 选择要编辑的行
-    if df.empty:
-        st.warning("没有数据可编辑")
-        return
-
-    row_options = df[data_manager.primary_key].tolist()
-    selected_row = st.selectbox("选择要编辑的行", row_options)
+    selected_row = row_picker("选择要编辑的行", "edit_picker")
 
     if selected_row:
         # 获取选中行的数据
@@ -134,6 +277,7 @@ def edit_row_form(df):
                 if submitted:
                     # 更新行
                     if data_manager.update_row(selected_row, new_data):
+                        notify_rules_changed()
                         st.success("更新成功!")
                         st.rerun()
                     else:
@@ -143,16 +287,11 @@ def edit_row_form(df):
 
 
 # 删除行表单
-def delete_row_form(df):
+def delete_row_form():
     st.subheader("删除行")
 
-    if df.empty:
-        st.warning("没有数据可删除")
-        return
-
     # 选择要删除的行
-    row_options = df[data_manager.primary_key].tolist()
-    selected_row = st.selectbox("选择要删除的行", row_options)
+    selected_row = row_picker("选择要删除的行", "delete_picker")
 
     if selected_row:
         # 显示确认对话框
@@ -160,12 +299,106 @@ def delete_row_form(df):
             if st.warning("确定要删除这一行吗？此操作不可撤销！"):
                 # 删除行
                 if data_manager.delete_row(selected_row):
+                    notify_rules_changed()
                     st.success("删除成功!")
                     st.rerun()
                 else:
                     st.error("删除失败")
 
 
+# 批量导入表单
+def import_rows_form():
+    st.subheader("批量导入")
+    st.caption("上传与数据表列名相同的 CSV 或 XLSX 文件（如 代码映射关系表.csv），先检查并预览差异，确认后再写入。"
+               "表中已有的代码将被更新，文件中留空的列会清空原值。")
+
+    uploaded_file = st.file_uploader("选择文件", type=["csv", "xlsx"], key="import_file")
+    if uploaded_file is None:
+        st.session_state.pop("import_report", None)
+        return
+
+    importer = RuleImporter(data_manager)
+    file_id = (uploaded_file.name, uploaded_file.size)
+    report = st.session_state.get("import_report")
+    if report is None or report["file_id"] != file_id:
+        try:
+            with st.spinner("正在检查文件..."):
+                report = importer.run(uploaded_file, dry_run=True)
+        except ValueError as e:
+            st.error(f"无法导入: {e}")
+            return
+        report["file_id"] = file_id
+        st.session_state.import_report = report
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("新增", report["inserted"])
+    col2.metric("修改", report["updated"])
+    col3.metric("不变", report["unchanged"])
+    col4.metric("无效", len(report["invalid"]))
+
+    if report["invalid"]:
+        with st.expander(f"无效行（{len(report['invalid'])}）", expanded=True):
+            st.dataframe([{"行号": item["line"], "代码": item["key"], "错误": "；".join(item["errors"])}
+                          for item in report["invalid"]], use_container_width=True, hide_index=True)
+    if report["warnings"]:
+        with st.expander(f"提醒（{len(report['warnings'])}）"):
+            st.dataframe([{"行号": item["line"], "代码": item["key"], "提醒": item["message"]}
+                          for item in report["warnings"]], use_container_width=True, hide_index=True)
+    if report["changes"]:
+        with st.expander(f"差异预览（{report['inserted'] + report['updated']}）", expanded=True):
+            st.dataframe([{"行号": item["line"], "代码": item["key"], "操作": item["action"],
+                           "变化": "；".join(f"{col}: {old or '空'} → {new or '空'}"
+                                           for col, (old, new) in item["columns"].items())}
+                          for item in report["changes"]], use_container_width=True, hide_index=True)
+            if len(report["changes"]) < report["inserted"] + report["updated"]:
+                st.caption(f"仅显示前 {len(report['changes'])} 条")
+
+    if not report["inserted"] and not report["updated"]:
+        st.info("文件与当前数据一致，无需导入")
+        return
+
+    skip_invalid = False
+    if report["invalid"]:
+        skip_invalid = st.checkbox("跳过无效行，导入其余行", key="import_skip_invalid")
+    if st.button("导入", type="primary", disabled=bool(report["invalid"]) and not skip_invalid):
+        progress = st.progress(0.0, text="正在导入...")
+        result = importer.run(uploaded_file, dry_run=False, skip_invalid=skip_invalid, notify=notify_rules_changed,
+                              on_progress=lambda done, total: progress.progress(done / max(total, 1),
+                                                                                text=f"正在导入 {done}/{total}"))
+        st.session_state.pop("import_report", None)
+        if result["failures"]:
+            st.error(f"{len(result['failures'])} 行写入失败")
+            st.dataframe([{"行号": item["line"], "代码": item["key"], "错误": item["error"]}
+                          for item in result["failures"]], use_container_width=True, hide_index=True)
+        if result["written"]:
+            st.success(f"导入完成：新增 {result['inserted']} 行，修改 {result['updated']} 行")
+
+
+# 导出数据表单
+def export_rows_form():
+    st.subheader("导出数据")
+    st.caption("按批读取整张表并逐批写入文件，可用于与总部主数据对账")
+
+    fmt = st.selectbox("导出格式", list(TableExporter.FORMATS), key="export_format")
+    if st.button("生成导出文件", key="export_button"):
+        buffer = io.BytesIO()
+        try:
+            with st.spinner("正在导出..."):
+                count = data_manager.export_data(buffer, fmt)
+        except ValueError as e:
+            st.error(f"导出失败: {e}")
+            return
+        st.session_state.export_file = (fmt, buffer.getvalue(), count)
+
+    export_file = st.session_state.get("export_file")
+    if export_file and export_file[0] == fmt:
+        fmt, data, count = export_file
+        exporter = TableExporter(fmt)
+        st.download_button(f"下载（{count} 行）", data,
+                           file_name=f"{data_manager.table_name}_{time.strftime('%Y%m%d_%H%M%S')}{exporter.extension}",
+                           mime=exporter.mime_type, on_click="ignore", key="export_download")
+
+
 # 主应用
 def main():
     # 应用访问控制
@@ -174,25 +407,22 @@ def main():
     st.title("📊 流向管理")
     st.markdown(f"当前管理表: **{data_manager.table_name}**")
 
-    # 显示所有数据
-    st.subheader("数据表格")
-    df = data_manager.get_all_data()
-
-    if df.empty:
-        st.warning("表中没有数据")
-    else:
-        # 显示数据表格
-        st.dataframe(df, use_container_width=True)
+    # 分页显示数据
+    data_table_view()
 
     # 操作选项
-    operation = st.sidebar.radio("选择操作", ["添加新行", "编辑行", "删除行"])
+    operation = st.sidebar.radio("选择操作", ["添加新行", "编辑行", "删除行", "批量导入", "导出数据"])
 
     if operation == "添加新行":
         add_row_form()
     elif operation == "编辑行":
-        edit_row_form(df)
+        edit_row_form()
     elif operation == "删除行":
-        delete_row_form(df)
+        delete_row_form()
+    elif operation == "批量导入":
+        import_rows_form()
+    elif operation == "导出数据":
+        export_rows_form()
 
     # 添加返回首页按钮
     st.sidebar.markdown("---")
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.synthetic_db import create_synthetic_db
+from PublicManagerClass.FlowSearchIndex import FlowSearchIndex
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "announcements.db")
+QUERIES = ("1", "57", "574", "W", "tj", "余姚", "库", "J1", "不存在的流向", "a b", "%", "_")
+
+
+def linear_search(warehouse_rules, query):
+    """逐条扫描的原始搜索：按表中顺序，依次检查代码、流向、映射是否包含查询串（不区分大小写）"""
+    results = []
+    if not query:
+        return results
+    query_lower = query.lower()
+    for code, rule_info in warehouse_rules.items():
+        for field_type, text in (("代码", code), ("流向", rule_info['name']), ("映射", rule_info['mapping'])):
+            if query_lower in (text or "").lower():
+                results.append((field_type, code))
+                break
+    return results
+
+
+class FlowSearchIndexTest(unittest.TestCase):
+    """搜索索引的结果与逐条扫描一致（拼音匹配是索引额外提供的，比较时除外），且只在首次搜索时构建"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def manager(self, db_path):
+        manager = WarehouseRuleManager(db_path, background_refresh=False, report_stream=open(os.devnull, "w"))
+        self.addCleanup(manager.report_stream.close)
+        self.addCleanup(manager.close)
+        return manager
+
+    def assert_matches_linear(self, manager):
+        rules = manager.load_rules_from_database()
+        for query in QUERIES:
+            with self.subTest(query=query):
+                expected = linear_search(rules, query)
+                results = manager.search_flows(query, limit=None)
+                self.assertEqual([(result["type"], result["code"]) for result in results
+                                  if result["type"] != "拼音"], expected)
+
+                limited = [(result["type"], result["code"]) for result in manager.search_flows(query, limit=10)]
+                self.assertEqual(limited, [(result["type"], result["code"]) for result in results][:10])
+
+    def test_announcements_db(self):
+        db_path = os.path.join(self.tmp_dir.name, "rules.db")
+        shutil.copy(DB_PATH, db_path)
+        self.assert_matches_linear(self.manager(db_path))
+
+    def test_synthetic_db(self):
+        db_path = os.path.join(self.tmp_dir.name, "synthetic.db")
+        create_synthetic_db(db_path, 3000)
+        self.assert_matches_linear(self.manager(db_path))
+
+    def test_index_is_built_on_first_search(self):
+        db_path = os.path.join(self.tmp_dir.name, "rules.db")
+        shutil.copy(DB_PATH, db_path)
+        manager = self.manager(db_path)
+        manager.load_rules_from_database()
+        self.assertIsNone(manager.snapshot.search_index)
+        manager.search_flows("574")
+        self.assertIsNotNone(manager.snapshot.search_index)
+
+    def test_similar_matches_brute_force(self):
+        db_path = os.path.join(self.tmp_dir.name, "synthetic.db")
+        create_synthetic_db(db_path, 300)
+        rules = self.manager(db_path).load_rules_from_database()
+        index = FlowSearchIndex(rules)
+
+        # 逐条插入得到的对称删除索引与一次性构建的相同
+        incremental = FlowSearchIndex({})
+        for code, rule_info in rules.items():
+            incremental.upsert(code, rule_info)
+        self.assertEqual(incremental.delete_postings, index.delete_postings)
+
+        texts = [text for code, rule_info in list(rules.items())[:40] for text in (code, rule_info["mapping"]) if text]
+        typos = {query for text in texts for query in (text[1:], text[:2] + "x" + text[2:], text[:-1] + "#",
+                                                        text[1] + text[0] + text[2:])}
+        for query in sorted(typos):
+            with self.subTest(query=query):
+                expected = set()
+                max_distance = FlowSearchIndex.SIMILAR_MAX_DISTANCE
+                for code, rule_info in rules.items():
+                    for text in (code, rule_info["mapping"] or ""):
+                        if min(len(text), len(query)) >= FlowSearchIndex.SIMILAR_MIN_LENGTH and \
+                                FlowSearchIndex.edit_distance(query.lower(), text.lower(), max_distance) <= max_distance:
+                            expected.add(code)
+                if len(expected) < FlowSearchIndex.SIMILAR_MAX_CANDIDATES:
+                    self.assertEqual({match["code"] for match in index.similar(query, limit=None)}, expected)
+
+    @unittest.skipUnless(FlowSearchIndex.PINYIN_AVAILABLE, "未安装 pypinyin")
+    def test_pinyin_is_opt_in(self):
+        db_path = os.path.join(self.tmp_dir.name, "synthetic.db")
+        create_synthetic_db(db_path, 300)
+        self.assertNotIn("拼音", {result["type"] for result in self.manager(db_path).search_flows("yy")})
+
+        manager = WarehouseRuleManager(db_path, background_refresh=False, report_stream=open(os.devnull, "w"),
+                                       pinyin_search=True)
+        self.addCleanup(manager.report_stream.close)
+        self.addCleanup(manager.close)
+        results = [result for result in manager.search_flows("yy") if result["type"] == "拼音"]
+        self.assertTrue(results)
+        self.assertTrue(all(result["name"].startswith("余姚") for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from PublicManagerClass.TableManager import GenericDataManager
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "announcements.db")
+
+
+class GridChangesTest(unittest.TestCase):
+    """表格编辑的改动按编辑器记录的修改、新增、删除整理，并按主键写入"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "rules.db")
+        shutil.copy(DB_PATH, self.db_path)
+        self.manager = GenericDataManager(self.db_path)
+        self.page = self.manager.query_rows(limit=5)[0]
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp_dir.cleanup()
+
+    def keys(self):
+        return {row[0] for row in self.manager.conn.execute("SELECT 代码 FROM warehouse_management")}
+
+    def test_delete_trailing_rows_and_add_one(self):
+        # 删除末尾两行再新增一行：新行不能被当成对已删除行的修改
+        deleted = [self.page["代码"].iloc[3], self.page["代码"].iloc[4]]
+        state = {"edited_rows": {}, "added_rows": [{"代码": "新增测试", "流向": "测试流向"}], "deleted_rows": [3, 4]}
+        changes = self.manager.editor_changes(self.page, state)
+        self.assertEqual(changes["updates"], [])
+        self.assertEqual(changes["deletes"], deleted)
+        self.assertEqual(changes["inserts"], [{"代码": "新增测试", "流向": "测试流向"}])
+
+        report = self.manager.apply_changes(**changes)
+        self.assertEqual(report, {"succeeded": 3, "failures": []})
+        keys = self.keys()
+        self.assertIn("新增测试", keys)
+        self.assertFalse(keys & set(deleted))
+
+    def test_only_changed_cells_are_updated(self):
+        key = self.page["代码"].iloc[0]
+        state = {"edited_rows": {"0": {"流向": "改后流向", "代码": key}, 1: {"流向": self.page["流向"].iloc[1]}},
+                 "added_rows": [{}], "deleted_rows": []}
+        changes = self.manager.editor_changes(self.page, state)
+        self.assertEqual(changes, {"updates": [(key, {"流向": "改后流向"})], "inserts": [], "deletes": []})
+
+    def test_null_key_is_reported(self):
+        report = self.manager.apply_changes(updates=[(None, {"流向": "x"})], deletes=[None])
+        self.assertEqual(report["succeeded"], 0)
+        self.assertEqual([failure["index"] for failure in report["failures"]], [0, 1])
+
+    def test_existence_query_error_is_reported(self):
+        # 写入前查询已存在主键时出错，与写入出错一样返回带 error 的报告，不抛出异常
+        key = self.page["代码"].iloc[0]
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("ALTER TABLE warehouse_management RENAME TO warehouse_management_old")
+        conn.close()
+        upsert_report = self.manager.upsert_rows([{"代码": key, "流向": "x"}, {"流向": "缺主键"}])
+        self.assertEqual([failure["index"] for failure in upsert_report["failures"]], [1])
+        for report in (upsert_report, self.manager.delete_rows([key])):
+            self.assertEqual(report["succeeded"], 0)
+            self.assertIn("no such table", report["error"])
+            self.assertFalse(self.manager.conn.in_transaction)
+
+
+if __name__ == "__main__":
+    unittest.main()
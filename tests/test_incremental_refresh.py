@@ -0,0 +1,92 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.synthetic_db import create_synthetic_db, sample_times
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+
+SNAPSHOT_FIELDS = ("warehouse_rules", "mapping_index", "flow_index", "duplicate_mappings", "attached_index",
+                   "attachment_closure", "load_report", "weekly_schedules", "code_positions")
+QUERIES = ("S00000", "M1", "余姚", "改名", "新增", "S0000299")
+
+
+class IncrementalRefreshTest(unittest.TestCase):
+    """按变更日志增量修补的快照与全量重新加载的快照一致"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "synthetic.db")
+        create_synthetic_db(self.db_path, 300)
+        self.manager = self.open_manager(reload_check_interval=0, build_search_index=True)
+        self.assertTrue(self.manager.ensure_change_log())
+        self.manager.load_rules_from_database()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def open_manager(self, **kwargs):
+        manager = WarehouseRuleManager(self.db_path, precompute_schedule=True, background_refresh=False,
+                                       report_stream=open(os.devnull, "w"), **kwargs)
+        self.addCleanup(manager.report_stream.close)
+        self.addCleanup(manager.close)
+        return manager
+
+    def apply(self, *statements):
+        """执行修改并增量刷新，确认没有回退到全量重新加载"""
+        with sqlite3.connect(self.db_path) as conn:
+            for statement, params in statements:
+                conn.execute(statement, params)
+        conn.close()
+        with mock.patch.object(self.manager, "_load_snapshot", wraps=self.manager._load_snapshot) as full_reload:
+            self.assertTrue(self.manager.reload_if_changed(force_check=True))
+        full_reload.assert_not_called()
+
+    def assert_matches_full_reload(self):
+        expected = self.open_manager(reload_check_interval=None, incremental_refresh=False)
+        expected.load_rules_from_database()
+        snapshot, full = self.manager.snapshot, expected.snapshot
+        for field in SNAPSHOT_FIELDS:
+            with self.subTest(field=field):
+                self.assertEqual(getattr(snapshot, field), getattr(full, field))
+        self.assertEqual(list(snapshot.warehouse_rules), list(full.warehouse_rules))
+
+        for query in QUERIES:
+            with self.subTest(query=query):
+                self.assertEqual(self.manager.search_flows(query, limit=None), expected.search_flows(query, limit=None))
+        for code, current_time in zip(list(full.warehouse_rules)[::7], sample_times(len(full.warehouse_rules))):
+            with self.subTest(code=code, current_time=current_time):
+                self.assertEqual(self.manager.find_current_locations(code, current_time),
+                                 expected.find_current_locations(code, current_time))
+
+    def test_edits_match_full_reload(self):
+        update = "UPDATE warehouse_management SET {} = ? WHERE 代码 = ?"
+        steps = {
+            "映射": [(update.format("映射"), ("M新1", "S0000001")),
+                   (update.format("映射"), ("M3", "S0000002"))],  # 与 S0000003 重复
+            "挂靠": [(update.format("挂靠流向"), ("M5", "S0000004")),
+                   (update.format("挂靠流向"), ("M4", "S0000005")),  # 循环挂靠
+                   (update.format("挂靠流向"), ("M不存在", "S0000006")),
+                   (update.format("挂靠流向"), ("M新1", "S0000007"))],
+            "新增": [("INSERT INTO warehouse_management (代码, 映射, 流向, 物理位置1, 位置1适用时间, 挂靠流向) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", ("S新增", "M新增", "新增流向", "一号库前排", "1-5:1200", "M8"))],
+            "删除": [("DELETE FROM warehouse_management WHERE 代码 = ?", ("S0000008",)),
+                   ("DELETE FROM warehouse_management WHERE 代码 = ?", ("S0000009",))],
+            "时间规则": [(update.format("位置1适用时间"), ("1-3:0900or6:1800", "S0000010")),
+                     (update.format("物理位置2"), ("二号库前排", "S0000010")),
+                     (update.format("位置2适用时间"), ("all", "S0000010"))],
+            "流向名称": [(update.format("流向"), ("改名流向", "S0000011")),
+                     (update.format("流向"), ("改名流向", "S0000012"))],
+            "撤销挂靠": [(update.format("挂靠流向"), (None, "S0000005")),
+                     (update.format("映射"), ("M2", "S0000002"))],
+        }
+        for name, statements in steps.items():
+            with self.subTest(step=name):
+                self.apply(*statements)
+                self.assert_matches_full_reload()
+
+
+if __name__ == "__main__":
+    unittest.main()
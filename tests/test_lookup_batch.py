@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from PublicManagerClass.LookupService import LookupService
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "announcements.db")
+
+
+class BatchRequestValidationTest(unittest.TestCase):
+    """POST /batch 的请求体格式错误时返回 400 而不是 500"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp_dir.name, "rules.db")
+        shutil.copy(DB_PATH, db_path)
+        self.manager = WarehouseRuleManager(db_path, background_refresh=False, report_stream=open(os.devnull, "w"))
+        self.service = LookupService(self.manager)
+
+    def tearDown(self):
+        self.manager.report_stream.close()
+        self.manager.close()
+        self.tmp_dir.cleanup()
+
+    def test_invalid_bodies(self):
+        for body in (b"[1, 2]", b'"574W"', b"null", b"{", b'{"codes": "574W"}', b'{"codes": [{"code": "574W"}]}',
+                     b'{"codes": ["574W", 1]}', b'{"codes": ["574W"], "time": 5}', b'{"codes": ["574W"], "time": "x"}'):
+            with self.subTest(body=body):
+                status, payload = self.service.dispatch("POST", "/batch", body)[:2]
+                self.assertEqual(status, 400, payload)
+                self.assertIn("error", payload)
+
+    def test_valid_body(self):
+        code = next(iter(self.manager.load_rules_from_database()))
+        status, payload = self.service.dispatch("POST", "/batch", f'{{"codes": ["{code}", "不存在"]}}'.encode())[:2]
+        self.assertEqual(status, 200, payload)
+        self.assertIsNone(payload["results"]["不存在"])
+        self.assertIsNotNone(payload["results"][code])
+
+
+if __name__ == "__main__":
+    unittest.main()
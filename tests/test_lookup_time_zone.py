@@ -0,0 +1,53 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from PublicManagerClass.LookupService import LookupService
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager, local_time
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "announcements.db")
+
+
+class LookupTimeZoneTest(unittest.TestCase):
+    """带时区的查询时间与缓存中的无时区有效期混用时不应出错（回归测试）"""
+
+    def setUp(self):
+        # 在临时副本上测试，不修改仓库中的数据库
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp_dir.name, "rules.db")
+        shutil.copy(DB_PATH, db_path)
+        self.manager = WarehouseRuleManager(db_path, background_refresh=False, report_stream=open(os.devnull, "w"))
+        self.manager.load_rules_from_database()
+        self.code = next(iter(self.manager.warehouse_rules))
+
+    def tearDown(self):
+        self.manager.report_stream.close()
+        self.manager.close()
+        self.tmp_dir.cleanup()
+
+    def test_aware_after_naive(self):
+        naive = datetime.datetime(2024, 1, 1, 10, 0)
+        aware = naive.astimezone()  # 同一时刻，带本地时区
+        expected = self.manager.find_current_locations(self.code, naive)
+        self.assertEqual(self.manager.find_current_locations(self.code, aware), expected)
+        self.assertEqual(self.manager.next_location_change(self.code, aware),
+                         self.manager.next_location_change(self.code, naive))
+
+    def test_aware_time_uses_local_wall_clock(self):
+        aware = datetime.datetime(2024, 1, 1, 10, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=8)))
+        self.manager.find_current_locations(self.code, datetime.datetime(2024, 1, 1, 3, 0))
+        self.assertEqual(self.manager.find_current_locations(self.code, aware),
+                         self.manager.find_current_locations(self.code, local_time(aware)))
+        self.assertIsNone(local_time(aware).tzinfo)
+
+    def test_lookup_service_accepts_offset(self):
+        service = LookupService(self.manager)
+        service.dispatch("GET", f"/lookup?code={self.code}&time=2024-01-01T10:00", b"")
+        status, payload, *_ = service.dispatch("GET", f"/lookup?code={self.code}&time=2024-01-01T10:00%2B08:00", b"")
+        self.assertEqual(status, 200, payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
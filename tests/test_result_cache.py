@@ -0,0 +1,57 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks.synthetic_db import create_synthetic_db
+from PublicManagerClass.LookupService import LookupService
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+
+
+class ResultCacheTest(unittest.TestCase):
+    """结果缓存超过上限时只淘汰最久未使用的条目，缓存的结果不能被调用方修改"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp_dir.name, "synthetic.db")
+        create_synthetic_db(db_path, 50)
+        self.manager = WarehouseRuleManager(db_path, background_refresh=False, report_stream=open(os.devnull, "w"))
+        self.manager.RESULT_CACHE_SIZE = 10
+        self.codes = list(self.manager.load_rules_from_database())
+        self.now = datetime.datetime(2024, 1, 1, 10, 0)
+
+    def tearDown(self):
+        self.manager.report_stream.close()
+        self.manager.close()
+        self.tmp_dir.cleanup()
+
+    def test_evicts_least_recently_used(self):
+        hot = self.codes[0]
+        self.manager.find_current_locations(hot, self.now)
+        for code in self.codes[1:]:
+            self.manager.find_current_locations(hot, self.now)
+            self.manager.find_current_locations(code, self.now)
+            self.assertLessEqual(len(self.manager._result_cache), self.manager.RESULT_CACHE_SIZE)
+        # 反复查询的代码一直留在缓存中，其余位置留给最近查询的代码
+        cached = {key[0] for key in self.manager._result_cache}
+        self.assertEqual(cached, {hot} | set(self.codes[-(self.manager.RESULT_CACHE_SIZE - 1):]))
+
+    def test_cached_results_are_read_only(self):
+        code = self.codes[0]
+        results = self.manager.find_current_locations(code, self.now)
+        with self.assertRaises(TypeError):
+            results[0]["当前物理位置"] = "已修改"
+        with self.assertRaises(AttributeError):
+            results.append({})
+        self.assertEqual(self.manager.find_current_locations(code, self.now), results)
+
+        status, payload = LookupService(self.manager).dispatch("GET", f"/lookup?code={code}&time=2024-01-01T10:00",
+                                                               b"")[:2]
+        self.assertEqual(status, 200, payload)
+        self.assertEqual(json.loads(json.dumps(payload, ensure_ascii=False))["results"],
+                         [dict(result) for result in results])
+
+
+if __name__ == "__main__":
+    unittest.main()
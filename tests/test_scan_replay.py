@@ -0,0 +1,95 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+
+from benchmarks.synthetic_db import create_synthetic_db, sample_times
+from PublicManagerClass.ScanReplayEngine import UNKNOWN_LOCATION, ScanReplayEngine
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "announcements.db")
+
+
+@unittest.skipUnless(hasattr(time, "tzset"), "需要 time.tzset 切换本地时区")
+class ScanReplayTest(unittest.TestCase):
+    """回放结果与逐条调用 find_current_locations 一致，带时区的扫描时间同样按本地时间计算"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_tz = os.environ.get("TZ")
+        # 本地时区不是 UTC 时，按 UTC 计算的结果才会与实时查询不同
+        os.environ["TZ"] = "Asia/Shanghai"
+        time.tzset()
+
+    def tearDown(self):
+        if self.original_tz is None:
+            os.environ.pop("TZ", None)
+        else:
+            os.environ["TZ"] = self.original_tz
+        time.tzset()
+        self.tmp_dir.cleanup()
+
+    def manager(self, db_path):
+        manager = WarehouseRuleManager(db_path, background_refresh=False, report_stream=open(os.devnull, "w"))
+        self.addCleanup(manager.report_stream.close)
+        self.addCleanup(manager.close)
+        return manager
+
+    def assert_matches_lookup(self, manager, codes, scan_times):
+        frame = ScanReplayEngine(manager).replay(codes, scan_times)
+        for row, code, scan_time in zip(frame.itertuples(index=False), codes, scan_times):
+            with self.subTest(code=code, scan_time=scan_time):
+                if isinstance(scan_time, str):
+                    scan_time = datetime.datetime.fromisoformat(scan_time)
+                results = manager.find_current_locations(code, scan_time)
+                if results is None:
+                    self.assertTrue(pd.isna(row.当前物理位置))
+                    continue
+                locations = [result["当前物理位置"] for result in results] + [None]
+                self.assertEqual(row.最终代码, results[0]["最终代码"])
+                self.assertEqual(row.当前物理位置, locations[0])
+                self.assertEqual(None if pd.isna(row.当前物理位置2) else row.当前物理位置2, locations[1])
+
+    def test_aware_times_match_lookup(self):
+        db_path = os.path.join(self.tmp_dir.name, "synthetic.db")
+        create_synthetic_db(db_path, 300)
+        manager = self.manager(db_path)
+        codes = list(manager.load_rules_from_database())[:60] + ["不存在"]
+        times = sample_times(len(codes))
+        zones = [datetime.timezone(datetime.timedelta(hours=8)), datetime.timezone.utc,
+                 datetime.timezone(datetime.timedelta(hours=-5))]
+
+        with self.subTest(case="同一时区"):
+            self.assert_matches_lookup(manager, codes, [t.replace(tzinfo=zones[0]) for t in times])
+        with self.subTest(case="混合时区"):
+            self.assert_matches_lookup(manager, codes, [t.replace(tzinfo=zones[i % 3]) for i, t in enumerate(times)])
+        with self.subTest(case="ISO 字符串"):
+            self.assert_matches_lookup(manager, codes, [t.replace(tzinfo=zones[0]).isoformat() for t in times])
+
+    def test_morning_slot_with_offset(self):
+        db_path = os.path.join(self.tmp_dir.name, "rules.db")
+        shutil.copy(DB_PATH, db_path)
+        manager = self.manager(db_path)
+        codes = list(manager.load_rules_from_database())
+        self.assert_matches_lookup(manager, codes, ["2024-01-01T06:00+08:00"] * len(codes))
+
+    def test_no_location_rules(self):
+        db_path = os.path.join(self.tmp_dir.name, "synthetic.db")
+        create_synthetic_db(db_path, 20)
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("UPDATE warehouse_management SET 物理位置1 = NULL, 物理位置2 = NULL, "
+                         "位置1适用时间 = NULL, 位置2适用时间 = NULL")
+        conn.close()
+        manager = self.manager(db_path)
+        codes = list(manager.load_rules_from_database())[:5]
+        frame = ScanReplayEngine(manager).replay(codes, sample_times(len(codes)))
+        self.assertEqual(list(frame["当前物理位置"]), [UNKNOWN_LOCATION] * len(codes))
+
+
+if __name__ == "__main__":
+    unittest.main()
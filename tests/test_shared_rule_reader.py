@@ -0,0 +1,74 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from PublicManagerClass import SharedRuleTable
+from PublicManagerClass.SharedRuleTable import SharedRulePublisher, SharedRuleReader
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "announcements.db")
+
+
+class SharedRuleReaderTest(unittest.TestCase):
+    """切换到新版本规则表后，仍在使用的旧规则表在查询结束前不被关闭；要附加的段已被删除时改为附加最新的段"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "rules.db")
+        shutil.copy(DB_PATH, self.db_path)
+        self.manager = WarehouseRuleManager(self.db_path, reload_check_interval=0, background_refresh=False,
+                                            report_stream=open(os.devnull, "w"))
+        self.code = next(iter(self.manager.load_rules_from_database()))
+        self.publisher = SharedRulePublisher(self.manager, f"sf_test_{os.getpid()}")
+        self.reader = SharedRuleReader(self.publisher.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.publisher.close(unlink_control=True)
+        self.manager.report_stream.close()
+        self.manager.close()
+        self.tmp_dir.cleanup()
+
+    def publish_change(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE warehouse_management SET 流向 = 流向 || '*' WHERE 代码 = ?", (self.code,))
+        conn.close()
+        self.assertTrue(self.manager.reload_if_changed(force_check=True))
+
+    def test_table_in_use_survives_swaps(self):
+        now = datetime.datetime.now()
+        with self.reader.use_table() as table:
+            expected = table.find_current_locations(self.code, now)
+            for _ in range(3):
+                self.publish_change()
+                self.reader.find_current_locations(self.code, now)
+            self.assertIsNot(self.reader.current_table(), table)
+            self.assertEqual(table.find_current_locations(self.code, now), expected)
+        self.assertEqual(self.reader._retired, [])
+        self.assertEqual(self.reader._readers, {})
+
+    def test_first_attach_races_publisher(self):
+        # 读取控制段之后、附加之前发布方又发布了两次，读到的段已被删除
+        attach = SharedRuleTable._attach
+        raced = []
+
+        def attach_after_publish(name):
+            if not raced:
+                raced.append(name)
+                self.publish_change()
+                self.publish_change()
+            return attach(name)
+
+        with mock.patch.object(SharedRuleTable, "_attach", attach_after_publish):
+            table = self.reader.current_table()
+        self.assertIsNotNone(table)
+        self.assertEqual(table.rule_version, self.manager.rule_version)
+        self.assertNotEqual(self.reader._segment_name, raced[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from PublicManagerClass.TableExporter import TableExporter, pa, pq
+
+
+@unittest.skipIf(pa is None, "未安装 pyarrow")
+class ParquetMixedTypesTest(unittest.TestCase):
+    """整数、浮点列中混有文本时 Parquet 导出不会在中途失败"""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE t (代码 TEXT, 数量 INTEGER, 比例 REAL)")
+        rows = [(f"c{i}", i, i / 2) for i in range(12)]
+        rows[10] = ("x", "abc", 1)
+        self.conn.executemany("INSERT INTO t VALUES (?, ?, ?)", rows)
+        self.exporter = TableExporter("parquet", batch_size=5)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_mixed_column_is_exported_as_text(self):
+        column_types = self.exporter.column_types(self.conn, "t")
+        self.assertEqual(column_types, {"代码": "TEXT", "数量": "TEXT", "比例": "REAL"})
+
+        buffer = io.BytesIO()
+        self.assertEqual(self.exporter.export(self.conn.execute("SELECT * FROM t"), buffer, column_types), 12)
+        table = pq.read_table(buffer)
+        self.assertEqual(table.schema.field("数量").type, pa.string())
+        self.assertEqual(table.schema.field("比例").type, pa.float64())
+        self.assertEqual(table.column("数量").to_pylist()[9:11], ["9", "abc"])
+
+    def test_unexpected_value_leaves_no_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            target = os.path.join(tmp_dir, "t.parquet")
+            with self.assertRaises(ValueError):
+                self.exporter.export(self.conn.execute("SELECT * FROM t"), target, {"数量": "INTEGER"})
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import datetime
+import os
+import unittest
+
+from benchmarks.synthetic_db import sample_times, synthetic_rules
+from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager, compile_time_rule, minute_of_week
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "announcements.db")
+EDGE_RULES = ("all", "7:0600or1-7:1230", "1-7:0000", "1-7:2359", "3:1200and1-5:0800", "5-2:0600", "0-9:1000",
+              "2:1200or", "2:abc", "1-7:06:00")
+
+
+class CompileTimeRuleTest(unittest.TestCase):
+    """预编译的周内分钟位图与逐次解析规则字符串（parse_time_rule）的判定结果一致"""
+
+    def assert_matches_parse(self, rules, times):
+        for rule in rules:
+            mask = compile_time_rule(rule)
+            with self.subTest(rule=rule):
+                self.assertEqual([(mask >> minute_of_week(t)) & 1 == 1 for t in times],
+                                 [WarehouseRuleManager.parse_time_rule(rule, t) for t in times])
+
+    def test_real_rules(self):
+        manager = WarehouseRuleManager(DB_PATH, background_refresh=False, report_stream=open(os.devnull, "w"))
+        self.addCleanup(manager.report_stream.close)
+        self.addCleanup(manager.close)
+        rules = {loc_rule["rule"] for rule_info in manager.load_rules_from_database().values()
+                 for loc_rule in rule_info["location_rules"]}
+        self.assert_matches_parse(sorted(rules), sample_times(500))
+
+    def test_synthetic_and_edge_rules(self):
+        # 每天的 00:00、规则截止分钟前后以及 23:59
+        start = datetime.datetime(2024, 1, 1)
+        boundaries = [start + datetime.timedelta(days=day, minutes=minute) for day in range(7)
+                      for minute in (0, 359, 360, 361, 479, 480, 720, 749, 750, 751, 1439)]
+        self.assert_matches_parse(sorted(set(synthetic_rules(500))) + list(EDGE_RULES), boundaries + sample_times(50))
+
+
+if __name__ == "__main__":
+    unittest.main()
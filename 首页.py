@@ -1,10 +1,20 @@
 # app.py - 主应用文件
 import streamlit as st
 from PublicManagerClass.AnnouncementManager import AnnouncementManager
-from PublicManagerClass.WarehouseRuleManager import WarehouseRuleManager
+from PublicManagerClass.FlowSearchIndex import FlowSearchIndex
+from PublicManagerClass.SharedRuleEngine import get_rule_manager
 from datetime import datetime
 import time
 
+try:
+    from st_keyup import st_keyup  # 输入时即返回内容的文本框（streamlit-keyup）
+except ImportError:  # 未安装时退回普通输入框，回车后显示输入提示
+    st_keyup = None
+
+# 输入提示：停止输入多久后刷新候选（毫秒），以及最多显示的候选数
+SUGGESTION_DEBOUNCE_MS = 300
+SUGGESTION_LIMIT = 8
+
 # 设置主应用配置
 st.set_page_config(
     page_title="映射码辅助记忆系统首页",
@@ -125,8 +135,6 @@ if 'active_announcements' not in st.session_state:
     st.session_state.active_announcements = []
 if 'last_rotate_time' not in st.session_state:
     st.session_state.last_rotate_time = time.time()
-if 'warehouse_rules' not in st.session_state:
-    st.session_state.warehouse_rules = None
 if 'search_query' not in st.session_state:
     st.session_state.search_query = ""
 if 'search_results' not in st.session_state:
@@ -136,8 +144,8 @@ if 'selected_code' not in st.session_state:
 if 'show_search_results' not in st.session_state:
     st.session_state.show_search_results = True  # 默认显示搜索结果
 
-# 创建仓库规则管理器
-rule_manager = WarehouseRuleManager()
+# 获取进程内共享的仓库规则管理器（所有会话和每次重跑共用同一份规则缓存）
+rule_manager = get_rule_manager()
 
 
 # 获取活跃公告
@@ -257,38 +265,59 @@ def announcement_carousel():
                     st.rerun()
 
 
+# 搜索输入框与输入提示：作为片段运行，输入时只重跑本片段，不重跑整个页面
+@st.fragment
+def search_input_fragment():
+    label = "请输入流向代码、流向名称或映射码进行搜索:"
+    placeholder = "例如: 574W, 鄞州, W"
+    if st_keyup is not None:
+        search_query = st_keyup(label, value=st.session_state.search_query, key="search_input",
+                                placeholder=placeholder, debounce=SUGGESTION_DEBOUNCE_MS)
+    else:
+        search_query = st.text_input(label, value=st.session_state.search_query, key="search_input",
+                                     placeholder=placeholder)
+        # 没有 streamlit-keyup 时文本框只在回车或失去焦点后返回内容，提示用户输入提示何时出现
+        st.caption("输入后按回车显示输入提示（安装 streamlit-keyup 后可边输入边提示）")
+    search_query = search_query or ""
+
+    # 前缀补全候选，点击直接查看详情
+    suggestions = rule_manager.complete_flows(search_query, SUGGESTION_LIMIT) if search_query.strip() else []
+    if suggestions:
+        with st.container(border=True):
+            st.caption("输入提示")
+            for suggestion in suggestions:
+                if st.button(f"{suggestion['code']} - {suggestion['name']}（{suggestion['type']}）",
+                             key=f"suggest_{suggestion['code']}", use_container_width=True):
+                    st.session_state.search_query = search_query
+                    st.session_state.selected_code = suggestion['code']
+                    st.session_state.show_search_results = False
+                    st.rerun()
+
+    # 搜索按钮
+    if st.button("搜索", key="search_button"):
+        st.session_state.search_query = search_query
+        st.session_state.show_search_results = True
+        st.session_state.selected_code = None
+        st.session_state.search_results = []  # 清空之前的搜索结果
+
+        # 如果有查询内容，执行搜索
+        if search_query:
+            with st.spinner("正在搜索..."):
+                try:
+                    st.session_state.search_results = rule_manager.search_flows(search_query)
+                except Exception as e:
+                    st.error(f"搜索失败: {str(e)}")
+                    return
+        # 搜索结果显示在片段之外，需要重跑整个页面
+        st.rerun()
+
+
 # 流向搜索组件
 def flow_search_component():
     st.markdown('<div class="search-container">', unsafe_allow_html=True)
     st.markdown('<div class="search-title">🔍 流向代码查询</div>', unsafe_allow_html=True)
 
-    # 使用表单封装搜索功能
-    with st.form(key="search_form"):
-        # 搜索框
-        search_query = st.text_input(
-            "请输入流向代码、流向名称或映射码进行搜索:",
-            value=st.session_state.search_query,
-            key="search_input",
-            placeholder="例如: 574W, 鄞州, W"
-        )
-
-        # 搜索按钮
-        submitted = st.form_submit_button("搜索")
-        if submitted:
-            st.session_state.search_query = search_query
-            st.session_state.show_search_results = True
-            st.session_state.selected_code = None
-            st.session_state.search_results = []  # 清空之前的搜索结果
-
-            # 如果有查询内容，执行搜索
-            if search_query:
-                with st.spinner("正在搜索..."):
-                    try:
-                        st.session_state.search_results = rule_manager.search_flows(search_query)
-                    except Exception as e:
-                        st.error(f"搜索失败: {str(e)}")
-            else:
-                st.session_state.search_results = []
+    search_input_fragment()
 
     # 显示搜索提示
     if not st.session_state.search_query:
@@ -299,6 +328,17 @@ def flow_search_component():
         # 如果没有搜索结果
         if not st.session_state.search_results and st.session_state.search_query:
             st.warning(f"没有找到与 '{st.session_state.search_query}' 相关的流向")
+
+            # 近似匹配：输入可能有一个字符错误
+            similar_flows = rule_manager.did_you_mean(st.session_state.search_query)
+            if similar_flows:
+                st.markdown("**您是不是要找:**")
+                for match in similar_flows:
+                    if st.button(f"{match['code']} - {match['name']}（映射: {match['mapping']}）",
+                                 key=f"similar_{match['code']}"):
+                        st.session_state.selected_code = match['code']
+                        st.session_state.show_search_results = False
+                        st.rerun()
             st.markdown("""
             <div style="margin-top: 20px; padding: 15px; background-color: #fff8e1; border-radius: 8px;">
                 <h4>搜索建议:</h4>
@@ -313,15 +353,21 @@ def flow_search_component():
         # 如果有搜索结果
         elif st.session_state.search_results:
             st.success(f"找到 {len(st.session_state.search_results)} 条匹配结果")
+            if len(st.session_state.search_results) >= FlowSearchIndex.SEARCH_LIMIT:
+                st.caption(f"仅显示前 {FlowSearchIndex.SEARCH_LIMIT} 条，输入更多字符可缩小范围")
 
             # 使用列布局展示搜索结果卡片
             cols = st.columns(1)  # 单列布局
             for i, result in enumerate(st.session_state.search_results):
                 with cols[0]:  # 始终使用第一列
                     # 高亮匹配部分
-                    highlighted_code = rule_manager.highlight_match(result['code'], st.session_state.search_query)
-                    highlighted_name = rule_manager.highlight_match(result['name'], st.session_state.search_query)
-                    highlighted_mapping = rule_manager.highlight_match(result['mapping'], st.session_state.search_query)
+                    highlights = result.get('highlights', {})
+                    highlighted_code = rule_manager.highlight_match(
+                        result['code'], st.session_state.search_query, highlights.get('code'))
+                    highlighted_name = rule_manager.highlight_match(
+                        result['name'], st.session_state.search_query, highlights.get('name'))
+                    highlighted_mapping = rule_manager.highlight_match(
+                        result['mapping'], st.session_state.search_query, highlights.get('mapping'))
 
                     # 创建卡片
                     with st.expander(f"{result['code']} - {result['name']}"):
@@ -370,6 +416,13 @@ def flow_search_component():
                             if result['是否挂靠']:
                                 location_info += " (挂靠)"
                             st.markdown(f"{i}. {location_info}")
+
+                        # 显示当前位置保持到什么时候
+                        next_change = rule_manager.next_location_change(st.session_state.selected_code, now)
+                        if next_change is not None:
+                            st.caption(f"以上位置有效至 {next_change:%m-%d %H:%M}（周{'一二三四五六日'[next_change.weekday()]}）")
+                        else:
+                            st.caption("以上位置全周不变")
                 else:
                     st.error(f"错误: 未找到流向代码 '{st.session_state.selected_code}' 的配置信息。")
             except Exception as e:
@@ -434,12 +487,11 @@ def show_home_page():
 
 # 主逻辑
 def main():
-    # 预加载规则数据
-    if st.session_state.warehouse_rules is None:
+    # 预加载规则数据（共享管理器只在进程内第一次访问时加载）
+    if rule_manager.snapshot is None:
         with st.spinner("正在加载流向规则数据..."):
             try:
                 rule_manager.load_rules_from_database()
-                st.session_state.warehouse_rules = rule_manager.warehouse_rules
                 st.success("流向规则数据加载完成")
             except Exception as e:
                 st.error(f"加载流向规则数据时出错: {e}")